@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+#
+# Copyright 2014 Kevin L. Mitchell
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Measure the compression ratio and throughput of the tar compressions
+supported by ``fstree``.  An uncompressed tar file of a directory
+(the Python standard library, by default) is built in memory, then
+compressed and decompressed through ``compress.writer()`` and
+``compress.reader()`` at several levels and thread counts.  Run from
+the top of the source tree with
+``PYTHONPATH=. python benchmarks/codecs.py``.
+"""
+
+import argparse
+import io
+import os
+import tarfile
+import time
+
+from fstree import compress
+from fstree import tarname
+
+
+# The levels measured for each compression: fastest, default, and
+# best
+LEVELS = {
+    'gz': (1, 6, 9),
+    'bz2': (1, 9),
+    'xz': (0, 6, 9),
+    'zst': (1, 3, 10, 19),
+}
+
+
+def corpus(path, max_size):
+    out = io.BytesIO()
+    with tarfile.open(fileobj=out, mode='w|') as tar:
+        for dirpath, dirnames, filenames in os.walk(path):
+            dirnames.sort()
+            for fname in sorted(filenames):
+                if out.tell() >= max_size:
+                    return out.getvalue()
+                full = os.path.join(dirpath, fname)
+                try:
+                    tar.add(full, os.path.relpath(full, path))
+                except (IOError, OSError):
+                    pass
+    return out.getvalue()
+
+
+def timed(func, repeat):
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+def compress_data(data, compression, level, workers):
+    out = io.BytesIO()
+    fileobj = compress.writer(out, compression, level, workers)
+    fileobj.write(data)
+    fileobj.close()
+    return out.getvalue()
+
+
+def decompress_data(data, compression):
+    with compress.reader(io.BytesIO(data), compression) as fileobj:
+        return fileobj.read()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--max-size', '-m', type=int,
+                        default=64 * 1024 * 1024,
+                        help='maximum size of the tar file, in bytes')
+    parser.add_argument('--repeat', '-r', type=int, default=3,
+                        help='number of timed runs; the best is reported')
+    parser.add_argument('--workers', '-w', type=int, action='append',
+                        help='thread counts to measure; may be repeated')
+    parser.add_argument('path', nargs='?',
+                        default=os.path.dirname(os.__file__),
+                        help='directory to archive')
+    args = parser.parse_args()
+
+    data = corpus(args.path, args.max_size)
+    mib = len(data) / (1024.0 * 1024.0)
+    print('corpus: %s (%.1f MiB)' % (args.path, mib))
+    print('%-5s %5s %7s %8s %10s %10s' % ('codec', 'level', 'workers',
+                                          'ratio', 'comp MiB/s',
+                                          'dec MiB/s'))
+
+    for name in sorted(LEVELS):
+        comp = tarname.Compression.lookup_compression(name)
+        if comp is None or not comp.supported:
+            print('%-5s unsupported' % name)
+            continue
+
+        for level in LEVELS[name]:
+            for workers in args.workers or [1, os.cpu_count() or 1]:
+                compressed, comp_time = timed(
+                    lambda: compress_data(data, name, level, workers),
+                    args.repeat)
+                result, dec_time = timed(
+                    lambda: decompress_data(compressed, name), args.repeat)
+                assert result == data
+                print('%-5s %5d %7d %8.2f %10.1f %10.1f' %
+                      (name, level, workers,
+                       len(data) / float(len(compressed)),
+                       mib / comp_time, mib / dec_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+#
+# Copyright 2014 Kevin L. Mitchell
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Measure the throughput of file digests.  The ``read()`` loop of
+``utils.digest()`` is compared against the ``readinto()`` and
+``mmap()`` paths of ``utils.digest_file()``, for files of several
+sizes.  The files are read once before timing, so the page cache is
+warm and the copying overhead is what's measured.  Run from the top
+of the source tree with ``PYTHONPATH=. python benchmarks/digest.py``.
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import timeit
+
+from fstree import utils
+
+
+def read_loop(path, algorithm):
+    with open(path, 'rb') as f:
+        return utils.digest(f, (utils.get_hasher(algorithm)(),))
+
+
+def readinto(path, algorithm):
+    threshold = utils.MMAP_THRESHOLD
+    utils.MMAP_THRESHOLD = float('inf')
+    try:
+        return utils.digest_file(path, (utils.get_hasher(algorithm)(),))
+    finally:
+        utils.MMAP_THRESHOLD = threshold
+
+
+def mmapped(path, algorithm):
+    threshold = utils.MMAP_THRESHOLD
+    utils.MMAP_THRESHOLD = 0
+    try:
+        return utils.digest_file(path, (utils.get_hasher(algorithm)(),))
+    finally:
+        utils.MMAP_THRESHOLD = threshold
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--algorithm', '-a', default='md5',
+                        help='hash algorithm to use')
+    parser.add_argument('--repeat', '-r', type=int, default=5,
+                        help='number of timed runs; the best is reported')
+    parser.add_argument('sizes', nargs='*', type=int,
+                        default=[16 * 1024, 1024 * 1024, 64 * 1024 * 1024,
+                                 256 * 1024 * 1024],
+                        help='file sizes to measure, in bytes')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    try:
+        print('%12s %-10s %10s %10s' % ('size', 'method', 'seconds',
+                                        'MiB/s'))
+        for size in args.sizes:
+            path = os.path.join(workdir, 'data')
+            with open(path, 'wb') as f:
+                remaining = size
+                while remaining:
+                    chunk = min(remaining, 1024 * 1024)
+                    f.write(os.urandom(chunk))
+                    remaining -= chunk
+
+            # Make sure all the methods agree and warm the page cache
+            expected = read_loop(path, args.algorithm)
+            number = max(1, (64 * 1024 * 1024) // max(size, 1))
+            for label, func in (('read', read_loop),
+                                ('readinto', readinto),
+                                ('mmap', mmapped)):
+                assert func(path, args.algorithm) == expected
+                best = min(timeit.repeat(
+                    lambda: func(path, args.algorithm),
+                    repeat=args.repeat, number=number)) / number
+                print('%12d %-10s %10.6f %10.1f' %
+                      (size, label, best, size / best / (1024 * 1024)))
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
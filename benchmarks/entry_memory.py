@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+#
+# Copyright 2014 Kevin L. Mitchell
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Measure the memory consumed by ``FSEntry`` instances, in bytes per
+entry.  The slotted ``FSEntry`` is compared against an equivalent
+class carrying an instance ``__dict__``, populated the way entries
+were before ``FSEntry`` grew ``__slots__``.  Run from the top of the
+source tree with ``PYTHONPATH=. python benchmarks/entry_memory.py``.
+"""
+
+import argparse
+import gc
+import os
+import tempfile
+import tracemalloc
+
+from fstree import entry
+
+
+class DictEntry(entry.FSEntry):
+    """
+    An ``FSEntry`` with an instance ``__dict__``, for comparison.
+    """
+
+    def populate(self):
+        # The layout before __slots__: every name-derived field was
+        # cached as an attribute, with its own cache control entry
+        self._basename = os.path.basename(self.name)
+        self._dirname = os.path.dirname(self.name)
+        self._ext = os.path.splitext(self._basename)[1]
+        self._root = os.path.splitext(self._basename)[0]
+        self.__cache_control__ = dict(
+            (prop, {}) for prop in ('basename', 'dirname', 'ext', 'root'))
+
+
+def measure(tree, cls, count):
+    names = ['/dir%d/file%d.txt' % (i % 100, i) for i in range(count)]
+    paths = [tree._full(name) for name in names]
+    entries = [None] * count
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+
+    for i, (name, path) in enumerate(zip(names, paths)):
+        ent = cls(tree, name, path)
+        if isinstance(ent, DictEntry):
+            ent.populate()
+        entries[i] = ent
+
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    return (after - before) / float(count)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--count', '-c', type=int, default=100000,
+                        help='number of entries to create')
+    args = parser.parse_args()
+
+    tree = entry.FSTree(tempfile.mkdtemp())
+    try:
+        for label, cls in (('FSEntry (__slots__)', entry.FSEntry),
+                           ('FSEntry (__dict__)', DictEntry)):
+            print('%-22s %8.1f bytes/entry' %
+                  (label, measure(tree, cls, args.count)))
+    finally:
+        tree.cleanup()
+
+
+if __name__ == '__main__':
+    main()
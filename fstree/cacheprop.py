@@ -27,6 +27,11 @@ class CacheProperty(object):
     then cached for later usage.  Cache control data is stored to
     allow the cached value to be invalidated if given attributes or
     properties of the object are updated.
+
+    If the object has a ``__cache_trusted__`` attribute with a
+    ``True`` value, cached values are used without validation; the
+    object is then responsible for calling ``invalidate()`` when its
+    cached values become stale.
     """
 
     def __init__(self, func, attrs, base):
@@ -71,6 +76,12 @@ class CacheProperty(object):
         # Get the value
         value = getattr(obj, self.cache_attr, utils.unset)
 
+        # If the object vouches for its cached values, there's no
+        # need to validate them
+        if (value is not utils.unset and self.prop in cache_ctrl and
+                getattr(obj, '__cache_trusted__', False)):
+            return value
+
         # Get the expected value of the cache
         base = self.base(obj)
         expected_ctrl = dict((attr, getter(base))
@@ -122,3 +133,25 @@ def cached_property(*args, **kwargs):
     if func is None:
         return decorator
     return decorator(func)
+
+
+def invalidate(obj, *props):
+    """
+    Invalidate the cached values of cached properties, forcing them to
+    be recomputed on next access.
+
+    :param obj: The object whose cached values should be invalidated.
+    :param props: The names of the properties to invalidate.  If none
+                  are given, all cached properties of the object are
+                  invalidated.
+    """
+
+    cache_ctrl = getattr(obj, '__cache_control__', None)
+    if not cache_ctrl:
+        return
+
+    if not props:
+        cache_ctrl.clear()
+    else:
+        for prop in props:
+            cache_ctrl.pop(prop, None)
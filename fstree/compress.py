@@ -0,0 +1,403 @@
+# Copyright 2014 Kevin L. Mitchell
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import bz2
+from concurrent import futures
+import collections
+import gzip
+
+try:
+    import lzma
+except ImportError:  # pragma: no cover
+    lzma = None
+
+try:
+    from compression import zstd
+except ImportError:  # pragma: no cover
+    zstd = None
+
+
+# The default size of the blocks compressed independently by a
+# ParallelWriter
+BLOCKSIZE = 1024 * 1024
+
+
+def _gzip_block(data, level):
+    """
+    Compress a block as a complete gzip member.  Concatenated members
+    form a valid gzip stream.
+
+    :param data: The bytes to compress.
+    :param level: The compression level, or ``None`` for the default.
+
+    :returns: The compressed member.
+    """
+
+    # A zero modification time keeps the output reproducible
+    return gzip.compress(data, 9 if level is None else level, mtime=0)
+
+
+def _bz2_block(data, level):
+    """
+    Compress a block as a complete bzip2 stream.  Concatenated streams
+    are accepted by ``bunzip2`` and the ``bz2`` module.
+
+    :param data: The bytes to compress.
+    :param level: The compression level, or ``None`` for the default.
+
+    :returns: The compressed stream.
+    """
+
+    return bz2.compress(data, 9 if level is None else level)
+
+
+def _xz_block(data, level):
+    """
+    Compress a block as a complete xz stream.  Concatenated streams
+    are accepted by ``xz`` and the ``lzma`` module.
+
+    :param data: The bytes to compress.
+    :param level: The compression preset, or ``None`` for the default.
+
+    :returns: The compressed stream.
+    """
+
+    return lzma.compress(data, preset=level)
+
+
+def _zstd_block(data, level):
+    """
+    Compress a block as a complete zstd frame.  Concatenated frames
+    are accepted by ``zstd`` and the ``compression.zstd`` module.
+
+    :param data: The bytes to compress.
+    :param level: The compression level, or ``None`` for the default.
+
+    :returns: The compressed frame.
+    """
+
+    return zstd.compress(data, level)
+
+
+# The compressions which may be produced in independent blocks
+_BLOCK_COMPRESSORS = {
+    'gz': _gzip_block,
+    'bz2': _bz2_block,
+}
+if lzma is not None:
+    _BLOCK_COMPRESSORS['xz'] = _xz_block
+if zstd is not None:
+    _BLOCK_COMPRESSORS['zst'] = _zstd_block
+
+# The compressions which tarfile can handle itself
+_TARFILE_COMPRESSIONS = set(['gz', 'bz2', 'xz'])
+
+# The magic numbers at the start of compressed files, from the file
+# format specifications
+MAGIC = (
+    (b'\x1f\x8b', 'gz'),
+    (b'BZh', 'bz2'),
+    (b'\xfd7zXZ\x00', 'xz'),
+    (b'\x28\xb5\x2f\xfd', 'zst'),
+    (b'\x1f\x9d', 'Z'),
+    (b'LZIP', 'lz'),
+    (b'\x89LZO\x00\r\n\x1a\n', 'lzo'),
+)
+
+# The number of bytes needed to recognize any of the magic numbers
+MAGIC_SIZE = max(len(magic) for magic, name in MAGIC)
+
+
+class ParallelWriter(object):
+    """
+    A write-only file object which compresses the data written to it
+    in fixed-size blocks on a thread pool, in the style of ``pigz``.
+    Each block is compressed as a complete gzip member (or bzip2 or xz
+    stream), and the members are written in order, so the result is
+    a standard multi-member file readable by the usual tools.  The
+    compression libraries release the GIL, so the blocks are
+    compressed on several cores at once.
+
+    Decompression may be started afresh at the beginning of any
+    block, so the ``checkpoints`` attribute records the uncompressed
+    and compressed offsets of each block as it is written.
+    """
+
+    def __init__(self, fileobj, compression, level=None, workers=None,
+                 blocksize=BLOCKSIZE):
+        """
+        Initialize a ``ParallelWriter`` object.
+
+        :param fileobj: The file object to write the compressed data
+                        to.  It is not closed when the
+                        ``ParallelWriter`` is.
+        :param compression: The name of the compression: "gz", "bz2",
+                            "xz", or "zst".
+        :param level: The compression level.  If not given, the
+                      default for the compression is used.
+        :param workers: The number of threads to compress with.  If
+                        ``None`` or 1, blocks are compressed in the
+                        calling thread.
+        :param blocksize: The size of the uncompressed blocks.
+        """
+
+        self._compress = _BLOCK_COMPRESSORS.get(str(compression))
+        if self._compress is None:
+            raise ValueError("compression scheme '%s' cannot be "
+                             "compressed in parallel" % compression)
+
+        self.fileobj = fileobj
+        self.level = level
+        self.blocksize = blocksize
+        self.count = 0
+        self.closed = False
+        self.checkpoints = []
+
+        self._in = 0
+        self._out = 0
+        self._buf = bytearray()
+        self._pending = collections.deque()
+        self._workers = workers if workers and workers > 1 else 1
+        self._executor = (futures.ThreadPoolExecutor(self._workers)
+                          if self._workers > 1 else None)
+
+    def _submit(self, block):
+        """
+        Compress a block.  The number of blocks in flight is bounded,
+        so the memory used does not grow with the size of the input.
+
+        :param block: The bytes of the block.
+        """
+
+        if self._executor is None:
+            self._emit(len(block), self._compress(block, self.level))
+            return
+
+        while len(self._pending) >= 2 * self._workers:
+            self._write_next()
+        self._pending.append((len(block), self._executor.submit(
+            self._compress, block, self.level)))
+
+    def _emit(self, size, data):
+        """
+        Write a compressed block, recording its checkpoint.
+
+        :param size: The uncompressed size of the block.
+        :param data: The compressed block.
+        """
+
+        self.checkpoints.append((self._in, self._out))
+        self.fileobj.write(data)
+        self._in += size
+        self._out += len(data)
+
+    def _write_next(self):
+        """
+        Write the oldest compressed block, waiting for it if
+        necessary.
+        """
+
+        size, future = self._pending.popleft()
+        self._emit(size, future.result())
+
+    def write(self, data):
+        """
+        Write data.
+
+        :param data: The bytes to write.
+
+        :returns: The number of bytes written.
+        """
+
+        self._buf += data
+        self.count += len(data)
+
+        # Submit the full blocks
+        offset = 0
+        while len(self._buf) - offset >= self.blocksize:
+            self._submit(bytes(self._buf[offset:offset + self.blocksize]))
+            offset += self.blocksize
+        if offset:
+            del self._buf[:offset]
+
+        return len(data)
+
+    def tell(self):
+        """
+        Retrieve the number of uncompressed bytes written.
+        """
+
+        return self.count
+
+    def close(self):
+        """
+        Compress the final block and write all the compressed data.
+        The underlying file object is not closed.
+        """
+
+        if self.closed:
+            return
+        self.closed = True
+
+        try:
+            # An empty input still needs one member to be valid
+            if self._buf or not self.count:
+                self._submit(bytes(self._buf))
+                del self._buf[:]
+
+            while self._pending:
+                self._write_next()
+        finally:
+            if self._executor is not None:
+                self._executor.shutdown()
+
+
+def parallel(compression):
+    """
+    Determine whether a compression may be compressed by a
+    ``ParallelWriter``.
+
+    :param compression: The name of the compression, or a
+                        ``tarname.Compression`` instance.
+
+    :returns: A ``True`` value if ``ParallelWriter`` supports the
+              compression, ``False`` otherwise.
+    """
+
+    return str(compression) in _BLOCK_COMPRESSORS
+
+
+def detect(data):
+    """
+    Determine the compression of a file from the magic number at its
+    start.
+
+    :param data: The first bytes of the file.  At least
+                 ``MAGIC_SIZE`` bytes should be given, if the file is
+                 that long.
+
+    :returns: The name of the compression, or ``None`` if the data
+              does not start with a known magic number.
+    """
+
+    for magic, name in MAGIC:
+        if data.startswith(magic):
+            return name
+
+    return None
+
+
+def builtin(compression):
+    """
+    Determine whether ``tarfile`` can compress and decompress a
+    compression itself.
+
+    :param compression: The name of the compression, or a
+                        ``tarname.Compression`` instance.
+
+    :returns: A ``True`` value if ``tarfile`` supports the
+              compression, ``False`` otherwise.
+    """
+
+    return str(compression) in _TARFILE_COMPRESSIONS
+
+
+def _zstd_options(level, workers):
+    """
+    Construct the compression parameters for zstd.
+
+    :param level: The compression level, or ``None`` for the default.
+    :param workers: The number of threads to compress with, or
+                    ``None``.
+
+    :returns: A dictionary of compression parameters, or ``None`` if
+              there are none.
+    """
+
+    options = {}
+    if level is not None:
+        options[zstd.CompressionParameter.compression_level] = level
+    if workers and workers > 1:
+        # zstd compresses in parallel itself
+        options[zstd.CompressionParameter.nb_workers] = workers
+
+    return options or None
+
+
+def writer(fileobj, compression, level=None, workers=None):
+    """
+    Construct a compressing file object.
+
+    :param fileobj: The file object to write the compressed data to.
+                    It is not closed when the returned file object is.
+    :param compression: The name of the compression.
+    :param level: The compression level.  If not given, the default
+                  for the compression is used.
+    :param workers: If given and greater than 1, the number of threads
+                    to compress with.  A ``ParallelWriter`` is used,
+                    except for zstd, which has its own threads.
+
+    :returns: A writable file object.  A ``ValueError`` is raised if
+              the compression is unknown, or cannot be written.
+    """
+
+    compression = str(compression)
+    if compression == 'zst' and zstd is not None:
+        return zstd.ZstdFile(fileobj, 'wb',
+                             options=_zstd_options(level, workers))
+    elif workers and workers > 1:
+        return ParallelWriter(fileobj, compression, level, workers)
+    elif compression == 'gz':
+        return gzip.GzipFile(fileobj=fileobj, mode='wb', mtime=0,
+                             compresslevel=9 if level is None else level)
+    elif compression == 'bz2':
+        return bz2.BZ2File(fileobj, 'wb',
+                           compresslevel=9 if level is None else level)
+    elif compression == 'xz' and lzma is not None:
+        return lzma.LZMAFile(fileobj, 'wb', preset=level)
+    elif compression not in set(name for _magic, name in MAGIC):
+        raise ValueError("unsupported compression %r" % compression)
+
+    raise ValueError("compression scheme '%s' does not support levels" %
+                     compression)
+
+
+def reader(fileobj, compression):
+    """
+    Construct a decompressing file object.  Multi-member files, such
+    as those produced by ``ParallelWriter``, are read in full.
+
+    :param fileobj: The file object to read the compressed data from.
+                    It is not closed when the returned file object is.
+                    May also be a file name, in which case the file
+                    is closed with the returned file object.
+    :param compression: The name of the compression.
+
+    :returns: A readable file object.
+    """
+
+    compression = str(compression)
+    if compression == 'gz':
+        if not hasattr(fileobj, 'read'):
+            return gzip.GzipFile(fileobj, 'rb')
+        return gzip.GzipFile(fileobj=fileobj, mode='rb')
+    elif compression == 'bz2':
+        return bz2.BZ2File(fileobj, 'rb')
+    elif compression == 'xz' and lzma is not None:
+        return lzma.LZMAFile(fileobj, 'rb')
+    elif compression == 'zst' and zstd is not None:
+        return zstd.ZstdFile(fileobj, 'rb')
+
+    raise ValueError("compression scheme '%s' is unsupported" % compression)
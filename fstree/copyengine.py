@@ -0,0 +1,429 @@
+# Copyright 2014 Kevin L. Mitchell
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from concurrent import futures
+import errno
+import os
+import shutil
+import stat
+import sys
+import threading
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+from fstree import dirscan
+from fstree import utils
+
+
+# The copy methods, in order of preference
+CLONE = 'clone'
+COPY_FILE_RANGE = 'copy_file_range'
+SENDFILE = 'sendfile'
+BUFFERED = 'buffered'
+METHODS = (CLONE, COPY_FILE_RANGE, SENDFILE, BUFFERED)
+
+# Reported for symbolic links which are copied as links
+SYMLINK = 'symlink'
+
+# The FICLONE ioctl, from <linux/fs.h>
+FICLONE = getattr(fcntl, 'FICLONE', 0x40049409)
+
+# The error numbers indicating that a copy method can't be used for a
+# given pair of files
+_UNSUPPORTED = set(getattr(errno, name) for name in (
+    'EBADF', 'EINVAL', 'ENOSYS', 'ENOTSUP', 'EOPNOTSUPP', 'ETXTBSY',
+    'EXDEV',
+) if hasattr(errno, name))
+
+# Raised when the source and destination are the same file
+_SameFileError = getattr(shutil, 'SameFileError', shutil.Error)
+
+
+def _clone(src_fd, dst_fd, size):
+    """
+    Copy a file by sharing its extents with a reflink, on file
+    systems which support it.
+
+    :param src_fd: The file descriptor of the source file.
+    :param dst_fd: The file descriptor of the destination file.
+    :param size: The size of the source file.
+    """
+
+    fcntl.ioctl(dst_fd, FICLONE, src_fd)
+
+
+def _copy_file_range(src_fd, dst_fd, size):
+    """
+    Copy a file within the kernel using ``copy_file_range()``.
+
+    :param src_fd: The file descriptor of the source file.
+    :param dst_fd: The file descriptor of the destination file.
+    :param size: The size of the source file.
+    """
+
+    while os.copy_file_range(src_fd, dst_fd, max(size, utils.BLOCKSIZE)):
+        pass
+
+
+def _sendfile(src_fd, dst_fd, size):
+    """
+    Copy a file within the kernel using ``sendfile()``.
+
+    :param src_fd: The file descriptor of the source file.
+    :param dst_fd: The file descriptor of the destination file.
+    :param size: The size of the source file.
+    """
+
+    offset = 0
+    while True:
+        count = os.sendfile(dst_fd, src_fd, offset,
+                            max(size - offset, utils.BLOCKSIZE))
+        if not count:
+            break
+        offset += count
+
+
+def _buffered(src_fd, dst_fd, size):
+    """
+    Copy a file through a buffer in user space.
+
+    :param src_fd: The file descriptor of the source file.
+    :param dst_fd: The file descriptor of the destination file.
+    :param size: The size of the source file.
+    """
+
+    buf = bytearray(utils.blocksize(size))
+    view = memoryview(buf)
+    with os.fdopen(os.dup(src_fd), 'rb', 0) as src:
+        while True:
+            count = src.readinto(buf)
+            if not count:
+                break
+
+            # Writes may be short
+            offset = 0
+            while offset < count:
+                offset += os.write(dst_fd, view[offset:count])
+
+
+# Map the copy methods to their implementations
+_IMPLEMENTATIONS = {
+    CLONE: _clone,
+    COPY_FILE_RANGE: _copy_file_range,
+    SENDFILE: _sendfile,
+    BUFFERED: _buffered,
+}
+
+
+def available():
+    """
+    Determine which copy methods may be used on this platform.
+
+    :returns: A tuple of the available copy methods, in order of
+              preference.
+    """
+
+    result = []
+    if fcntl is not None and sys.platform.startswith('linux'):
+        result.append(CLONE)
+    if hasattr(os, 'copy_file_range'):
+        result.append(COPY_FILE_RANGE)
+    if hasattr(os, 'sendfile') and sys.platform.startswith('linux'):
+        result.append(SENDFILE)
+    result.append(BUFFERED)
+
+    return tuple(result)
+
+
+class CopyEngine(object):
+    """
+    Copy files using the fastest method supported by the source and
+    destination: a reflink, which shares the data of the source; then
+    ``copy_file_range()`` or ``sendfile()``, which copy the data
+    within the kernel; and finally a buffered copy.  A method which
+    fails as unsupported between two file systems is not tried again
+    between those file systems.
+    """
+
+    def __init__(self, methods=None, callback=None):
+        """
+        Initialize a ``CopyEngine`` object.
+
+        :param methods: An optional sequence of the copy methods to
+                        try, in order.  Defaults to all the methods
+                        which are available.  Methods which are not
+                        available are skipped.  The buffered method
+                        is always tried last.
+        :param callback: An optional callable, which will be called
+                         with the source path, the destination path,
+                         and the method used to copy each file.  It
+                         may be called from several threads at once.
+        """
+
+        avail = available()
+        if methods is None:
+            methods = avail
+        self.methods = tuple(m for m in methods
+                             if m in avail and m != BUFFERED) + (BUFFERED,)
+        self.callback = callback
+
+        # Count the files copied by each method
+        self.stats = dict((m, 0) for m in METHODS + (SYMLINK,))
+
+        # The methods which failed between pairs of devices
+        self._unsupported = set()
+        self._lock = threading.Lock()
+
+    def _report(self, src, dst, method):
+        """
+        Record the method used to copy a file.
+
+        :param src: The source path.
+        :param dst: The destination path.
+        :param method: The copy method used.
+
+        :returns: The copy method.
+        """
+
+        with self._lock:
+            self.stats[method] += 1
+        if self.callback is not None:
+            self.callback(src, dst, method)
+
+        return method
+
+    def _copy_data(self, src_fd, dst_fd):
+        """
+        Copy the data of one open file to another.
+
+        :param src_fd: The file descriptor of the source file.
+        :param dst_fd: The file descriptor of the destination file.
+
+        :returns: The copy method used.
+        """
+
+        src_st = os.fstat(src_fd)
+        devices = (src_st.st_dev, os.fstat(dst_fd).st_dev)
+
+        for method in self.methods:
+            if (method, devices) in self._unsupported:
+                continue
+
+            try:
+                _IMPLEMENTATIONS[method](src_fd, dst_fd, src_st.st_size)
+            except (IOError, OSError) as err:
+                if method == BUFFERED or err.errno not in _UNSUPPORTED:
+                    raise
+
+                # Don't try this method again for these devices, and
+                # discard anything it managed to copy
+                with self._lock:
+                    self._unsupported.add((method, devices))
+                os.ftruncate(dst_fd, 0)
+                os.lseek(src_fd, 0, os.SEEK_SET)
+                os.lseek(dst_fd, 0, os.SEEK_SET)
+                continue
+
+            return method
+
+    def copyfile(self, src, dst, follow_symlinks=True):
+        """
+        Copy the contents of a file, as ``shutil.copyfile()``.
+
+        :param src: The system path of the source file.
+        :param dst: The system path of the destination file.
+        :param follow_symlinks: If ``False`` and ``src`` is a symbolic
+                                link, a symbolic link is created
+                                rather than copying the file it
+                                points to.
+
+        :returns: The copy method used.
+        """
+
+        if not follow_symlinks and os.path.islink(src):
+            os.symlink(os.readlink(src), dst)
+            return self._report(src, dst, SYMLINK)
+
+        try:
+            same = os.path.samefile(src, dst)
+        except OSError:
+            same = False
+        if same:
+            raise _SameFileError('%r and %r are the same file' % (src, dst))
+
+        # Leave special files to shutil, which knows how to refuse
+        # them
+        if not stat.S_ISREG(os.stat(src).st_mode):
+            shutil.copyfile(src, dst)
+            return self._report(src, dst, BUFFERED)
+
+        src_fd = os.open(src, os.O_RDONLY)
+        try:
+            dst_fd = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_TRUNC,
+                             0o666)
+            try:
+                method = self._copy_data(src_fd, dst_fd)
+            finally:
+                os.close(dst_fd)
+        finally:
+            os.close(src_fd)
+
+        return self._report(src, dst, method)
+
+    def copy2(self, src, dst, follow_symlinks=True):
+        """
+        Copy a file and its metadata, as ``shutil.copy2()``.  This may
+        be passed as the ``copy_function`` of ``shutil.copytree()``
+        and ``shutil.move()``.
+
+        :param src: The system path of the source file.
+        :param dst: The system path of the destination.  If it is a
+                    directory, the basename of the source is added.
+        :param follow_symlinks: If ``False`` and ``src`` is a symbolic
+                                link, a symbolic link is created
+                                rather than copying the file it
+                                points to.
+
+        :returns: The system path of the destination file.
+        """
+
+        if os.path.isdir(dst):
+            dst = os.path.join(dst, os.path.basename(src))
+
+        method = self.copyfile(src, dst, follow_symlinks)
+        if method != SYMLINK:
+            shutil.copystat(src, dst)
+
+        return dst
+
+    def copytree(self, src, dst, symlinks=False, ignore=None, workers=None):
+        """
+        Copy a directory tree, as ``shutil.copytree()``.
+
+        :param src: The system path of the source directory.
+        :param dst: The system path of the destination, which must not
+                    exist.
+        :param symlinks: If ``True``, symbolic links in the source tree
+                         result in symbolic links in the destination
+                         tree.  Otherwise, the contents of the files
+                         pointed to by the symbolic links are copied.
+        :param ignore: An optional callable, as for
+                       ``shutil.copytree()``.
+        :param workers: If given and greater than 1, the number of
+                        threads to copy files with.  The directory
+                        skeleton is created first, then the files are
+                        copied concurrently, and finally the metadata
+                        of the directories is copied, so that their
+                        modification times are preserved.
+
+        :returns: The system path of the destination.
+        """
+
+        if not workers or workers <= 1:
+            return shutil.copytree(src, dst, symlinks=symlinks,
+                                   ignore=ignore, copy_function=self.copy2)
+
+        errors = []
+        dirs = []
+        with futures.ThreadPoolExecutor(workers) as executor:
+            pending = self._copy_skeleton(executor, src, dst, symlinks,
+                                          ignore, dirs, errors)
+
+            # Wait for the file copies
+            for fut, srcname, dstname in pending:
+                try:
+                    fut.result()
+                except (EnvironmentError, shutil.Error) as err:
+                    errors.append((srcname, dstname, str(err)))
+
+        # Copy the directory metadata, deepest first, now that nothing
+        # more will be written to them
+        for srcname, dstname in reversed(dirs):
+            try:
+                shutil.copystat(srcname, dstname)
+            except OSError as err:
+                errors.append((srcname, dstname, str(err)))
+
+        if errors:
+            raise shutil.Error(errors)
+
+        return dst
+
+    def _copy_skeleton(self, executor, src, dst, symlinks, ignore, dirs,
+                       errors):
+        """
+        A helper method for ``copytree()`` which creates the
+        directories and symbolic links of the destination, submitting
+        the file copies to an executor.
+
+        :param executor: The ``concurrent.futures.Executor`` to submit
+                         the file copies to.
+        :param src: The system path of the source directory.
+        :param dst: The system path of the destination.
+        :param symlinks: If ``True``, symbolic links are copied as
+                         symbolic links.
+        :param ignore: An optional callable, as for
+                       ``shutil.copytree()``.
+        :param dirs: A list to which tuples of the source and
+                     destination paths of each directory are appended.
+        :param errors: A list to which error tuples, as for
+                       ``shutil.Error``, are appended.
+
+        :returns: A list of tuples of a future, the source path, and
+                  the destination path, for each file copy.
+        """
+
+        def onerror(err):
+            errors.append((err.filename, None, str(err)))
+
+        pending = []
+        os.makedirs(dst)
+        dirs.append((src, dst))
+        for dirpath, subdirs, files in dirscan.walk(
+                src, onerror=onerror, followlinks=not symlinks,
+                ignore=ignore):
+            dstpath = dst + dirpath[len(src):]
+
+            for ent in subdirs[:]:
+                dstname = os.path.join(dstpath, ent.name)
+                try:
+                    if symlinks and ent.is_symlink():
+                        # Not traversed when copying symlinks
+                        subdirs.remove(ent)
+                        os.symlink(os.readlink(ent.path), dstname)
+                    else:
+                        os.mkdir(dstname)
+                        dirs.append((ent.path, dstname))
+                except OSError as err:
+                    subdirs.remove(ent)
+                    errors.append((ent.path, dstname, str(err)))
+
+            for ent in files:
+                dstname = os.path.join(dstpath, ent.name)
+                if symlinks and ent.is_symlink():
+                    try:
+                        os.symlink(os.readlink(ent.path), dstname)
+                    except OSError as err:
+                        errors.append((ent.path, dstname, str(err)))
+                    continue
+
+                pending.append((executor.submit(self.copy2, ent.path,
+                                                dstname),
+                                ent.path, dstname))
+
+        return pending
@@ -0,0 +1,373 @@
+# Copyright 2014 Kevin L. Mitchell
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import collections
+import errno
+import os
+import sqlite3
+import threading
+import time
+
+from fstree import lru
+from fstree import utils
+
+
+# A file modified this close to the time its digest is recorded may
+# be rewritten again within the same timestamp tick, leaving its size
+# and modification time unchanged; such digests are not cached, so
+# the file is hashed again next time.  Two seconds covers the
+# coarsest common file system timestamps.
+RACY_NS = 2 * 1000000000
+
+
+class DigestKey(collections.namedtuple('DigestKey', [
+        'dev', 'ino', 'size', 'mtime_ns', 'algorithm'])):
+    """
+    Identify the contents of a file for the purposes of caching its
+    digest.  The device and inode numbers identify the file, and the
+    size and modification time identify its contents.
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def from_stat(cls, st, algorithm):
+        """
+        Construct a ``DigestKey`` from a stat result.
+
+        :param st: The result of ``os.stat()`` for the file.
+        :param algorithm: The name of the hash algorithm.
+
+        :returns: A ``DigestKey`` instance.
+        """
+
+        return cls(st.st_dev, st.st_ino, st.st_size, utils.mtime_ns(st),
+                   algorithm)
+
+
+class DigestStore(object):
+    """
+    Store cached digests.  Subclasses must implement ``get()`` and
+    ``put()``.
+    """
+
+    def get(self, path, key):
+        """
+        Retrieve a cached digest.
+
+        :param path: The system path of the file.
+        :param key: The ``DigestKey`` describing the file.
+
+        :returns: The hex digest, or ``None`` if it is not cached.
+        """
+
+        raise NotImplementedError()  # pragma: no cover
+
+    def put(self, path, key, digest):
+        """
+        Cache a digest.
+
+        :param path: The system path of the file.
+        :param key: The ``DigestKey`` describing the file.
+        :param digest: The hex digest.
+        """
+
+        raise NotImplementedError()  # pragma: no cover
+
+
+class MemoryStore(DigestStore):
+    """
+    Store cached digests in memory, evicting the least recently used
+    digests once a maximum number is reached.
+    """
+
+    def __init__(self, max_entries=10000):
+        """
+        Initialize a ``MemoryStore`` object.
+
+        :param max_entries: The maximum number of digests to hold.
+        """
+
+        self._cache = lru.LRUCache(max_entries)
+
+    def get(self, path, key):
+        """
+        Retrieve a cached digest.
+
+        :param path: The system path of the file.
+        :param key: The ``DigestKey`` describing the file.
+
+        :returns: The hex digest, or ``None`` if it is not cached.
+        """
+
+        return self._cache.get(key)
+
+    def put(self, path, key, digest):
+        """
+        Cache a digest.
+
+        :param path: The system path of the file.
+        :param key: The ``DigestKey`` describing the file.
+        :param digest: The hex digest.
+        """
+
+        self._cache.put(key, digest)
+
+
+class SQLiteStore(DigestStore):
+    """
+    Store cached digests in a SQLite database, so that they persist
+    across processes.  Only the latest digest of each file is kept.
+    """
+
+    def __init__(self, filename):
+        """
+        Initialize a ``SQLiteStore`` object.
+
+        :param filename: The name of the database file.  It will be
+                         created if it does not exist.
+        """
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(filename, check_same_thread=False)
+        with self._db:
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS digests ('
+                'dev INTEGER, ino INTEGER, algorithm TEXT, size INTEGER, '
+                'mtime_ns INTEGER, digest TEXT, '
+                'PRIMARY KEY (dev, ino, algorithm))')
+
+    def get(self, path, key):
+        """
+        Retrieve a cached digest.
+
+        :param path: The system path of the file.
+        :param key: The ``DigestKey`` describing the file.
+
+        :returns: The hex digest, or ``None`` if it is not cached.
+        """
+
+        with self._lock:
+            row = self._db.execute(
+                'SELECT digest FROM digests WHERE dev = ? AND ino = ? AND '
+                'algorithm = ? AND size = ? AND mtime_ns = ?',
+                (key.dev, key.ino, key.algorithm, key.size,
+                 key.mtime_ns)).fetchone()
+
+        return row[0] if row else None
+
+    def put(self, path, key, digest):
+        """
+        Cache a digest.
+
+        :param path: The system path of the file.
+        :param key: The ``DigestKey`` describing the file.
+        :param digest: The hex digest.
+        """
+
+        with self._lock:
+            with self._db:
+                self._db.execute(
+                    'INSERT OR REPLACE INTO digests (dev, ino, algorithm, '
+                    'size, mtime_ns, digest) VALUES (?, ?, ?, ?, ?, ?)',
+                    (key.dev, key.ino, key.algorithm, key.size, key.mtime_ns,
+                     digest))
+
+    def close(self):
+        """
+        Close the database.
+        """
+
+        with self._lock:
+            self._db.close()
+
+
+class XattrStore(DigestStore):
+    """
+    Store cached digests in extended attributes of the files
+    themselves, so that they travel with the files.  Only available
+    on Linux; files on file systems without extended attribute
+    support, or which cannot be written, are not cached.
+    """
+
+    def __init__(self, prefix='user.fstree.digest.'):
+        """
+        Initialize an ``XattrStore`` object.
+
+        :param prefix: The prefix for the attribute names.  The name
+                       of the hash algorithm is appended.  Must begin
+                       with "user." for unprivileged use.
+        """
+
+        if not hasattr(os, 'getxattr'):
+            raise OSError(errno.ENOTSUP,
+                          "extended attributes are not available")
+
+        self.prefix = prefix
+
+    def get(self, path, key):
+        """
+        Retrieve a cached digest.
+
+        :param path: The system path of the file.
+        :param key: The ``DigestKey`` describing the file.
+
+        :returns: The hex digest, or ``None`` if it is not cached.
+        """
+
+        try:
+            value = os.getxattr(path, self.prefix + key.algorithm)
+        except OSError:
+            return None
+
+        # The attribute holds the size, modification time, and digest
+        try:
+            size, mtime_ns, digest = value.decode('ascii').split(':')
+        except ValueError:
+            return None
+        if int(size) != key.size or int(mtime_ns) != key.mtime_ns:
+            return None
+
+        return digest
+
+    def put(self, path, key, digest):
+        """
+        Cache a digest.
+
+        :param path: The system path of the file.
+        :param key: The ``DigestKey`` describing the file.
+        :param digest: The hex digest.
+        """
+
+        value = '%d:%d:%s' % (key.size, key.mtime_ns, digest)
+        try:
+            os.setxattr(path, self.prefix + key.algorithm,
+                        value.encode('ascii'))
+        except OSError:
+            pass
+
+
+class DigestCache(object):
+    """
+    Compute file digests, caching them in a ``DigestStore``.  A file
+    whose device, inode, size, and modification time are unchanged
+    has its digest returned without being read.  Digests of files
+    modified within ``RACY_NS`` of being hashed are not cached, since
+    a further change in the same timestamp tick could not be seen.
+    """
+
+    def __init__(self, store=None):
+        """
+        Initialize a ``DigestCache`` object.
+
+        :param store: The ``DigestStore`` to cache digests in.
+                      Defaults to a ``MemoryStore``.
+        """
+
+        self.store = MemoryStore() if store is None else store
+        self.hits = 0
+        self.misses = 0
+
+        # Protects the statistics
+        self._lock = threading.Lock()
+
+    def _racy(self, key):
+        """
+        Determine whether a file was modified too recently for its
+        digest to be cached.
+
+        :param key: The ``DigestKey`` describing the file.
+
+        :returns: A ``True`` value if the modification time is not
+                  safely older than the current time.
+        """
+
+        return key.mtime_ns >= time.time_ns() - RACY_NS
+
+    def lookup(self, path, algorithm):
+        """
+        Look up the cached digest of a file.  If the digest is not
+        cached, the caller should compute it and pass it to
+        ``update()`` along with the returned key.
+
+        :param path: The system path of the file.
+        :param algorithm: The name of the hash algorithm.
+
+        :returns: A tuple of the ``DigestKey`` describing the file and
+                  the cached hex digest, or ``None`` if the digest is
+                  not cached.
+        """
+
+        key = DigestKey.from_stat(os.stat(path), algorithm)
+        digest = self.store.get(path, key)
+        with self._lock:
+            if digest is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        return key, digest
+
+    def update(self, path, key, digest):
+        """
+        Cache the digest of a file computed after a call to
+        ``lookup()``.  The digest is only cached if the file did not
+        change while it was being read, and was not modified too
+        recently to tell whether it changes again.
+
+        :param path: The system path of the file.
+        :param key: The ``DigestKey`` returned by ``lookup()``.
+        :param digest: The hex digest.
+        """
+
+        try:
+            current = DigestKey.from_stat(os.stat(path), key.algorithm)
+        except OSError:
+            return
+
+        if current == key and not self._racy(key):
+            self.store.put(path, key, digest)
+
+    def seed(self, path, algorithm, digest):
+        """
+        Cache the digest of a file computed by other means, such as
+        while the file was being written.
+
+        :param path: The system path of the file.
+        :param algorithm: The name of the hash algorithm.
+        :param digest: The hex digest of the file's current contents.
+        """
+
+        key = DigestKey.from_stat(os.stat(path), algorithm)
+        if not self._racy(key):
+            self.store.put(path, key, digest)
+
+    def digest(self, path, algorithm):
+        """
+        Compute the digest of a file.
+
+        :param path: The system path of the file.
+        :param algorithm: The name of the hash algorithm.
+
+        :returns: The hex digest of the file.
+        """
+
+        key, digest = self.lookup(path, algorithm)
+        if digest is None:
+            digest = utils.digest_file(path,
+                                       (utils.get_hasher(algorithm)(),))
+            self.update(path, key, digest)
+
+        return digest
@@ -0,0 +1,470 @@
+# Copyright 2014 Kevin L. Mitchell
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from concurrent import futures
+import os
+import stat
+
+from fstree import utils
+
+
+class ScanEntry(object):
+    """
+    Represent a single entry discovered while scanning a directory.
+    This is similar to the ``os.DirEntry`` objects yielded by
+    ``os.scandir()``, and the file type reported by the directory
+    listing is used whenever possible.  Unlike ``os.DirEntry``, a
+    ``ScanEntry`` keeps track of exactly which stat data has been
+    fetched, so that the data may be used to seed the stat caches of
+    an ``FSEntry``.
+    """
+
+    __slots__ = ('name', 'path', '_dirent', '_dtype', '_lstat', '_stat')
+
+    def __init__(self, dirpath, name, dirent=None):
+        """
+        Initialize a ``ScanEntry`` object.
+
+        :param dirpath: The system path of the directory containing
+                        the entry.
+        :param name: The name of the entry within the directory.
+        :param dirent: An optional ``os.DirEntry`` object describing
+                       the entry.  If not given, the file type will be
+                       determined by calling ``os.lstat()``.
+        """
+
+        self.name = name
+        self.path = os.path.join(dirpath, name)
+
+        self._dirent = dirent
+        self._dtype = utils.unset
+        self._lstat = utils.unset
+        self._stat = utils.unset
+
+    def __repr__(self):
+        """
+        Return a representation of the entry.
+        """
+
+        return '<%s.%s object for "%s" at %#x>' % (
+            self.__class__.__module__, self.__class__.__name__,
+            self.path, id(self))
+
+    @property
+    def dtype(self):
+        """
+        Retrieve the file type of the entry, not following symbolic
+        links.  This is one of the ``stat.S_IF*`` constants, or 0 if
+        the file type could not be determined.  When the directory
+        listing reports the file type, no system call is made.
+        """
+
+        if self._dtype is utils.unset:
+            dirent = self._dirent
+            try:
+                if dirent is None:
+                    self._dtype = stat.S_IFMT(self.lstat().st_mode)
+                elif dirent.is_symlink():
+                    self._dtype = stat.S_IFLNK
+                elif dirent.is_dir(follow_symlinks=False):
+                    self._dtype = stat.S_IFDIR
+                elif dirent.is_file(follow_symlinks=False):
+                    self._dtype = stat.S_IFREG
+                else:
+                    self._dtype = stat.S_IFMT(self.lstat().st_mode)
+            except OSError:
+                self._dtype = 0
+
+        return self._dtype
+
+    def inode(self):
+        """
+        Retrieve the inode number of the entry.
+        """
+
+        if self._dirent is not None:
+            return self._dirent.inode()
+        return self.lstat().st_ino
+
+    def is_dir(self, follow_symlinks=True):
+        """
+        Determine whether the entry is a directory.
+
+        :param follow_symlinks: If ``True`` (the default), symbolic
+                                links pointing at directories are
+                                considered to be directories.
+
+        :returns: A ``True`` value if the entry is a directory,
+                  ``False`` otherwise.
+        """
+
+        return self._is_type(stat.S_IFDIR, follow_symlinks)
+
+    def is_file(self, follow_symlinks=True):
+        """
+        Determine whether the entry is a regular file.
+
+        :param follow_symlinks: If ``True`` (the default), symbolic
+                                links pointing at regular files are
+                                considered to be regular files.
+
+        :returns: A ``True`` value if the entry is a regular file,
+                  ``False`` otherwise.
+        """
+
+        return self._is_type(stat.S_IFREG, follow_symlinks)
+
+    def is_symlink(self):
+        """
+        Determine whether the entry is a symbolic link.
+
+        :returns: A ``True`` value if the entry is a symbolic link,
+                  ``False`` otherwise.
+        """
+
+        return self.dtype == stat.S_IFLNK
+
+    def _is_type(self, ftype, follow_symlinks):
+        """
+        A helper method to test the file type of the entry.
+
+        :param ftype: The ``stat.S_IF*`` constant to test for.
+        :param follow_symlinks: If ``True``, the type of the target of
+                                a symbolic link is tested instead.
+
+        :returns: A ``True`` value if the entry has the designated
+                  file type, ``False`` otherwise.
+        """
+
+        dtype = self.dtype
+        if dtype == stat.S_IFLNK and follow_symlinks:
+            try:
+                return stat.S_IFMT(self.stat().st_mode) == ftype
+            except OSError:
+                # A dangling symlink
+                return False
+
+        return dtype == ftype
+
+    def lstat(self):
+        """
+        Retrieve the result of ``os.lstat()`` for the entry.  The
+        result is cached.
+        """
+
+        if self._lstat is utils.unset:
+            if self._dirent is not None:
+                self._lstat = self._dirent.stat(follow_symlinks=False)
+            else:
+                self._lstat = os.lstat(self.path)
+
+        return self._lstat
+
+    def stat(self, follow_symlinks=True):
+        """
+        Retrieve the result of ``os.stat()`` for the entry.  The
+        result is cached.
+
+        :param follow_symlinks: If ``False``, the result of
+                                ``os.lstat()`` is returned instead.
+        """
+
+        if not follow_symlinks:
+            return self.lstat()
+
+        if self._stat is utils.unset:
+            if self.dtype not in (stat.S_IFLNK, 0):
+                # Only symlinks need to be followed
+                self._stat = self.lstat()
+            else:
+                self._stat = os.stat(self.path)
+
+        return self._stat
+
+    def fetched(self):
+        """
+        Retrieve the stat data that has already been fetched for this
+        entry.  No system calls are made.
+
+        :returns: A tuple of the ``os.lstat()`` and ``os.stat()``
+                  results.  Either may be ``utils.unset`` if it has
+                  not been fetched.
+        """
+
+        lst = self._lstat
+        st = self._stat
+
+        # The lstat data is good for stat if it's not a symlink
+        if (st is utils.unset and lst is not utils.unset and
+                not stat.S_ISLNK(lst.st_mode)):
+            st = lst
+
+        return lst, st
+
+    def seed(self, entry):
+        """
+        Seed the stat caches of an ``FSEntry`` with the stat data that
+        has already been fetched for this entry.  No system calls are
+        made.
+
+        :param entry: The ``FSEntry`` to seed.
+        """
+
+        lst, st = self.fetched()
+        if lst is not utils.unset:
+            entry._lstat = lst
+        if st is not utils.unset:
+            entry._stat = st
+
+
+def scandir(path):
+    """
+    List a directory.  Uses ``os.scandir()`` where available, so that
+    the file types reported by the directory listing may be used.
+
+    :param path: The system path of the directory to list.
+
+    :returns: A list of ``ScanEntry`` objects, one for each entry in
+              the directory.
+    """
+
+    if hasattr(os, 'scandir'):
+        it = os.scandir(path)
+        try:
+            return [ScanEntry(path, dirent.name, dirent) for dirent in it]
+        finally:
+            # Older Pythons have no context manager support
+            if hasattr(it, 'close'):
+                it.close()
+
+    # No scandir() available; file types come from os.lstat()
+    return [ScanEntry(path, name)
+            for name in os.listdir(path)]  # pragma: no cover
+
+
+def listdir(path, ignore=None):
+    """
+    List a directory, splitting the entries into directories and
+    non-directories.  Symbolic links to directories are considered to
+    be directories, as with ``os.walk()``.
+
+    :param path: The system path of the directory to list.
+    :param ignore: An optional callable.  This callable will be
+                   called with the directory path and a list of files
+                   and directories in that directory; it should return
+                   a list of file and directory names which should be
+                   excluded.
+
+    :returns: A tuple of two lists of ``ScanEntry`` objects; the
+              first describes the directories, and the second the
+              non-directories.
+    """
+
+    entries = scandir(path)
+
+    # Apply the ignore filter
+    if ignore:
+        ignored = set(ignore(path, [e.name for e in entries]))
+        entries = [e for e in entries if e.name not in ignored]
+
+    # Split up the directories and files
+    dirs = []
+    files = []
+    for ent in entries:
+        (dirs if ent.is_dir() else files).append(ent)
+
+    return dirs, files
+
+
+def walk(top, topdown=True, onerror=None, followlinks=False, ignore=None,
+         workers=None, ordered=True):
+    """
+    Walk a directory tree.  This is similar to the ``os.walk()``
+    generator, except that the directories and files are described
+    by ``ScanEntry`` objects.  When ``topdown`` is ``True``, the
+    caller may remove elements from the directories list in-place to
+    prune the walk.
+
+    :param top: The system path of the directory to walk.
+    :param topdown: If ``True`` (the default), the yielded tuple for a
+                    directory is generated before that for any of the
+                    subdirectories.
+    :param onerror: An optional callable that is called with the
+                    ``OSError`` instance if an error occurs.  If not
+                    provided, errors are ignored.
+    :param followlinks: If ``False`` (the default), directories
+                        pointed to by symbolic links will not be
+                        traversed during the walk.
+    :param ignore: An optional callable.  This callable will be
+                   called with the directory path and a list of files
+                   and directories in that directory; it should return
+                   a list of file and directory names which should be
+                   excluded.  Excluded directories are never visited.
+                   If ``workers`` is given, the callable may be called
+                   concurrently from several threads.
+    :param workers: If given and greater than 1, the number of
+                    threads to use for listing directories.  Sibling
+                    directories are then listed concurrently, which
+                    hides the latency of slow file systems.
+    :param ordered: Only meaningful if ``workers`` is given.  If
+                    ``True`` (the default), the tuples are yielded in
+                    the same order as a serial walk.  If ``False``,
+                    directories are yielded as soon as they have been
+                    listed, which maximizes throughput; ``topdown``
+                    must be ``True`` in this case.
+
+    :returns: A generator yielding 3-tuples consisting of the system
+              path of the directory, a list of ``ScanEntry`` objects
+              for the subdirectories, and a list of ``ScanEntry``
+              objects for the remaining entries.
+    """
+
+    # Select the walk implementation
+    if not workers or workers <= 1:
+        return _walk_serial(top, topdown, onerror, followlinks, ignore)
+    elif ordered:
+        return _walk_ordered(top, topdown, onerror, followlinks, ignore,
+                             workers)
+    elif not topdown:
+        raise ValueError("unordered walks must be top-down")
+
+    return _walk_unordered(top, onerror, followlinks, ignore, workers)
+
+
+def _walk_serial(top, topdown, onerror, followlinks, ignore):
+    """
+    Walk a directory tree one directory at a time.  See ``walk()``
+    for the meanings of the arguments.
+    """
+
+    try:
+        dirs, files = listdir(top, ignore)
+    except OSError as err:
+        if onerror is not None:
+            onerror(err)
+        return
+
+    if topdown:
+        yield top, dirs, files
+
+    # Recurse into the subdirectories
+    for ent in dirs:
+        if followlinks or not ent.is_symlink():
+            for result in _walk_serial(ent.path, topdown, onerror,
+                                       followlinks, ignore):
+                yield result
+
+    if not topdown:
+        yield top, dirs, files
+
+
+def _walk_ordered(top, topdown, onerror, followlinks, ignore, workers):
+    """
+    Walk a directory tree, listing sibling directories concurrently
+    on a thread pool but yielding results in the same order as
+    ``_walk_serial()``.  See ``walk()`` for the meanings of the
+    arguments.
+    """
+
+    executor = futures.ThreadPoolExecutor(workers)
+    try:
+        for result in _walk_ordered_dir(
+                executor, top, executor.submit(listdir, top, ignore),
+                topdown, onerror, followlinks, ignore):
+            yield result
+    finally:
+        executor.shutdown()
+
+
+def _walk_ordered_dir(executor, top, listing, topdown, onerror, followlinks,
+                      ignore):
+    """
+    A helper for ``_walk_ordered()`` which walks a single directory.
+
+    :param executor: The thread pool.
+    :param top: The system path of the directory.
+    :param listing: A future for the result of ``listdir()`` on the
+                    directory.
+
+    See ``walk()`` for the meanings of the remaining arguments.
+    """
+
+    try:
+        dirs, files = listing.result()
+    except OSError as err:
+        if onerror is not None:
+            onerror(err)
+        return
+
+    if topdown:
+        yield top, dirs, files
+
+    # Start listing all the subdirectories at once
+    subdirs = [ent for ent in dirs if followlinks or not ent.is_symlink()]
+    listings = [executor.submit(listdir, ent.path, ignore)
+                for ent in subdirs]
+
+    try:
+        for ent, sublisting in zip(subdirs, listings):
+            for result in _walk_ordered_dir(executor, ent.path, sublisting,
+                                            topdown, onerror, followlinks,
+                                            ignore):
+                yield result
+    finally:
+        # If the walk was abandoned, don't bother with the rest
+        for sublisting in listings:
+            sublisting.cancel()
+
+    if not topdown:
+        yield top, dirs, files
+
+
+def _walk_unordered(top, onerror, followlinks, ignore, workers):
+    """
+    Walk a directory tree top-down, listing directories concurrently
+    on a thread pool and yielding each directory as soon as its
+    listing is available.  See ``walk()`` for the meanings of the
+    arguments.
+    """
+
+    def _listdir(path):
+        return (path,) + listdir(path, ignore)
+
+    executor = futures.ThreadPoolExecutor(workers)
+    pending = set([executor.submit(_listdir, top)])
+    try:
+        while pending:
+            done, pending = futures.wait(
+                pending, return_when=futures.FIRST_COMPLETED)
+
+            for listing in done:
+                try:
+                    dirpath, dirs, files = listing.result()
+                except OSError as err:
+                    if onerror is not None:
+                        onerror(err)
+                    continue
+
+                yield dirpath, dirs, files
+
+                # Queue up the subdirectories that remain
+                pending.update(
+                    executor.submit(_listdir, ent.path) for ent in dirs
+                    if followlinks or not ent.is_symlink())
+    finally:
+        # If the walk was abandoned, don't bother with the rest
+        for listing in pending:
+            listing.cancel()
+        executor.shutdown()
@@ -13,6 +13,8 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+from concurrent import futures
+import errno
 import os
 import shutil
 import stat
@@ -23,10 +25,79 @@ import weakref
 import six
 
 from fstree import cacheprop
+from fstree import compress
+from fstree import copyengine
+from fstree import dirscan
+from fstree import inotify
+from fstree import lru
+from fstree import merkle
+from fstree import removal
+from fstree import snapshot
+from fstree import statcache
+from fstree import tarbuild
+from fstree import tarindex
 from fstree import tarname
+from fstree import tarshard
+from fstree import trash
+from fstree import untar
 from fstree import utils
 
 
+class _WritingFile(object):
+    """
+    Wrap a file opened for writing by ``FSEntry.open()``, so that the
+    cached stat results for the file are discarded when it is closed
+    as well as when it is opened.
+    """
+
+    def __init__(self, fileobj, tree, name):
+        """
+        Initialize a ``_WritingFile`` object.
+
+        :param fileobj: The open file object.
+        :param tree: The ``FSTree`` containing the file.
+        :param name: The name of the file within the tree.
+        """
+
+        self._fileobj = fileobj
+        self._tree = tree
+        self._name = name
+
+    def __getattr__(self, name):
+        """
+        Retrieve an attribute of the wrapped file object.
+
+        :param name: The name of the attribute.
+
+        :returns: The value of the attribute.
+        """
+
+        return getattr(self._fileobj, name)
+
+    def __iter__(self):
+        """
+        Iterate over the lines of the wrapped file object.
+        """
+
+        return iter(self._fileobj)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        self.close()
+
+    def close(self):
+        """
+        Close the file and discard its cached stat results.
+        """
+
+        try:
+            self._fileobj.close()
+        finally:
+            self._tree.invalidate(self._name)
+
+
 class FSEntry(object):
     """
     Represent a single entry in the file system tree.  Various
@@ -34,7 +105,14 @@ class FSEntry(object):
     various data collected via attribute access.
     """
 
-    def __init__(self, root, name, path):
+    # Trees may hold a great many entries, so keep them compact.  The
+    # name-derived properties are computed on demand, and only the
+    # cached properties that are expensive to compute get a slot.
+    __slots__ = ('tree', 'name', 'path', '_lstat', '_stat', '_contents',
+                 '_lcontents', '_realpath', '__cache_control__',
+                 '__weakref__')
+
+    def __init__(self, tree, name, path):
         """
         Initialize an ``FSEntry`` instance.
 
@@ -75,6 +153,27 @@ class FSEntry(object):
         raise AttributeError("'%s' object has no attribute '%s'" %
                              (self.__class__.__name__, name))
 
+    def __sizeof__(self):
+        """
+        Return the size of the entry in bytes, including its names and
+        any cached contents.
+        """
+
+        size = (super(FSEntry, self).__sizeof__() +
+                sys.getsizeof(self.name) + sys.getsizeof(self.path))
+
+        for attr in ('_contents', '_lcontents', '_realpath'):
+            value = getattr(self, attr, None)
+            if value is None:
+                continue
+
+            size += sys.getsizeof(value)
+            if isinstance(value, list):
+                # Directory contents
+                size += sum(sys.getsizeof(elem) for elem in value)
+
+        return size
+
     def __contains__(self, path):
         """
         Determine if a given file exists in the tree.
@@ -87,10 +186,10 @@ class FSEntry(object):
 
         # If it's an FSEntry, check if it's in the correct tree
         if isinstance(path, FSEntry):
-            return path.tree is self.tree and os.path.exists(path.path)
+            return path.tree is self.tree and self.tree._exists(path.path)
 
         # OK, it's just a regular string
-        return os.path.exists(self._abs(path))
+        return self.tree._exists(self._abs(path))
 
     def __getitem__(self, path):
         """
@@ -100,12 +199,18 @@ class FSEntry(object):
         is from a different tree.
 
         :param path: The path to find an ``FSEntry`` instance for.
+                     May be a ``dirscan.ScanEntry`` yielded by
+                     ``scan()``, in which case any stat data it
+                     carries is used to seed the entry.
 
         :returns: An instance of ``FSEntry``.
         """
 
+        # Scan entries can seed the stat caches
+        record = path if isinstance(path, dirscan.ScanEntry) else None
+
         # Delegate to the tree's _get() method
-        return self.tree._get(self._rel(path, False))
+        return self.tree._get(self._rel(path, False), record=record)
 
     def __setitem__(self, path, value):
         """
@@ -148,6 +253,9 @@ class FSEntry(object):
         # If it's an FSEntry, use the name
         if isinstance(path, FSEntry):
             path = path.name
+        elif isinstance(path, dirscan.ScanEntry):
+            # Scan entries must be within the tree
+            path = utils.deroot(path.path, self.tree.path)
 
         return self.tree._full(utils.abspath(path, cwd=self.name))
 
@@ -187,6 +295,16 @@ class FSEntry(object):
 
         return (src, dst, full_dst)
 
+    def _invalidate(self):
+        """
+        A helper method to discard the cached stat results and cached
+        property values of this entry.
+        """
+
+        self._lstat = utils.unset
+        self._stat = utils.unset
+        cacheprop.invalidate(self)
+
     def _rel(self, path, cross_tree=True):
         """
         A helper method to resolve a provided path relative to this
@@ -209,6 +327,9 @@ class FSEntry(object):
 
             # Grab the path name
             path = path.name
+        elif isinstance(path, dirscan.ScanEntry):
+            # Scan entries must be within the tree
+            path = utils.deroot(path.path, self.tree.path)
 
         # Resolve the path with the tree root as the root
         return utils.abspath(path, cwd=self.name)
@@ -228,7 +349,8 @@ class FSEntry(object):
 
         return os.access(self.path, mode)
 
-    def copy(self, src, dst=os.curdir, symlinks=False, ignore=None):
+    def copy(self, src, dst=os.curdir, symlinks=False, ignore=None,
+             workers=None):
         """
         Copy a given source file.
 
@@ -249,30 +371,42 @@ class FSEntry(object):
                        directory names in that directory; it should
                        return a list of file and directory names which
                        should be subsequently ignored.
+        :param workers: If given and greater than 1, and if ``src``
+                        is a directory, the number of threads to copy
+                        files with.  The directories are created
+                        first and their metadata is copied last.
 
         :returns: An ``FSEntry`` instance representing the copy of
-                  ``src`` in its new location.
+                  ``src`` in its new location.  The data is copied by
+                  the tree's ``copyengine.CopyEngine``, which reports
+                  the method used for each file.
         """
 
         # Resolve the paths
         src, dst, full_dst = self._paths(src, dst)
 
         # Select the appropriate copy method
+        engine = self.tree._copy_engine
         if os.path.isdir(src):
             # Copy a directory
-            shutil.copytree(src, full_dst, symlinks=symlinks, ignore=ignore)
+            engine.copytree(src, full_dst, symlinks=symlinks, ignore=ignore,
+                            workers=workers)
         else:
             # Copy a file
-            shutil.copy2(src, full_dst)
+            engine.copy2(src, full_dst)
+        self.tree.invalidate()
 
         # Return a reference to the new file
         return self.tree._get(dst)
 
-    def digest(self, path=os.curdir, hasher=utils.DEFAULT_HASHER):
+    def digest(self, path=os.curdir, hasher=utils.DEFAULT_HASHER,
+               metadata=False, workers=None, processes=False):
         """
         Compute the digest of the file.  Returns the hex digest of the
         file; to retrieve the digest in other forms, pass an explicit
-        hasher or tuple of hashers.
+        hasher or tuple of hashers.  The digest of a directory is a
+        Merkle digest of its contents, as computed by
+        ``merkle.digest()``; ``hasher`` must then be a string.
 
         :param path: An optional path to a subelement of this
                      directory.
@@ -281,23 +415,45 @@ class FSEntry(object):
                        hashers present in ``hashlib``, or a tuple of
                        such objects.  If not given, defaults to
                        ``utils.DEFAULT_HASHER``.
+        :param metadata: If ``True``, regular files are fingerprinted
+                         by their size and modification time rather
+                         than by their contents.  ``hasher`` must be
+                         a string.
+        :param workers: For directories, the number of workers used
+                        to hash the files in the directory.
+        :param processes: For directories, if ``True``, the files are
+                          hashed in a process pool rather than a
+                          thread pool.
 
         :returns: The digest of the file, in hex.  If a tuple of
                   hashers was passed for ``hasher``, then the first
-                  hasher will be returned.
+                  hasher will be returned.  If the tree has a digest
+                  cache and ``hasher`` is a string, an unchanged
+                  file's digest is returned without reading it.
         """
 
         # Set up the hasher, first
         if not hasher:
             raise ValueError('a hasher must be specified')
+        elif metadata or os.path.isdir(self._abs(path)):
+            if not isinstance(hasher, six.string_types):
+                raise ValueError('a hash algorithm name must be specified')
+
+            return merkle.digest(self._abs(path), hasher, metadata,
+                                 workers=workers, processes=processes,
+                                 cache=self.tree._digest_cache)
         elif isinstance(hasher, six.string_types):
+            # Consult the digest cache
+            if self.tree._digest_cache is not None:
+                return self.tree._digest_cache.digest(self._abs(path),
+                                                      hasher)
+
             hasher = (utils.get_hasher(hasher)(),)
         elif not isinstance(hasher, tuple):
             hasher = (hasher,)
 
-        # Open the desired file and digest it
-        with self.open(path) as f:
-            return utils.digest(f, hasher)
+        # Digest the desired file
+        return utils.digest_file(self._abs(path), hasher)
 
     def get(self, path, default=None):
         """
@@ -306,16 +462,22 @@ class FSEntry(object):
         default value will be returned.
 
         :param path: The path to find an ``FSEntry`` instance for.
+                     May be a ``dirscan.ScanEntry`` yielded by
+                     ``scan()``, in which case any stat data it
+                     carries is used to seed the entry.
         :param default: A default value to return if the file does not
                         exist.
 
         :returns: An instance of ``FSEntry``, or the ``default``.
         """
 
+        # Scan entries can seed the stat caches
+        record = path if isinstance(path, dirscan.ScanEntry) else None
+
         # Delegate to the tree's _get() method
-        return self.tree._get(self._rel(path), default)
+        return self.tree._get(self._rel(path), default, record)
 
-    def link(self, src, dst=os.curdir, ignore=None):
+    def link(self, src, dst=os.curdir, ignore=None, fallback=False):
         """
         Create a hard link to a given file.
 
@@ -330,6 +492,10 @@ class FSEntry(object):
                        directory names in that directory; it should
                        return a list of file and directory names which
                        should be subsequently ignored.
+        :param fallback: If ``True``, files which cannot be hard
+                         linked, e.g., because they are on another
+                         file system, are copied instead, using the
+                         tree's ``copyengine.CopyEngine``.
 
         :returns: An ``FSEntry`` instance representing the hard link
                   ``dst``.
@@ -337,15 +503,17 @@ class FSEntry(object):
 
         # Resolve the paths
         src, dst, full_dst = self._paths(src, dst)
+        link = self._link_fallback if fallback else os.link
 
         # You can make hard links of symlinks, so if source is a link
         # or not a directory, we want to go with the simple case
         if os.path.islink(src) or not os.path.isdir(src):
             # Create the hard link
-            os.link(src, full_dst)
+            link(src, full_dst)
         else:
             # We can't hard link a directory, so make a tree of hard
             # links
+            os.makedirs(full_dst)
             for srcpath, dirnames, filenames in os.walk(src):
                 # Apply the ignore filter
                 utils.apply_ignore(ignore, srcpath, dirnames, filenames)
@@ -355,16 +523,34 @@ class FSEntry(object):
 
                 # Create the hard links
                 for filename in filenames:
-                    os.link(os.path.join(srcpath, filename),
-                            os.path.join(dstpath, filename))
+                    link(os.path.join(srcpath, filename),
+                         os.path.join(dstpath, filename))
 
                 # Create the subdirectories
                 for dirname in dirnames:
                     os.makedirs(os.path.join(dstpath, dirname))
+        self.tree.invalidate()
 
         # Return a reference to the hard link
         return self.tree._get(dst)
 
+    def _link_fallback(self, src, dst):
+        """
+        A helper method to create a hard link, copying the file if a
+        link cannot be made.
+
+        :param src: The system path of the source file.
+        :param dst: The system path of the link.
+        """
+
+        try:
+            os.link(src, dst)
+        except OSError as err:
+            if err.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+                raise
+
+            self.tree._copy_engine.copy2(src, dst, follow_symlinks=False)
+
     def makedirs(self, path, mode=0o777):
         """
         Make the designated subdirectory.
@@ -386,6 +572,7 @@ class FSEntry(object):
 
         # Create the directory or directories...
         os.makedirs(full, mode)
+        self.tree.invalidate()
 
         # Return a reference to the new directory
         return self.tree._get(rel)
@@ -407,8 +594,10 @@ class FSEntry(object):
         # Resolve the paths
         src, dst, full_dst = self._paths(src, dst)
 
-        # Move the path
-        shutil.move(src, full_dst)
+        # Move the path; moves between file systems are copies
+        shutil.move(src, full_dst,
+                    copy_function=self.tree._copy_engine.copy2)
+        self.tree.invalidate()
 
         # Return a reference to the new location
         return self.tree._get(dst)
@@ -427,15 +616,22 @@ class FSEntry(object):
                           while a value of 1 means line buffered.
                           Larger values specify the buffer size.
 
-        :returns: An open file object.
+        :returns: An open file object.  If the mode allows writing,
+                  the cached stat results for the file are discarded
+                  when it is opened and again when it is closed.
         """
 
         # Set up the args to feed to the underlying open builtin
-        args = [self._abs(path), mode]
+        name = self._rel(path)
+        args = [self.tree._full(name), mode]
         if buffering is not utils.unset:
             args.append(buffering)
 
-        return open(*args)
+        if not any(c in mode for c in 'wax+'):
+            return open(*args)
+
+        self.tree.invalidate(name)
+        return _WritingFile(open(*args), self.tree, name)
 
     def relpath(self, start, absolute=False):
         """
@@ -474,7 +670,8 @@ class FSEntry(object):
 
         return str(rel_path)
 
-    def remove(self, path, ignore_errors=False, onerror=None):
+    def remove(self, path, ignore_errors=False, onerror=None, workers=None,
+               defer=False):
         """
         Remove a file or directory tree.
 
@@ -490,29 +687,85 @@ class FSEntry(object):
                         ``sys.exc_info()``.  If not provided, and
                         ``ignore_errors`` is ``False``, an exception
                         will be raised.
+        :param workers: If given and greater than 1, and if ``path``
+                        is a directory, the number of threads used to
+                        remove its subdirectories concurrently.  See
+                        ``removal.rmtree()``.
+        :param defer: If ``True``, the file or directory tree is
+                      atomically moved into the tree's trash directory
+                      and removed in the background; see
+                      ``FSTree.drain()``.  If it cannot be moved, or
+                      if the tree is at the root of the file system,
+                      it is removed immediately.
         """
 
         # Find the full path of the target file
         path = self._abs(path)
 
-        # Is it a directory?
-        if os.path.isdir(path):
-            # It's a directory...
-            return shutil.rmtree(path, ignore_errors, onerror)
-        else:
-            # Try removing the file
-            try:
-                os.remove(path)
-            except OSError:
-                if ignore_errors:
-                    # Errors are being ignored
-                    return
-                elif onerror is None:
-                    # Re-raise the error
-                    raise
+        try:
+            if defer and self.tree._trash is not None:
+                # Move it into the trash
+                try:
+                    return self.tree._trash.discard(path)
+                except OSError:
+                    # Can't be moved; fall back to removing it now
+                    pass
+
+            # Is it a directory?
+            if os.path.isdir(path):
+                # It's a directory...
+                return removal.rmtree(path, ignore_errors, onerror, workers)
+            else:
+                # Try removing the file
+                try:
+                    os.remove(path)
+                except OSError:
+                    if ignore_errors:
+                        # Errors are being ignored
+                        return
+                    elif onerror is None:
+                        # Re-raise the error
+                        raise
+
+                    # Call the onerror function
+                    onerror(os.remove, path, sys.exc_info())
+        finally:
+            self.tree.invalidate()
 
-                # Call the onerror function
-                onerror(os.remove, path, sys.exc_info())
+    def snapshot(self, path=os.curdir, hasher=None, ignore=None,
+                 previous=None, workers=None):
+        """
+        Take a snapshot of the directory tree: a manifest recording
+        the type, size, mode, modification time, device and inode
+        numbers, symbolic link target, and optionally the digest of
+        every entry.  Two snapshots may be compared with
+        ``snapshot.diff()``.
+
+        :param path: An optional path to a subelement of this
+                     directory.  The names in the snapshot are
+                     relative to this directory.
+        :param hasher: The name of a hash algorithm.  If given, the
+                       digest of each regular file is recorded.
+        :param ignore: An optional callable.  This callable will be
+                       called with the absolute directory path and a
+                       list of files and directories in that
+                       directory; it should return a list of file and
+                       directory names which should be omitted from
+                       the snapshot.
+        :param previous: An optional earlier snapshot taken with the
+                         same ``hasher``.  Files whose stat data is
+                         unchanged are not read; their digests are
+                         copied from the earlier snapshot.
+        :param workers: If given, the number of threads to use for
+                        listing directories.
+
+        :returns: A ``snapshot.Snapshot`` instance.  If the tree has
+                  a digest cache, it is used to compute the digests.
+        """
+
+        return snapshot.Snapshot.take(self._abs(path), hasher, ignore,
+                                      previous, workers,
+                                      self.tree._digest_cache)
 
     def symlink(self, src, dst=os.curdir, outside=False):
         """
@@ -560,12 +813,14 @@ class FSEntry(object):
 
         # Create the symlink
         os.symlink(src, full_dst)
+        self.tree.invalidate()
 
         # Return a reference to the new file
         return self.tree._get(dst)
 
     def tar(self, filename, start=os.curdir, compression=utils.unset,
-            hasher=None):
+            hasher=None, workers=None, level=None, order=None,
+            reproducible=False, mtime=0, index=False, since=None):
         """
         Create a tar file with the given filename.
 
@@ -576,6 +831,11 @@ class FSEntry(object):
                          necessary.  If a compression extension on the
                          filename does not match the specified
                          compression, a ``ValueError`` will be raised.
+                         May also be a writable file object, pipe, or
+                         socket, to which the archive is streamed;
+                         nothing is inferred from it, so
+                         ``compression`` must be given if compression
+                         is desired.
         :param start: The directory from which to start the tar
                       process.  If not given, starts from the current
                       directory and includes all files in the
@@ -594,9 +854,57 @@ class FSEntry(object):
         :param hasher: If given, requests that a hash of the resulting
                        tar file be computed.  May be a ``True`` value
                        to use the default hasher; a string to specify
-                       a hasher; or a tuple of hashers.
-
-        :returns: The final filename that was created.  If ``hasher``
+                       a hasher; or a tuple of hashers.  The hash is
+                       computed as the archive is written, so the
+                       archive is never read back.
+        :param workers: If given and greater than 1, the number of
+                        threads used to compress the archive.  The
+                        "zst" compression uses the threads of the
+                        zstd library; other compressions are
+                        compressed in independent blocks, producing a
+                        multi-member file readable by the usual
+                        tools.
+        :param level: If given, the compression level to use.
+        :param order: If given, the order in which to write the
+                      files.  See ``tarbuild.TarBuilder``; in
+                      particular, ``tarbuild.ORDER_PHYSICAL`` reads
+                      the files in the order they are laid out on
+                      disk.
+        :param reproducible: If ``True``, the archive is built so
+                             that it depends only on the names,
+                             contents, and permissions of the files.
+                             Members are written in name order, with
+                             no owner information and with
+                             modification times no later than
+                             ``mtime``.
+        :param mtime: The latest modification time recorded when
+                      ``reproducible`` is ``True``.
+        :param index: If ``True``, a sidecar index is written next to
+                      the tar file, named by ``tarindex.index_path()``.
+                      May also be the file name of the index, which is
+                      interpreted relative to this entry, and which is
+                      required if the archive is streamed.  Otherwise,
+                      any index left next to the tar file by an
+                      earlier archive is removed.  The index
+                      records the offsets of the members, and the
+                      archive is compressed in independent blocks
+                      whose offsets are recorded too, so that
+                      ``tarview.TarTree`` can read any member while
+                      decompressing only the block containing it.
+        :param since: If given, an incremental archive is built,
+                      containing only the files changed since then.
+                      May be a ``snapshot.Snapshot`` taken of
+                      ``start`` (see ``snapshot()``), or a time, in
+                      seconds since the epoch.  As with the
+                      listed-incremental archives of GNU tar, every
+                      directory is written as a dumpdir member listing
+                      its entries, and ``untar()`` removes the entries
+                      which are not listed, so extracting a full
+                      archive and then each incremental archive in
+                      turn reproduces the tree.
+
+        :returns: The final filename that was created, or the file
+                  object the archive was streamed to.  If ``hasher``
                   was specified, a tuple will be returned, with the
                   second element consisting of the hex digest of the
                   tar file.
@@ -607,56 +915,327 @@ class FSEntry(object):
             filename = filename.path
 
         # Parse the file name and set the compression
-        filename = tarname.TarFileName(utils.abspath(filename, cwd=self.path))
-        if compression is not utils.unset:
-            filename.compression = compression
+        stream = hasattr(filename, 'write') or hasattr(filename, 'sendall')
+        if stream:
+            compression = tarname.Compression.lookup_supported(
+                None if compression is utils.unset else compression)
+        else:
+            filename = tarname.TarFileName(
+                utils.abspath(filename, cwd=self.path))
+            if compression is not utils.unset:
+                filename.compression = compression
+            compression = filename.compression
 
         # Determine the starting location and file list
+        start, filelist, root = self._tar_start(start)
+
+        # Determine where to put the index
+        if index is True:
+            if stream:
+                raise ValueError("the index of a streamed tar file must "
+                                 "be given a file name")
+            index = tarindex.index_path(filename)
+        elif index:
+            index = utils.abspath(index, cwd=self.path)
+        elif not stream:
+            # Don't leave an index for an earlier archive lying around
+            try:
+                os.remove(tarindex.index_path(filename))
+            except OSError as err:
+                if err.errno != errno.ENOENT:
+                    raise
+
+        # OK, let's build the tarball, hashing it as it's written
+        out = filename if stream else open(str(filename), 'wb')
+        try:
+            fileobj = utils.TeeWriter(
+                out, self._tar_hashers(hasher) if hasher else ())
+
+            # GNU tar only honors dumpdir members in its own format
+            fmt = tarfile.GNU_FORMAT if since is not None else None
+
+            # Select the compressor; tarfile's own gzip header records
+            # the current time, so it can't be used for reproducible
+            # archives
+            if index and compression and compress.parallel(compression):
+                # Compress in blocks, so they can be indexed
+                comp = compress.ParallelWriter(fileobj, compression, level,
+                                               workers)
+                tar = tarfile.open(fileobj=comp, mode='w|', format=fmt)
+            elif compression and (workers or level is not None or
+                                  reproducible or
+                                  not compress.builtin(compression)):
+                comp = compress.writer(fileobj, compression, level, workers)
+                tar = tarfile.open(fileobj=comp, mode='w|', format=fmt)
+            else:
+                comp = None
+                tar = tarfile.open(fileobj=fileobj,
+                                   mode='w|%s' % (compression or ''),
+                                   format=fmt)
+            try:
+                # Map the members explicitly, rather than changing the
+                # working directory, so tar() is safe to call from
+                # several threads at once
+                builder = tarbuild.TarBuilder(tar, order, reproducible,
+                                              mtime, record=bool(index),
+                                              since=since)
+                builder.build(((os.path.join(start, fname), fname)
+                               for fname in filelist), root)
+            finally:
+                tar.close()
+                if comp is not None:
+                    comp.close()
+                fileobj.close()
+        finally:
+            if not stream:
+                out.close()
+            self.tree.invalidate()
+
+        # Write the index, recording what the archive looks like so
+        # a stale index can be detected
+        if index:
+            written = None if stream else os.stat(str(filename)).st_mtime_ns
+            tarindex.TarIndex(compression, builder.members,
+                              getattr(comp, 'checkpoints', ()),
+                              fileobj.count, written).save(index)
+
+        # Begin building the result
+        result = filename if stream else str(filename)
+        if not hasher:
+            return result
+
+        digest = fileobj.hexdigest()
+        if hasher is True:
+            hasher = utils.DEFAULT_HASHER
+        if (not stream and isinstance(hasher, six.string_types) and
+                self.tree._digest_cache is not None):
+            # Remember the digest of the archive
+            self.tree._digest_cache.seed(result, hasher, digest)
+
+        return (result, digest)
+
+    @staticmethod
+    def _tar_hashers(hasher):
+        """
+        A helper method to select the digesters for the ``hasher``
+        argument of ``tar()``.
+
+        :param hasher: A ``True`` value to use the default hasher; a
+                       string to specify a hasher; or a digester or
+                       tuple of digesters.
+
+        :returns: A tuple of digesters.
+        """
+
+        if hasher is True:
+            hasher = utils.DEFAULT_HASHER
+        if isinstance(hasher, six.string_types):
+            return (utils.get_hasher(hasher)(),)
+        elif not isinstance(hasher, tuple):
+            return (hasher,)
+        return hasher
+
+    def _tar_start(self, start):
+        """
+        A helper method to determine where ``tar()`` starts and which
+        files it includes.
+
+        :param start: The directory from which to start the tar
+                      process.  See ``tar()``.
+
+        :returns: A tuple of the system path of the starting
+                  directory, the list of the names of the files to
+                  include, relative to it, and the system path of the
+                  directory they are all of the contents of, or
+                  ``None`` if they are not.
+        """
+
         start = self._rel(start, False)
-        filelist = None
         rel_path = utils.RelPath(start, self.name)
         if rel_path.parents and rel_path.remainder:
             raise ValueError("cannot start tar-ing from '%s'" % rel_path)
-        elif not rel_path.parents and not rel_path.remainder:
-            start = self.path
-        elif rel_path.parents:
-            start = os.path.normpath(
-                os.path.join(self.path, [os.pardir] * rel_path.parents))
-            filelist = [os.path.join(*rel_path.path_list[-rel_path.parents:])]
-        start = self.tree._full(start)
-        if filelist is None:
-            filelist = os.listdir(start)
 
-        # OK, let's build the tarball
-        tar = tarfile.open(str(filename), 'w:%s' % filename.compression or '')
+        start = self.tree._full(start)
+        if rel_path.parents:
+            # Only include this directory
+            return start, [os.path.join(
+                *self.name.split('/')[-rel_path.parents:])], None
+
+        return start, os.listdir(start), start
+
+    def tar_sharded(self, prefix, start=os.curdir, compression=utils.unset,
+                    shards=None, max_size=None, hasher=True, workers=None,
+                    level=None, order=None, reproducible=False, mtime=0):
+        """
+        Create several tar files which together contain the tree,
+        split into shards of roughly equal size.  The shards are
+        built in parallel by a pool of processes, and each may be
+        extracted independently of the others.  All the links to a
+        file are placed in the same shard.
+
+        :param prefix: The filename from which to form the names of
+                       the tar files.  A number is added to the base
+                       name for each shard, so "backup.tar.gz" results
+                       in "backup-000.tar.gz", "backup-001.tar.gz",
+                       and so on.  As with ``tar()``, the compression
+                       may be inferred from it.
+        :param start: The directory from which to start the tar
+                      process.  See ``tar()``.
+        :param compression: If given, specifies the compression to
+                            use.  See ``tar()``.
+        :param shards: The number of shards to create.  Fewer are
+                       created if there are not enough files to go
+                       around.
+        :param max_size: The maximum size of a shard, in bytes before
+                         compression.  As few shards as possible are
+                         created; a file larger than this is placed in
+                         a shard by itself.  Exactly one of ``shards``
+                         and ``max_size`` must be given.
+        :param hasher: The hash algorithm to compute the digests of
+                       the tar files with.  May be a ``True`` value to
+                       use the default hasher, or the name of a
+                       hasher.
+        :param workers: The number of processes to build the shards
+                        with.  Defaults to the number of CPUs.  If 1,
+                        the shards are built in this process.
+        :param level: If given, the compression level to use.
+        :param order: If given, the order in which to write the files
+                      within each shard.  See ``tar()``.
+        :param reproducible: If ``True``, the shards are built so
+                             that they depend only on the names,
+                             contents, and permissions of the files.
+                             See ``tar()``.
+        :param mtime: The latest modification time recorded when
+                      ``reproducible`` is ``True``.
+
+        :returns: A list of tuples of the filename and the hex digest
+                  of each tar file created.
+        """
+
+        # If the prefix is a FSEntry, use its path
+        if isinstance(prefix, FSEntry):
+            prefix = prefix.path
+
+        # Parse the prefix and set the compression
+        prefix = tarname.TarFileName(utils.abspath(prefix, cwd=self.path))
+        if compression is not utils.unset:
+            prefix.compression = compression
+        compression = prefix.compression
+        if hasher is True:
+            hasher = utils.DEFAULT_HASHER
+
+        # Collect the members and split them up
+        start, filelist, _root = self._tar_start(start)
+        builder = tarbuild.TarBuilder(None)
+        dirs = []
+        files = []
+        for fname in filelist:
+            builder.collect(os.path.join(start, fname), fname, dirs, files)
+        groups = tarshard.partition(dirs, files, shards, max_size)
+
+        # Name the shards
+        width = max(len(str(len(groups) - 1)), 3)
+        names = ['%s-%0*d%s' % (prefix.basename, width, i,
+                                ''.join(prefix.extensions))
+                 for i in range(len(groups))]
+
+        # Build them
+        args = (None if compression is None else str(compression), level,
+                hasher, order, reproducible, mtime)
         try:
-            with utils.workdir(start):
-                for fname in filelist:
-                    try:
-                        tar.add(fname)
-                    except Exception:
-                        pass
+            if workers == 1:
+                digests = [tarshard.build(name, group_dirs, group_files,
+                                          *args)
+                           for name, (group_dirs, group_files)
+                           in zip(names, groups)]
+            else:
+                with futures.ProcessPoolExecutor(workers) as executor:
+                    jobs = [executor.submit(tarshard.build, name,
+                                            group_dirs, group_files, *args)
+                            for name, (group_dirs, group_files)
+                            in zip(names, groups)]
+                    digests = [job.result() for job in jobs]
         finally:
-            tar.close()
-
-        # Begin building the result
-        result = str(filename)
+            self.tree.invalidate()
+
+        # Remember the digests of the archives
+        if self.tree._digest_cache is not None:
+            for name, digest in zip(names, digests):
+                self.tree._digest_cache.seed(name, hasher, digest)
+
+        return list(zip(names, digests))
+
+    def untar(self, source, dst=os.curdir, compression=utils.unset,
+              workers=None):
+        """
+        Extract a tar file into the tree.  If the tar file is an
+        incremental archive (see ``tar()``), the entries removed since
+        the earlier archive are removed from the tree.
+
+        :param source: The tar file to extract.  May be a file name,
+                       which is interpreted relative to this entry; an
+                       ``FSEntry``; or a readable file object, pipe,
+                       or socket.
+        :param dst: The directory to extract the tar file into.
+                    Defaults to this entry.  It is created if
+                    necessary.
+        :param compression: If given, specifies the compression of
+                            the tar file, or ``None`` if it is not
+                            compressed.  Otherwise, the compression is
+                            inferred from the file name, if possible,
+                            or from the magic number at the start of
+                            the tar file.  A ``ValueError`` will be
+                            raised if the compression is not
+                            supported.
+        :param workers: If given and greater than 1, the number of
+                        threads used to write the extracted files,
+                        while the tar file is read and decompressed
+                        in the calling thread.
+
+        :returns: An ``FSEntry`` instance representing the directory
+                  the tar file was extracted into.  A ``ValueError``
+                  is raised if a member of the tar file would be
+                  created outside the tree.
+        """
+
+        # If the source is a FSEntry, use its path
+        if isinstance(source, FSEntry):
+            source = source.path
+
+        # Open the source
+        if hasattr(source, 'recv'):
+            fileobj = source.makefile('rb')
+        elif hasattr(source, 'read'):
+            fileobj = None
+        else:
+            source = utils.abspath(source, cwd=self.path)
+            if compression is utils.unset:
+                compression = (tarname.TarFileName(source).compression or
+                               utils.unset)
+            fileobj = open(source, 'rb')
 
-        # If a hash was requested, generate it
-        if hasher:
-            # Select the hasher(s)
-            if hasher is True:
-                hasher = (utils.get_hasher(utils.DEFAULT_HASHER)(),)
-            elif isinstance(hasher, six.string_types):
-                hasher = (utils.get_hasher(hasher)(),)
-            elif not isinstance(hasher, tuple):
-                hasher = (hasher,)
+        # Determine the destination
+        rel = self._rel(dst)
+        full = self.tree._full(rel)
+        if not os.path.isdir(full):
+            os.makedirs(full)
 
-            # Open the file
-            with open(result) as f:
-                result = (result, utils.digest(f, hasher))
+        try:
+            reader = untar.open_source(fileobj or source, compression)
+            tar = tarfile.open(fileobj=reader, mode='r|')
+            try:
+                untar.Extractor(full, self.tree.path, workers).extract(tar)
+            finally:
+                tar.close()
+                if reader is not (fileobj or source):
+                    reader.close()
+        finally:
+            if fileobj is not None:
+                fileobj.close()
+            self.tree.invalidate()
 
-        return result
+        # Return a reference to the destination
+        return self.tree._get(rel)
 
     def utime(self, times=None):
         """
@@ -669,9 +1248,77 @@ class FSEntry(object):
         """
 
         os.utime(self.path, times)
+        self.tree.invalidate()
+
+    def scan(self, path=os.curdir, topdown=True, onerror=None,
+             followlinks=False, absolute=False, ignore=None, workers=None,
+             ordered=True):
+        """
+        Walk the directory tree, describing the directory entries with
+        ``dirscan.ScanEntry`` objects.  This is similar to ``walk()``,
+        but the file types reported by the directory listing are
+        available without further system calls, and any stat data
+        fetched through the ``ScanEntry`` objects is used to seed the
+        ``FSEntry`` instances obtained by looking them up in the tree.
+
+        :param path: An optional path to a subelement of this
+                     directory.
+        :param topdown: If ``True`` (the default), the yielded tuple
+                        for a directory is generated before that for
+                        any of the subdirectories.  When ``True``, the
+                        caller may remove elements from the
+                        subdirectory list in-place to prune the walk.
+        :param onerror: An optional callable that is called with the
+                        ``OSError`` instance if an error occurs.  If
+                        not provided, errors are ignored.
+        :param followlinks: If ``False`` (the default), directories
+                            pointed to by symbolic links will not be
+                            traversed during the walk.
+        :param absolute: If ``True``, the directory name returned as
+                         part of the yielded tuple will be an absolute
+                         path to the directory.  By default, this path
+                         name will be relative to the tree root.
+        :param ignore: An optional callable.  This callable will be
+                       called with the absolute directory path and a
+                       list of files and directories in that
+                       directory; it should return a list of file and
+                       directory names which should be subsequently
+                       ignored.  Ignored directories are never
+                       visited.  If ``workers`` is given, the callable
+                       may be called concurrently from several
+                       threads.
+        :param workers: If given and greater than 1, the number of
+                        threads to use for listing directories.
+                        Sibling directories are then listed
+                        concurrently, which hides the latency of slow
+                        file systems such as NFS.
+        :param ordered: Only meaningful if ``workers`` is given.  If
+                        ``True`` (the default), the tuples are yielded
+                        in the same order as a serial walk.  If
+                        ``False``, directories are yielded as soon as
+                        they have been listed, which maximizes
+                        throughput; ``topdown`` must be ``True`` in
+                        this case.
+
+        :returns: A generator yielding 3-tuples consisting of the name
+                  of the directory, a list of ``dirscan.ScanEntry``
+                  objects for the subdirectories, and a list of
+                  ``dirscan.ScanEntry`` objects for the files.
+        """
+
+        # Walk the tree, starting from there
+        for dirpath, dirs, files in dirscan.walk(self._abs(path), topdown,
+                                                 onerror, followlinks,
+                                                 ignore, workers, ordered):
+            if not absolute:
+                # Trim the directory path
+                dirpath = dirpath[len(self.tree.path):]
+
+            yield dirpath, dirs, files
 
     def walk(self, path=os.curdir, topdown=True, onerror=None,
-             followlinks=False, absolute=False, ignore=None):
+             followlinks=False, absolute=False, ignore=None, workers=None,
+             ordered=True):
         """
         Walk the directory tree.  Similar to the ``os.walk()``
         generator.
@@ -681,9 +1328,8 @@ class FSEntry(object):
         :param topdown: If ``True`` (the default), the yielded tuple
                         for a directory is generated before that for
                         any of the subdirectories.  When ``True``, the
-                        caller may modify the directory names list
-                        in-place to influence how ``walk()`` recurses
-                        through those directories.
+                        caller may remove elements from the directory
+                        names list in-place to prune the walk.
         :param onerror: An optional callable that is called with the
                         ``OSError`` instance if an error occurs.  If
                         not provided, errors are ignored.
@@ -699,29 +1345,53 @@ class FSEntry(object):
                        list of files and directories in that
                        directory; it should return a list of file and
                        directory names which should be subsequently
-                       ignored.  Note that, if ``topdown`` is
-                       ``False``, directories selected to be ignored
-                       by this callable will be visited anyway.
+                       ignored.  Ignored directories are never
+                       visited.  If ``workers`` is given, the callable
+                       may be called concurrently from several
+                       threads.
+        :param workers: If given and greater than 1, the number of
+                        threads to use for listing directories.
+                        Sibling directories are then listed
+                        concurrently, which hides the latency of slow
+                        file systems such as NFS.
+        :param ordered: Only meaningful if ``workers`` is given.  If
+                        ``True`` (the default), the tuples are yielded
+                        in the same order as a serial walk.  If
+                        ``False``, directories are yielded as soon as
+                        they have been listed, which maximizes
+                        throughput; ``topdown`` must be ``True`` in
+                        this case.
 
         :returns: A generator yielding 3-tuples consisting of the name
                   of the directory, a list of subdirectories, and a
                   list of filenames.
         """
 
-        # Walk the tree, starting from there
-        for dirpath, dirnames, filenames in os.walk(self._abs(path), topdown,
-                                                    onerror, followlinks):
+        for dirpath, dirs, files in self.scan(path, topdown, onerror,
+                                              followlinks, absolute,
+                                              ignore, workers, ordered):
+            dirnames = [ent.name for ent in dirs]
+            filenames = [ent.name for ent in files]
 
-            # Apply the ignore filter, if any
-            utils.apply_ignore(ignore, dirpath, dirnames, filenames)
+            yield dirpath, dirnames, filenames
 
-            if not absolute:
-                # Trim the directory path
-                dirpath = dirpath[len(self.tree.path):]
+            # Honor any pruning or reordering of the directory names
+            if topdown:
+                by_name = dict((ent.name, ent) for ent in dirs)
+                dirs[:] = [by_name[name] for name in dirnames
+                           if name in by_name]
 
-            yield dirpath, dirnames, filenames
+    @property
+    def __cache_trusted__(self):
+        """
+        Determine whether cached property values may be used without
+        validating them.  This is the case while the tree is being
+        watched for changes; see ``FSTree.watch()``.
+        """
 
-    @cacheprop.cached_property
+        return self.tree._watching
+
+    @property
     def basename(self):
         """
         Retrieve the basename of the file entry.
@@ -745,7 +1415,7 @@ class FSEntry(object):
         with open(self.path) as f:
             return f.read()
 
-    @cacheprop.cached_property
+    @property
     def dirname(self):
         """
         Retrieve the dirname of the file entry.
@@ -753,7 +1423,7 @@ class FSEntry(object):
 
         return os.path.dirname(self.name)
 
-    @cacheprop.cached_property
+    @property
     def ext(self):
         """
         Retrieve the extension of the file entry.
@@ -813,10 +1483,11 @@ class FSEntry(object):
     @property
     def lstat(self):
         """
-        Retrieve the latest result of ``os.lstat()``.
+        Retrieve the latest result of ``os.lstat()``.  If the tree has
+        a stat cache, the result may come from the cache.
         """
 
-        self._lstat = os.lstat(self.path)
+        self._lstat = self.tree._lstat_path(self.path)
         return self._lstat
 
     @property
@@ -837,13 +1508,14 @@ class FSEntry(object):
 
         return stat.S_IMODE(self.lst_mode)
 
-    @permissions.setter
+    @lpermissions.setter
     def lpermissions(self, value):
         """
         Set the permissions of the file, not following symlinks.
         """
 
         os.lchmod(self.path, value)
+        self.tree.invalidate()
 
     @property
     def permissions(self):
@@ -860,6 +1532,7 @@ class FSEntry(object):
         """
 
         os.chmod(self.path, value)
+        self.tree.invalidate()
 
     @cacheprop.cached_property
     def realpath(self):
@@ -870,7 +1543,7 @@ class FSEntry(object):
 
         return os.path.realpath(self.path)
 
-    @cacheprop.cached_property
+    @property
     def root(self):
         """
         Retrieve the root name of the file entry, that is, the part of
@@ -882,10 +1555,11 @@ class FSEntry(object):
     @property
     def stat(self):
         """
-        Retrieve the latest result of ``os.stat()``.
+        Retrieve the latest result of ``os.stat()``.  If the tree has
+        a stat cache, the result may come from the cache.
         """
 
-        self._stat = os.stat(self.path)
+        self._stat = self.tree._stat_path(self.path)
         return self._stat
 
     @property
@@ -905,7 +1579,8 @@ class FSTree(FSEntry):
     occur within the tree.
     """
 
-    def __init__(self, path, mode=0o777):
+    def __init__(self, path, mode=0o777, stat_policy=None, max_entries=None,
+                 max_bytes=None, digest_cache=None, copy_engine=None):
         """
         Initialize an ``FSTree`` instance.
 
@@ -914,7 +1589,38 @@ class FSTree(FSEntry):
         :param mode: The mode for the root directory, if it does not
                      exist.  If the directory exists, the mode is
                      ignored.
-        """
+        :param stat_policy: An optional ``statcache.StatPolicy``.  If
+                            given, the results of ``os.stat()`` and
+                            ``os.lstat()`` are cached for the whole
+                            tree, subject to the policy.
+        :param max_entries: If given, up to this many recently used
+                            entries are kept alive, along with their
+                            cached data, even when no references to
+                            them remain.
+        :param max_bytes: If given, recently used entries are kept
+                          alive as for ``max_entries``, up to this
+                          many bytes as computed by
+                          ``sys.getsizeof()``.
+        :param digest_cache: An optional
+                             ``digestcache.DigestCache``, used to
+                             avoid re-reading unchanged files when
+                             computing their digests.  May be shared
+                             between trees.
+        :param copy_engine: An optional ``copyengine.CopyEngine``,
+                            used to copy files into the tree.  If not
+                            given, a default engine is created.
+        """
+
+        # Set up the stat cache
+        self._stat_cache = (None if stat_policy is None else
+                            statcache.StatCache(stat_policy))
+
+        self._digest_cache = digest_cache
+        self._copy_engine = (copyengine.CopyEngine() if copy_engine is None
+                             else copy_engine)
+
+        # Watchers keeping the cached data up to date
+        self._watchers = []
 
         # Make sure the path is absolute, then create it if it doesn't
         # exist
@@ -925,10 +1631,22 @@ class FSTree(FSEntry):
         # Initialize the entry
         super(FSTree, self).__init__(self, '/', path)
 
-        # Keep a weak dictionary of the entries
+        # Keep a weak dictionary of the entries, fronted by an LRU
+        # cache of recently used entries if requested
         self._entries = weakref.WeakValueDictionary()
+        self._lru = (None if max_entries is None and max_bytes is None else
+                     lru.LRUCache(max_entries, max_bytes))
 
-    def _get(self, name, default=utils.unset):
+        # Set up the trash for deferred removals; this also purges
+        # anything left there by a crash.  A tree at the root of the
+        # file system has nowhere to put one, so its removals are
+        # never deferred
+        try:
+            self._trash = trash.Trash(trash.trash_path(path))
+        except ValueError:
+            self._trash = None
+
+    def _get(self, name, default=utils.unset, record=None):
         """
         Retrieve an ``FSEntry`` for the designated path.
 
@@ -936,6 +1654,10 @@ class FSTree(FSEntry):
         :param default: A default value to return if the path doesn't
                         exist.  If not provided, a ``KeyError`` will
                         be raised.
+        :param record: An optional ``dirscan.ScanEntry`` describing
+                       the path.  If given, the path is known to
+                       exist, and any stat data fetched through the
+                       record is used to seed the entry.
         """
 
         # If name is us, return ourself
@@ -946,17 +1668,29 @@ class FSTree(FSEntry):
         path = self._full(name)
 
         # Does the path even exist?
-        if not os.path.exists(path):
+        if record is None and not self._exists(path):
             if default is utils.unset:
                 raise KeyError(name)
             else:
                 return default
 
         # OK, try to find an object for it
-        entry = self._entries.get(name)
-        if not entry:
-            entry = FSEntry(self, name, path)
-            self._entries[name] = entry
+        entry = None if self._lru is None else self._lru.get(name)
+        if entry is None:
+            entry = self._entries.get(name)
+            if entry is None:
+                entry = FSEntry(self, name, path)
+                self._entries[name] = entry
+
+            # Keep it alive for a while
+            if self._lru is not None:
+                self._lru.put(name, entry)
+
+        # Seed the stat caches
+        if record is not None:
+            record.seed(entry)
+            if self._stat_cache is not None:
+                self._stat_cache.seed(path, *record.fetched())
 
         return entry
 
@@ -983,6 +1717,7 @@ class FSTree(FSEntry):
         # OK, check the type of the value
         if isinstance(value, six.string_types):
             self.copy(value, name)
+            return
         elif isinstance(value, FSEntry):
             if value.tree is self:
                 # Move the file
@@ -990,8 +1725,11 @@ class FSTree(FSEntry):
             else:
                 # Copy the file
                 self.copy(value, name)
+            return
         elif callable(value):
             value(self, name)
+            self.invalidate()
+            return
 
         # Don't know what to do with it
         raise ValueError("cannot assign a %r to a file" % value)
@@ -1019,11 +1757,214 @@ class FSTree(FSEntry):
 
         return os.path.join(self.path, name[1:])
 
-    def cleanup(self):
+    def _cached_entries(self):
+        """
+        A helper method to list the entries currently known to the
+        tree.
+
+        :returns: A list of tuples of entry name and ``FSEntry``.
+        """
+
+        while True:
+            try:
+                return list(self._entries.items())
+            except RuntimeError:
+                # Another thread changed the dictionary; try again
+                continue
+
+    def _exists(self, path):
+        """
+        Determine whether a system path exists, consulting the stat
+        cache if there is one.
+
+        :param path: The system path to check.
+
+        :returns: A ``True`` value if the path exists, ``False``
+                  otherwise.
+        """
+
+        try:
+            self._stat_path(path)
+        except OSError:
+            return False
+
+        return True
+
+    def _lstat_path(self, path):
+        """
+        Retrieve the result of ``os.lstat()`` for a system path,
+        consulting the stat cache if there is one.
+
+        :param path: The system path to stat.
+
+        :returns: The stat result.
+        """
+
+        if self._stat_cache is None:
+            return os.lstat(path)
+        return self._stat_cache.lstat(path)
+
+    def _stat_path(self, path):
+        """
+        Retrieve the result of ``os.stat()`` for a system path,
+        consulting the stat cache if there is one.
+
+        :param path: The system path to stat.
+
+        :returns: The stat result.
+        """
+
+        if self._stat_cache is None:
+            return os.stat(path)
+        return self._stat_cache.stat(path)
+
+    def _watch_event(self, event):
+        """
+        Invalidate the cached data affected by a change event.  Called
+        from the watcher's background thread.
+
+        :param event: The ``inotify.Event`` describing the change.
+        """
+
+        # On queue overflow, anything may have changed
+        if event.path is None:
+            for name, entry in self._cached_entries():
+                entry._invalidate()
+            self._invalidate()
+            self.invalidate()
+            return
+
+        # Creations, deletions, and renames change the parent
+        # directory as well
+        paths = [event.path]
+        if event.mask & inotify.DIRECTORY_EVENTS:
+            paths.append(os.path.dirname(event.path))
+
+        for path in paths:
+            try:
+                name = utils.deroot(path, self.path)
+            except ValueError:
+                continue
+
+            entry = self if name == self.name else self._entries.get(name)
+            if entry is not None:
+                entry._invalidate()
+            if self._stat_cache is not None:
+                self._stat_cache.invalidate(self._full(name))
+
+        # Directories that come or go take their contents with them
+        if event.isdir and event.mask & inotify.DIRECTORY_EVENTS:
+            prefix = utils.deroot(event.path, self.path) + '/'
+            for name, entry in self._cached_entries():
+                if name.startswith(prefix):
+                    entry._invalidate()
+            self.invalidate()
+
+    @property
+    def _watching(self):
+        """
+        Determine whether the whole tree is being watched for changes.
+        """
+
+        return any(watcher.active and watcher.complete
+                   for watcher in self._watchers)
+
+    @property
+    def cache_stats(self):
+        """
+        Retrieve the statistics of the cache of recently used entries,
+        as a dictionary with the keys "hits", "misses", "evictions",
+        "entries", and "bytes".  Returns ``None`` if the tree was not
+        configured with ``max_entries`` or ``max_bytes``.
+        """
+
+        return None if self._lru is None else self._lru.stats
+
+    def cleanup(self, workers=None, background=False):
         """
         Cleans up the file tree.  This will remove the tree and all
         its files.
+
+        :param workers: If given and greater than 1, the number of
+                        threads used to remove subdirectories
+                        concurrently.
+        :param background: If ``True``, the tree is atomically moved
+                           into the trash and removed in the
+                           background; see ``drain()``.  If it cannot
+                           be moved, it is removed immediately.
         """
 
         # Clean up!
-        shutil.rmtree(self.path)
+        if background and self._trash is not None:
+            try:
+                self._trash.discard(self.path)
+            except OSError:
+                # Can't be moved; fall back to removing it now
+                removal.rmtree(self.path, workers=workers)
+        else:
+            removal.rmtree(self.path, workers=workers)
+        self.invalidate()
+
+    def drain(self, timeout=None):
+        """
+        Wait for the removals deferred by ``FSEntry.remove()`` and
+        ``cleanup()`` to complete.
+
+        :param timeout: The maximum time to wait, in seconds.  If
+                        ``None`` (the default), waits indefinitely.
+
+        :returns: A ``True`` value if the removals completed, or
+                  ``False`` if the timeout expired first.
+        """
+
+        return self._trash is None or self._trash.wait(timeout)
+
+    def watch(self, events=True):
+        """
+        Watch the tree for changes, using Linux inotify.  While the
+        watch is active, the cached data of the entries in the tree is
+        invalidated as changes are reported, so cached property values
+        such as ``contents`` are used without checking the file's
+        modification time.  Changes are reported asynchronously, so a
+        change may not be seen by a read that immediately follows it.
+        Changes made through hard links outside the tree or beyond
+        symbolic links are not seen.
+
+        :param events: If ``True`` (the default), the change events
+                       are queued for retrieval by iterating over the
+                       returned watcher.  Pass ``False`` if only the
+                       cache invalidation is desired.
+
+        :returns: An ``inotify.Watcher`` instance.  Call its
+                  ``close()`` method, or use it as a context manager,
+                  to stop watching.  An ``OSError`` is raised if
+                  inotify is not available.
+        """
+
+        watcher = inotify.Watcher(self.path, self._watch_event, events)
+        self._watchers = ([w for w in self._watchers if w.active] +
+                          [watcher])
+
+        # Changes made before the watch began are unknown
+        for name, entry in self._cached_entries():
+            entry._invalidate()
+        self._invalidate()
+        self.invalidate()
+
+        return watcher
+
+    def invalidate(self, path=None):
+        """
+        Discard cached stat results.  This is done automatically by
+        the methods that modify the tree, but must be done explicitly
+        if the tree is modified by other means.  Does nothing if the
+        tree has no stat cache.
+
+        :param path: If given, only the results for this path are
+                     discarded.  Otherwise, all cached results are
+                     discarded.
+        """
+
+        if self._stat_cache is not None:
+            self._stat_cache.invalidate(None if path is None else
+                                        self._abs(path))
@@ -0,0 +1,475 @@
+# Copyright 2014 Kevin L. Mitchell
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import collections
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import select
+import struct
+import sys
+import threading
+
+from six.moves import queue
+
+from fstree import dirscan
+
+
+LOG = logging.getLogger(__name__)
+
+# Event masks, from <sys/inotify.h>
+IN_ACCESS = 0x00000001
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_CLOSE_NOWRITE = 0x00000010
+IN_OPEN = 0x00000020
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_UNMOUNT = 0x00002000
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_EXCL_UNLINK = 0x04000000
+IN_ISDIR = 0x40000000
+
+# Flags for inotify_init1()
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+# The events that indicate a change to the watched tree
+CHANGE_EVENTS = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM |
+                 IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF |
+                 IN_MOVE_SELF)
+
+# The events that change what a directory contains
+DIRECTORY_EVENTS = IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+# The layout of struct inotify_event, less the trailing name
+_EVENT = struct.Struct('iIII')
+
+# The size of the buffer to read events into
+_BUFSIZE = 64 * 1024
+
+# Convert file names to and from bytes
+_fsencode = getattr(os, 'fsencode', lambda x: x)
+_fsdecode = getattr(os, 'fsdecode', lambda x: x)
+
+
+class Event(collections.namedtuple('Event', ['path', 'mask', 'cookie'])):
+    """
+    Represent a change event.  The ``path`` attribute is the system
+    path of the file that changed, or ``None`` if the kernel event
+    queue overflowed, in which case any part of the tree may have
+    changed.  The ``mask`` attribute contains the ``IN_*`` flags
+    describing the change, and ``cookie`` relates the
+    ``IN_MOVED_FROM`` and ``IN_MOVED_TO`` events of a rename.
+    """
+
+    __slots__ = ()
+
+    @property
+    def isdir(self):
+        """
+        Determine whether the event concerns a directory.
+        """
+
+        return bool(self.mask & IN_ISDIR)
+
+
+class _LibC(object):
+    """
+    Lazily bind the inotify functions of the C library.
+    """
+
+    _libc = None
+
+    @classmethod
+    def get(cls):
+        """
+        Retrieve the C library.
+
+        :returns: The ``ctypes.CDLL`` for the C library, or ``None``
+                  if inotify is unavailable.
+        """
+
+        if cls._libc is None:
+            cls._libc = False
+            if sys.platform.startswith('linux'):
+                try:
+                    libc = ctypes.CDLL(ctypes.util.find_library('c') or
+                                       'libc.so.6', use_errno=True)
+                    libc.inotify_init1.argtypes = [ctypes.c_int]
+                    libc.inotify_add_watch.argtypes = [
+                        ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+                    libc.inotify_rm_watch.argtypes = [
+                        ctypes.c_int, ctypes.c_int]
+                except (OSError, AttributeError):
+                    pass
+                else:
+                    cls._libc = libc
+
+        return cls._libc or None
+
+
+def available():
+    """
+    Determine whether inotify is available.
+
+    :returns: A ``True`` value if inotify may be used, ``False``
+              otherwise.
+    """
+
+    return _LibC.get() is not None
+
+
+def _check(result):
+    """
+    Check the result of a C library call, raising ``OSError`` if it
+    indicates an error.
+
+    :param result: The result of the call.
+
+    :returns: The result.
+    """
+
+    if result < 0:
+        err = ctypes.get_errno()
+        raise OSError(err, os.strerror(err))
+    return result
+
+
+def _parse(buf):
+    """
+    Parse the events read from an inotify file descriptor.
+
+    :param buf: The bytes read.
+
+    :returns: A generator yielding tuples of the watch descriptor, the
+              event mask, the cookie, and the name, as bytes.
+    """
+
+    offset = 0
+    while offset + _EVENT.size <= len(buf):
+        wd, mask, cookie, length = _EVENT.unpack_from(buf, offset)
+        offset += _EVENT.size
+        yield wd, mask, cookie, buf[offset:offset + length].rstrip(b'\0')
+        offset += length
+
+
+class Watcher(object):
+    """
+    Watch a directory tree for changes using Linux inotify.  A
+    background thread reads the change events; each event is passed
+    to a callback and, optionally, queued for retrieval by iterating
+    over the ``Watcher``.
+    """
+
+    def __init__(self, path, callback=None, events=True, recursive=True):
+        """
+        Initialize a ``Watcher`` object and begin watching.
+
+        :param path: The system path of the directory to watch.
+        :param callback: An optional callable, which will be called
+                         from the background thread with each
+                         ``Event``.  If it raises an exception, the
+                         exception is logged, the watcher is marked
+                         incomplete, and the callback is called again
+                         with an overflow ``Event``.
+        :param events: If ``True`` (the default), events are queued
+                       for retrieval by iterating over the
+                       ``Watcher``.  If events are not consumed, the
+                       queue grows without bound.
+        :param recursive: If ``True`` (the default), all directories
+                          in the tree are watched, including those
+                          created later.  Otherwise, only ``path``
+                          itself is watched.
+        """
+
+        self._libc = _LibC.get()
+        if self._libc is None:
+            raise OSError(errno.ENOSYS, "inotify is not available")
+
+        self.path = path
+        self.callback = callback
+        self.recursive = recursive
+
+        # Set to False if any directory in the tree could not be
+        # watched, e.g., if the watch limit was reached, or if an
+        # event could not be handled
+        self.complete = True
+
+        self._queue = queue.Queue() if events else None
+        self._watches = {}
+        self._closed = False
+
+        self._fd = _check(self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC))
+        self._wake_r, self._wake_w = os.pipe()
+        try:
+            self._add_tree(path)
+        except Exception:
+            self._close_fds()
+            raise
+
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def __enter__(self):
+        """
+        Enter a context manager.  The watcher is closed when the
+        context manager exits.
+        """
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        """
+        Exit a context manager, closing the watcher.
+        """
+
+        self.close()
+
+    def __iter__(self):
+        """
+        Iterate over the change events.  Blocks waiting for events
+        until the watcher is closed.
+        """
+
+        if self._queue is None:
+            raise ValueError("watcher is not queuing events")
+
+        while True:
+            event = self._queue.get()
+            if event is None:
+                # Leave the end marker for other consumers
+                self._queue.put(None)
+                break
+            yield event
+
+    def _add_watch(self, path):
+        """
+        Add a watch on a single directory.  Failures are recorded by
+        clearing the ``complete`` attribute.
+
+        :param path: The system path of the directory.
+        """
+
+        try:
+            wd = _check(self._libc.inotify_add_watch(
+                self._fd, _fsencode(path),
+                CHANGE_EVENTS | IN_ONLYDIR | IN_DONT_FOLLOW |
+                IN_EXCL_UNLINK))
+        except OSError:
+            self.complete = False
+            return
+
+        self._watches[wd] = path
+
+    def _add_tree(self, path):
+        """
+        Add watches on a directory and, if watching recursively, all
+        of its subdirectories.
+
+        :param path: The system path of the directory.
+        """
+
+        self._add_watch(path)
+        if not self.recursive:
+            return
+
+        for dirpath, dirs, files in dirscan.walk(path):
+            for ent in dirs:
+                if not ent.is_symlink():
+                    self._add_watch(ent.path)
+
+    def _dispatch(self, event):
+        """
+        Hand an event to the callback and the queue.
+
+        :param event: The ``Event`` to dispatch.
+        """
+
+        if self.callback is not None:
+            try:
+                self.callback(event)
+            except Exception:
+                LOG.exception("inotify callback failed for %s", event.path)
+                self._failed()
+        if self._queue is not None:
+            self._queue.put(event)
+
+    def _failed(self):
+        """
+        Note that an event could not be handled.  The watcher is no
+        longer complete, and the callback is told that anything may
+        have changed, as if the kernel event queue had overflowed.
+        """
+
+        self.complete = False
+        if self.callback is None:
+            return
+
+        try:
+            self.callback(Event(None, IN_Q_OVERFLOW, 0))
+        except Exception:
+            LOG.exception("inotify callback failed to resynchronize")
+
+    def _run(self):
+        """
+        The body of the background thread.  Reads and dispatches
+        events until the watcher is closed.
+        """
+
+        try:
+            while True:
+                readable = select.select([self._fd, self._wake_r], [], [])[0]
+                if self._wake_r in readable:
+                    # Dispatch the events that have already arrived
+                    while self._read():
+                        pass
+                    break
+
+                self._read()
+        finally:
+            if self._queue is not None:
+                self._queue.put(None)
+
+    def _read(self):
+        """
+        Read and dispatch the available events.
+
+        :returns: A ``True`` value if any events were read, ``False``
+                  otherwise.
+        """
+
+        try:
+            buf = os.read(self._fd, _BUFSIZE)
+        except OSError as err:
+            if err.errno in (errno.EAGAIN, errno.EINTR):
+                return False
+            raise
+
+        for wd, mask, cookie, name in _parse(buf):
+            # Keep watching even if an event can't be handled
+            try:
+                self._handle(wd, mask, cookie, name)
+            except Exception:
+                LOG.exception("failed to handle inotify event")
+                self._failed()
+
+        return bool(buf)
+
+    def _handle(self, wd, mask, cookie, name):
+        """
+        Handle a single event read from the kernel.
+
+        :param wd: The watch descriptor.
+        :param mask: The event mask.
+        :param cookie: The event cookie.
+        :param name: The name of the file within the watched
+                     directory, as bytes; empty if the event concerns
+                     the directory itself.
+        """
+
+        # The kernel dropped events; anything may have changed
+        if mask & IN_Q_OVERFLOW:
+            self._dispatch(Event(None, mask, cookie))
+            return
+
+        dirpath = self._watches.get(wd)
+        if dirpath is None:
+            return
+
+        # The watch was removed, e.g., because the directory was
+        # deleted
+        if mask & IN_IGNORED:
+            del self._watches[wd]
+            return
+
+        path = os.path.join(dirpath, _fsdecode(name)) if name else dirpath
+
+        # Watch new subdirectories
+        if (self.recursive and mask & IN_ISDIR and
+                mask & (IN_CREATE | IN_MOVED_TO)):
+            self._add_tree(path)
+
+        self._dispatch(Event(path, mask, cookie))
+
+    def _close_fds(self):
+        """
+        Close the file descriptors.
+        """
+
+        for fd in (self._fd, self._wake_r, self._wake_w):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+    def close(self):
+        """
+        Stop watching.  Events that have already arrived are
+        dispatched, then the background thread exits.  Must not be
+        called from the callback.
+        """
+
+        if self._closed:
+            return
+
+        self._closed = True
+        os.write(self._wake_w, b'x')
+        self._thread.join()
+        self._close_fds()
+
+    def get(self, timeout=None):
+        """
+        Retrieve the next change event.
+
+        :param timeout: The maximum time to wait, in seconds.  If
+                        ``None`` (the default), waits indefinitely.
+
+        :returns: The next ``Event``, or ``None`` if no event arrived
+                  within the timeout or the watcher was closed.
+        """
+
+        if self._queue is None:
+            raise ValueError("watcher is not queuing events")
+
+        try:
+            event = self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+        if event is None:
+            # Leave the end marker for other consumers
+            self._queue.put(None)
+
+        return event
+
+    @property
+    def active(self):
+        """
+        Determine whether the watcher is still watching.
+        """
+
+        return not self._closed and self._thread.is_alive()
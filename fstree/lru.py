@@ -0,0 +1,188 @@
+# Copyright 2014 Kevin L. Mitchell
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import collections
+import sys
+import threading
+
+from fstree import utils
+
+
+class LRUCache(object):
+    """
+    A cache holding strong references to a bounded number of values.
+    When either the maximum number of entries or the byte budget is
+    exceeded, the least recently used values are evicted.  Counts of
+    hits, misses, and evictions are maintained.
+    """
+
+    def __init__(self, max_entries=None, max_bytes=None, sizer=sys.getsizeof):
+        """
+        Initialize an ``LRUCache`` object.
+
+        :param max_entries: The maximum number of values to hold.  If
+                            ``None``, the number is unbounded.
+        :param max_bytes: The maximum total size of the values, as
+                          computed by ``sizer``.  If ``None``, the
+                          size is unbounded.
+        :param sizer: A callable that computes the size of a value in
+                      bytes.  Sizes are recomputed whenever a value is
+                      accessed, so values that grow while cached are
+                      accounted for.  Defaults to ``sys.getsizeof()``.
+        """
+
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizer = sizer
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bytes = 0
+
+        # Maps keys to (value, size), least recently used first
+        self._cache = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        """
+        Return the number of values in the cache.
+        """
+
+        return len(self._cache)
+
+    def __contains__(self, key):
+        """
+        Determine whether a key is in the cache.  This does not count
+        as a use of the value.
+
+        :param key: The key to look for.
+
+        :returns: A ``True`` value if the key is in the cache,
+                  ``False`` otherwise.
+        """
+
+        return key in self._cache
+
+    def _store(self, key, value):
+        """
+        A helper method to store a value as the most recently used,
+        then evict values until the cache is within its bounds.  The
+        lock must be held.
+
+        :param key: The key to store the value under.
+        :param value: The value to store.
+        """
+
+        # Remove the old value, if any
+        old = self._cache.pop(key, None)
+        if old is not None:
+            self.bytes -= old[1]
+
+        # Store the new one
+        size = self.sizer(value) if self.max_bytes is not None else 0
+        self._cache[key] = (value, size)
+        self.bytes += size
+
+        # Evict values until we're within bounds; the value just
+        # stored is never evicted
+        while len(self._cache) > 1 and (
+                (self.max_entries is not None and
+                 len(self._cache) > self.max_entries) or
+                (self.max_bytes is not None and
+                 self.bytes > self.max_bytes)):
+            _key, (_value, size) = self._cache.popitem(last=False)
+            self.bytes -= size
+            self.evictions += 1
+
+    def get(self, key, default=None):
+        """
+        Retrieve a value from the cache, marking it as the most
+        recently used.
+
+        :param key: The key to look up.
+        :param default: The value to return if the key is not in the
+                        cache.
+
+        :returns: The cached value, or ``default``.
+        """
+
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is None:
+                self.misses += 1
+                return default
+
+            self.hits += 1
+            self._store(key, cached[0])
+
+            return cached[0]
+
+    def put(self, key, value):
+        """
+        Store a value in the cache, marking it as the most recently
+        used.  Other values may be evicted as a result.
+
+        :param key: The key to store the value under.
+        :param value: The value to store.
+        """
+
+        with self._lock:
+            self._store(key, value)
+
+    def pop(self, key, default=None):
+        """
+        Remove a value from the cache.  This is not counted as an
+        eviction.
+
+        :param key: The key to remove.
+        :param default: The value to return if the key is not in the
+                        cache.
+
+        :returns: The removed value, or ``default``.
+        """
+
+        with self._lock:
+            cached = self._cache.pop(key, utils.unset)
+            if cached is utils.unset:
+                return default
+
+            self.bytes -= cached[1]
+            return cached[0]
+
+    def clear(self):
+        """
+        Remove all values from the cache.  This is not counted as
+        an eviction.
+        """
+
+        with self._lock:
+            self._cache.clear()
+            self.bytes = 0
+
+    @property
+    def stats(self):
+        """
+        Retrieve a dictionary of cache statistics.  The keys are
+        "hits", "misses", "evictions", "entries", and "bytes".
+        """
+
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'entries': len(self._cache),
+            'bytes': self.bytes,
+        }
@@ -0,0 +1,330 @@
+# Copyright 2014 Kevin L. Mitchell
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from concurrent import futures
+import os
+import stat
+
+from fstree import dirscan
+from fstree import utils
+
+
+# Convert file names to bytes
+_fsencode = getattr(os, 'fsencode', lambda x: x)
+
+
+def _hash_file(path, algorithm):
+    """
+    Compute the digest of the contents of a file.  This is a module
+    level function so that it may be run in a process pool.
+
+    :param path: The system path of the file.
+    :param algorithm: The name of the hash algorithm.
+
+    :returns: The hex digest of the file.
+    """
+
+    return utils.digest_file(path, (utils.get_hasher(algorithm)(),))
+
+
+def _hash_bytes(data, algorithm):
+    """
+    Compute the digest of a byte string.
+
+    :param data: The bytes to digest.
+    :param algorithm: The name of the hash algorithm.
+
+    :returns: The hex digest of the data.
+    """
+
+    digester = utils.get_hasher(algorithm)()
+    digester.update(data)
+    return digester.hexdigest()
+
+
+def _hash_stat(st, algorithm):
+    """
+    Compute the metadata fingerprint of a file: the digest of its
+    size and modification time.
+
+    :param st: The result of ``os.lstat()`` for the file.
+    :param algorithm: The name of the hash algorithm.
+
+    :returns: The hex digest of the metadata.
+    """
+
+    return _hash_bytes(('%d %d' % (st.st_size, utils.mtime_ns(st)))
+                       .encode('ascii'), algorithm)
+
+
+class _Node(object):
+    """
+    Track a single entry of the tree while its digest is computed.
+    The digest may be a string or a future resolving to a string.
+    """
+
+    __slots__ = ('name', 'mode', 'digest')
+
+    def __init__(self, name, mode, digest=None):
+        """
+        Initialize a ``_Node`` object.
+
+        :param name: The name of the entry within its directory, as
+                     bytes.
+        :param mode: The ``st_mode`` of the entry.
+        :param digest: The digest of the entry, or a future.
+        """
+
+        self.name = name
+        self.mode = mode
+        self.digest = digest
+
+    def line(self):
+        """
+        Compute the line describing this entry in the digest of its
+        directory.
+
+        :returns: The line, as bytes.
+        """
+
+        digest = self.digest
+        if isinstance(digest, futures.Future):
+            digest = digest.result()
+
+        return (('%o ' % self.mode).encode('ascii') + self.name + b'\0' +
+                digest.encode('ascii') + b'\n')
+
+
+class _Hasher(object):
+    """
+    Compute the Merkle digest of a directory tree.
+    """
+
+    def __init__(self, algorithm, metadata, cache, executor):
+        """
+        Initialize a ``_Hasher`` object.
+
+        :param algorithm: The name of the hash algorithm.
+        :param metadata: If ``True``, files are fingerprinted by their
+                         stat data rather than their contents.
+        :param cache: A ``digestcache.DigestCache`` or ``None``.
+        :param executor: A ``concurrent.futures.Executor`` for
+                         hashing file contents, or ``None`` to hash
+                         them in the calling thread.
+        """
+
+        self.algorithm = algorithm
+        self.metadata = metadata
+        self.cache = cache
+        self.executor = executor
+
+    def _file(self, path, st):
+        """
+        Begin computing the digest of a regular file.
+
+        :param path: The system path of the file.
+        :param st: The result of ``os.lstat()`` for the file.
+
+        :returns: The hex digest, or a future resolving to it.
+        """
+
+        if self.metadata:
+            return _hash_stat(st, self.algorithm)
+
+        # See if the digest is cached
+        key = None
+        if self.cache is not None:
+            key, digest = self.cache.lookup(path, self.algorithm)
+            if digest is not None:
+                return digest
+
+        if self.executor is None:
+            digest = _hash_file(path, self.algorithm)
+            if key is not None:
+                self.cache.update(path, key, digest)
+            return digest
+
+        def done(fut):
+            if not fut.exception():
+                self.cache.update(path, key, fut.result())
+
+        fut = self.executor.submit(_hash_file, path, self.algorithm)
+        if key is not None:
+            fut.add_done_callback(done)
+        return fut
+
+    def entry(self, path, st):
+        """
+        Begin computing the digest of a non-directory entry.
+
+        :param path: The system path of the entry.
+        :param st: The result of ``os.lstat()`` for the entry.
+
+        :returns: The hex digest, or a future resolving to it.
+        """
+
+        if stat.S_ISREG(st.st_mode):
+            return self._file(path, st)
+        elif stat.S_ISLNK(st.st_mode):
+            return _hash_bytes(_fsencode(os.readlink(path)), self.algorithm)
+
+        # Devices, sockets, and FIFOs have no contents to hash
+        return _hash_bytes(b'', self.algorithm)
+
+    def directory(self, nodes):
+        """
+        Compute the digest of a directory from the digests of its
+        entries.
+
+        :param nodes: A list of ``_Node`` objects for the entries.
+
+        :returns: The hex digest.
+        """
+
+        digester = utils.get_hasher(self.algorithm)()
+        for node in sorted(nodes, key=lambda n: n.name):
+            digester.update(node.line())
+        return digester.hexdigest()
+
+    def tree(self, root, ignore, workers):
+        """
+        Compute the digest of a directory tree.
+
+        :param root: The system path of the directory.
+        :param ignore: An optional callable, as for
+                       ``dirscan.walk()``.
+        :param workers: The number of threads for listing
+                        directories, or ``None``.
+
+        :returns: The hex digest.
+        """
+
+        def onerror(err):
+            raise err
+
+        # Walk the tree top-down, starting the file digests as we go
+        listings = []
+        nodes = {}
+        for dirpath, dirs, files in dirscan.walk(root, onerror=onerror,
+                                                 ignore=ignore,
+                                                 workers=workers):
+            children = []
+            for ent in dirs[:]:
+                if ent.is_symlink():
+                    # Not traversed; describe the link itself
+                    dirs.remove(ent)
+                    files.append(ent)
+                    continue
+
+                node = _Node(_fsencode(ent.name), ent.lstat().st_mode)
+                nodes[ent.path] = node
+                children.append(node)
+            for ent in files:
+                st = ent.lstat()
+                children.append(_Node(_fsencode(ent.name), st.st_mode,
+                                      self.entry(ent.path, st)))
+            listings.append((dirpath, children))
+
+        # Combine the digests bottom-up; directories are listed before
+        # their subdirectories, so go in reverse
+        digest = None
+        for dirpath, children in reversed(listings):
+            digest = self.directory(children)
+            if dirpath in nodes:
+                nodes[dirpath].digest = digest
+
+        return digest
+
+
+def combine(entries, algorithm=utils.DEFAULT_HASHER):
+    """
+    Compute the Merkle digest of a directory from the digests of its
+    entries, exactly as ``digest()`` does.  This allows trees which
+    are not on the file system, such as the contents of tar files, to
+    be compared with directories.
+
+    :param entries: An iterable of tuples of the name, the
+                    ``st_mode``, and the hex digest of each entry of
+                    the directory.
+    :param algorithm: The name of the hash algorithm.
+
+    :returns: The hex digest.
+    """
+
+    hasher = _Hasher(algorithm, False, None, None)
+    return hasher.directory([
+        _Node(name if isinstance(name, bytes) else _fsencode(name), mode,
+              digest)
+        for name, mode, digest in entries
+    ])
+
+
+def digest(path, algorithm=utils.DEFAULT_HASHER, metadata=False, ignore=None,
+           workers=None, processes=False, cache=None):
+    """
+    Compute a Merkle digest of a directory tree.  Each directory is
+    digested from a canonical listing of its entries, sorted by name,
+    giving the mode, name, and digest of each entry; files contribute
+    the digest of their contents, symbolic links the digest of their
+    target, and subdirectories their own Merkle digest.  Symbolic
+    links are not followed.  The result depends only on the names,
+    modes, and contents of the entries, so it is stable across
+    copies of the tree.
+
+    :param path: The system path of the directory.  If it is not a
+                 directory, the digest of that single file is
+                 returned.
+    :param algorithm: The name of the hash algorithm.
+    :param metadata: If ``True``, regular files contribute the digest
+                     of their size and modification time, rather than
+                     of their contents.  This is a cheap fingerprint
+                     which never reads file data, but which differs
+                     between copies of the tree.
+    :param ignore: An optional callable.  This callable will be called
+                   with the absolute directory path and a list of
+                   files and directories in that directory; it should
+                   return a list of file and directory names which
+                   should be omitted from the digest.
+    :param workers: If given and greater than 1, the number of workers
+                    used to hash file contents and to list
+                    directories.
+    :param processes: If ``True``, file contents are hashed in a
+                      process pool rather than a thread pool.
+    :param cache: An optional ``digestcache.DigestCache`` used to
+                  avoid re-reading unchanged files.
+
+    :returns: The hex digest.
+    """
+
+    # Set up the executor
+    executor = None
+    if workers and workers > 1 and not metadata:
+        executor = (futures.ProcessPoolExecutor(workers) if processes else
+                    futures.ThreadPoolExecutor(workers))
+
+    try:
+        hasher = _Hasher(algorithm, metadata, cache, executor)
+
+        # A symbolic link given as the root is followed
+        st = os.stat(path)
+        if not stat.S_ISDIR(st.st_mode):
+            result = hasher.entry(path, st)
+            return (result.result() if isinstance(result, futures.Future)
+                    else result)
+
+        return hasher.tree(os.path.normpath(path), ignore, workers)
+    finally:
+        if executor is not None:
+            executor.shutdown()
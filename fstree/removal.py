@@ -0,0 +1,329 @@
+# Copyright 2014 Kevin L. Mitchell
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from concurrent import futures
+import collections
+import os
+import shutil
+import sys
+import threading
+
+
+# The flags for opening a directory without following symbolic links
+_DIR_FLAGS = (os.O_RDONLY | getattr(os, 'O_DIRECTORY', 0) |
+              getattr(os, 'O_NOFOLLOW', 0) | getattr(os, 'O_CLOEXEC', 0))
+
+
+def fd_relative():
+    """
+    Determine whether the platform supports removing trees relative
+    to directory file descriptors.
+
+    :returns: A ``True`` value if ``rmtree()`` can use file
+              descriptors, ``False`` otherwise.
+    """
+
+    return (getattr(os, 'supports_fd', None) is not None and
+            os.scandir in os.supports_fd and
+            os.open in os.supports_dir_fd and
+            os.unlink in os.supports_dir_fd and
+            os.rmdir in os.supports_dir_fd)
+
+
+class _Directory(object):
+    """
+    Track the removal of a single directory.  The directory can be
+    removed once it has been listed and all of its subdirectories have
+    been removed.
+    """
+
+    __slots__ = ('parent', 'name', 'path', 'st', 'fd', 'pending')
+
+    def __init__(self, parent, name, path, st):
+        """
+        Initialize a ``_Directory`` object.
+
+        :param parent: The ``_Directory`` containing this one, or
+                       ``None`` for the top of the tree.
+        :param name: The name of the directory within its parent.
+        :param path: The system path of the directory, for error
+                     reports.
+        :param st: The result of ``os.lstat()`` for the directory.
+                   Reset to ``None`` if the directory could not be
+                   opened, in which case it is not removed.
+        """
+
+        self.parent = parent
+        self.name = name
+        self.path = path
+        self.st = st
+        self.fd = None
+
+        # Counts the listing of this directory, plus each
+        # subdirectory not yet removed
+        self.pending = 1
+
+
+class _Remover(object):
+    """
+    Remove a directory tree.  Each directory is listed, and its files
+    unlinked, relative to a file descriptor for the directory, so the
+    removal cannot be redirected outside the tree by a concurrent
+    rename or symbolic link.  Subdirectories are independent, so they
+    may be processed concurrently.  The most recently found
+    directories are processed first, so the tree is walked depth
+    first, and only the directories on the paths being worked on are
+    held open.
+    """
+
+    def __init__(self, executor, workers=1):
+        """
+        Initialize a ``_Remover`` object.
+
+        :param executor: A ``concurrent.futures.Executor`` to process
+                         subdirectories with, or ``None`` to process
+                         them in the calling thread.
+        :param workers: The number of threads of the executor to
+                        use.
+        """
+
+        self.executor = executor
+        self.workers = workers
+        self.errors = []
+        self.done = threading.Event()
+        self._lock = threading.Lock()
+        self._ready = threading.Condition(self._lock)
+        self._queue = collections.deque()
+
+    def _error(self, func, path):
+        """
+        Record an error.  Must be called from an exception handler.
+
+        :param func: The function which raised the error.
+        :param path: The path the function was called with.
+        """
+
+        with self._lock:
+            self.errors.append((func, path, sys.exc_info()))
+
+    def _submit(self, directory):
+        """
+        Arrange for a directory to be processed.
+
+        :param directory: The ``_Directory`` to process.
+        """
+
+        with self._lock:
+            self._queue.append(directory)
+            self._ready.notify()
+
+    def _work(self):
+        """
+        Process directories until the whole tree has been removed.
+        Run in each thread of the executor.
+        """
+
+        while True:
+            with self._lock:
+                while not self._queue and not self.done.is_set():
+                    self._ready.wait()
+                if self.done.is_set():
+                    return
+                directory = self._queue.pop()
+
+            try:
+                self._process(directory)
+            except BaseException:
+                # Stop the other threads, so the caller sees the
+                # exception instead of waiting forever
+                with self._lock:
+                    self.done.set()
+                    self._ready.notify_all()
+                raise
+
+    def _process(self, directory):
+        """
+        Open and list a directory, unlinking its files and submitting
+        its subdirectories.
+
+        :param directory: The ``_Directory`` to process.
+        """
+
+        try:
+            self._list(directory)
+        except Exception:
+            self._error(os.scandir, directory.path)
+        finally:
+            self._finished(directory)
+
+    def _list(self, directory):
+        """
+        A helper for ``_process()`` which does the work.
+
+        :param directory: The ``_Directory`` to process.
+        """
+
+        # Open the directory, making sure it's the one we listed
+        parent_fd = None if directory.parent is None else directory.parent.fd
+        try:
+            fd = os.open(directory.name, _DIR_FLAGS, dir_fd=parent_fd)
+        except OSError:
+            directory.st = None
+            self._error(os.open, directory.path)
+            return
+        if not os.path.samestat(directory.st, os.fstat(fd)):
+            os.close(fd)
+            directory.st = None
+            try:
+                raise OSError("directory changed during removal")
+            except OSError:
+                self._error(os.open, directory.path)
+            return
+        directory.fd = fd
+
+        with os.scandir(fd) as entries:
+            entries = list(entries)
+
+        for ent in entries:
+            path = os.path.join(directory.path, ent.name)
+            try:
+                isdir = ent.is_dir(follow_symlinks=False)
+                st = ent.stat(follow_symlinks=False) if isdir else None
+            except OSError:
+                isdir = False
+
+            if isdir:
+                with self._lock:
+                    directory.pending += 1
+                self._submit(_Directory(directory, ent.name, path, st))
+                continue
+
+            try:
+                os.unlink(ent.name, dir_fd=fd)
+            except OSError:
+                self._error(os.unlink, path)
+
+    def _finished(self, directory):
+        """
+        Note that part of the work on a directory is finished.  Once
+        all of it is, the directory is removed and its parent is
+        notified in turn.
+
+        :param directory: The ``_Directory``.
+        """
+
+        while directory is not None:
+            with self._lock:
+                directory.pending -= 1
+                if directory.pending:
+                    return
+
+            if directory.fd is not None:
+                os.close(directory.fd)
+                directory.fd = None
+
+            parent = directory.parent
+            try:
+                if directory.st is None:
+                    # Couldn't open it, so don't remove it
+                    pass
+                elif parent is None:
+                    os.rmdir(directory.path)
+                else:
+                    os.rmdir(directory.name, dir_fd=parent.fd)
+            except OSError:
+                self._error(os.rmdir, directory.path)
+
+            if parent is None:
+                with self._lock:
+                    self.done.set()
+                    self._ready.notify_all()
+            directory = parent
+
+    def run(self, path):
+        """
+        Remove a directory tree.
+
+        :param path: The system path of the directory.
+        """
+
+        try:
+            st = os.lstat(path)
+        except OSError:
+            self._error(os.lstat, path)
+            return
+
+        self._submit(_Directory(None, path, path, st))
+        if self.executor is None:
+            while self._queue:
+                self._process(self._queue.pop())
+        else:
+            workers = [self.executor.submit(self._work)
+                       for i in range(self.workers)]
+            for worker in workers:
+                worker.result()
+
+
+def rmtree(path, ignore_errors=False, onerror=None, workers=None):
+    """
+    Remove a directory tree, as ``shutil.rmtree()``.  Directories are
+    opened and their entries removed relative to the directory file
+    descriptors, avoiding symbolic link races and repeated path
+    lookups.  If the platform does not support this,
+    ``shutil.rmtree()`` is used.
+
+    :param path: The system path of the directory to remove.
+    :param ignore_errors: If ``True``, errors are ignored, regardless
+                          of the value of ``onerror``.
+    :param onerror: An optional callable which, if ``ignore_errors``
+                    is ``False``, will be called with three arguments
+                    for each error: the function that was called, the
+                    path the function was called with, and the
+                    exception information (as returned by
+                    ``sys.exc_info()``).  If not provided, and
+                    ``ignore_errors`` is ``False``, the first error is
+                    raised.  Errors are reported once the removal
+                    is complete, so as much of the tree as possible
+                    is removed.
+    :param workers: If given and greater than 1, the number of threads
+                    used to remove subdirectories concurrently.
+    """
+
+    if not fd_relative():  # pragma: no cover
+        return shutil.rmtree(path, ignore_errors, onerror)
+
+    # Refuse to follow a symbolic link, as shutil.rmtree() does
+    if os.path.islink(path):
+        try:
+            raise OSError("Cannot call rmtree on a symbolic link")
+        except OSError:
+            errors = [(os.path.islink, path, sys.exc_info())]
+    elif workers and workers > 1:
+        with futures.ThreadPoolExecutor(workers) as executor:
+            remover = _Remover(executor, workers)
+            remover.run(path)
+        errors = remover.errors
+    else:
+        remover = _Remover(None)
+        remover.run(path)
+        errors = remover.errors
+
+    # Report the errors
+    if ignore_errors:
+        return
+    for func, errpath, exc_info in errors:
+        if onerror is None:
+            raise exc_info[1]
+        onerror(func, errpath, exc_info)
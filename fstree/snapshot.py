@@ -0,0 +1,389 @@
+# Copyright 2014 Kevin L. Mitchell
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import collections
+import json
+import os
+import stat
+
+from fstree import dirscan
+from fstree import utils
+
+
+# The entry types recorded in a manifest
+FILE = 'file'
+DIRECTORY = 'directory'
+SYMLINK = 'symlink'
+OTHER = 'other'
+
+
+class ManifestEntry(collections.namedtuple('ManifestEntry', [
+        'name', 'type', 'size', 'mode', 'mtime_ns', 'ino', 'dev', 'target',
+        'digest'])):
+    """
+    Describe a single entry in a ``Snapshot``.  The ``name`` is
+    relative to the root of the snapshot, in the same form as
+    ``FSEntry.name``; ``type`` is one of ``FILE``, ``DIRECTORY``,
+    ``SYMLINK``, or ``OTHER``; ``target`` is the target of a symbolic
+    link; and ``digest`` is the hex digest of a regular file, if
+    digests were requested.  The remaining fields come from
+    ``os.lstat()``.
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def from_stat(cls, name, st, target=None, digest=None):
+        """
+        Construct a ``ManifestEntry`` from a stat result.
+
+        :param name: The name of the entry.
+        :param st: The result of ``os.lstat()`` for the entry.
+        :param target: The target of a symbolic link.
+        :param digest: The hex digest of a regular file.
+
+        :returns: A ``ManifestEntry`` instance.
+        """
+
+        if stat.S_ISREG(st.st_mode):
+            ftype = FILE
+        elif stat.S_ISDIR(st.st_mode):
+            ftype = DIRECTORY
+        elif stat.S_ISLNK(st.st_mode):
+            ftype = SYMLINK
+        else:
+            ftype = OTHER
+
+        return cls(name, ftype, st.st_size, stat.S_IMODE(st.st_mode),
+                   utils.mtime_ns(st), st.st_ino, st.st_dev, target, digest)
+
+    @property
+    def identity(self):
+        """
+        Retrieve the identity of the file: a tuple of the device and
+        inode numbers.
+        """
+
+        return (self.dev, self.ino)
+
+    def same_stat(self, other):
+        """
+        Determine whether the stat data of another entry shows that it
+        is unchanged from this one.  Identical stat data implies
+        identical contents, so no digest is needed.
+
+        :param other: The other ``ManifestEntry``.
+
+        :returns: A ``True`` value if the two entries have identical
+                  stat data, ``False`` otherwise.
+        """
+
+        return (self.type == other.type and self.size == other.size and
+                self.mtime_ns == other.mtime_ns and
+                self.identity == other.identity)
+
+
+class Snapshot(object):
+    """
+    Represent a manifest of every entry in a directory tree at a
+    point in time.  The entries may be looked up by name, and
+    iteration yields the entries in name order.
+    """
+
+    def __init__(self, entries=(), hasher=None):
+        """
+        Initialize a ``Snapshot`` object.
+
+        :param entries: A sequence of ``ManifestEntry`` instances.
+        :param hasher: The name of the hash algorithm used to compute
+                       the digests of the entries, or ``None`` if no
+                       digests were computed.
+        """
+
+        self.hasher = hasher
+        self.entries = dict((ent.name, ent) for ent in entries)
+
+    def __len__(self):
+        """
+        Return the number of entries in the snapshot.
+        """
+
+        return len(self.entries)
+
+    def __iter__(self):
+        """
+        Iterate over the entries, in name order.
+        """
+
+        for name in sorted(self.entries):
+            yield self.entries[name]
+
+    def __contains__(self, name):
+        """
+        Determine whether the snapshot contains an entry.
+
+        :param name: The name of the entry.
+
+        :returns: A ``True`` value if the snapshot contains the entry,
+                  ``False`` otherwise.
+        """
+
+        return name in self.entries
+
+    def __getitem__(self, name):
+        """
+        Retrieve an entry.  A ``KeyError`` will be raised if the
+        snapshot does not contain the entry.
+
+        :param name: The name of the entry.
+
+        :returns: The ``ManifestEntry``.
+        """
+
+        return self.entries[name]
+
+    @classmethod
+    def take(cls, root, hasher=None, ignore=None, previous=None,
+             workers=None, cache=None):
+        """
+        Take a snapshot of a directory tree.  Symbolic links are
+        recorded, but not followed.
+
+        :param root: The system path of the root of the tree.
+        :param hasher: The name of a hash algorithm.  If given, the
+                       digest of each regular file is recorded.
+        :param ignore: An optional callable.  This callable will be
+                       called with the absolute directory path and a
+                       list of files and directories in that
+                       directory; it should return a list of file and
+                       directory names which should be omitted from
+                       the snapshot.
+        :param previous: An optional earlier ``Snapshot`` of the same
+                         tree taken with the same ``hasher``.  The
+                         digests of files whose stat data is unchanged
+                         are copied from it rather than recomputed.
+        :param workers: If given, the number of threads to use for
+                        listing directories.  See ``dirscan.walk()``.
+        :param cache: An optional ``digestcache.DigestCache`` to
+                      compute the digests with.
+
+        :returns: A ``Snapshot`` instance.
+        """
+
+        if previous is not None and previous.hasher != hasher:
+            previous = None
+
+        root = os.path.normpath(root)
+        entries = []
+        for dirpath, dirs, files in dirscan.walk(root, ignore=ignore,
+                                                 workers=workers):
+            for ent in dirs + files:
+                try:
+                    entries.append(cls._describe(root, ent, hasher,
+                                                 previous, cache))
+                except OSError:
+                    # The entry vanished while we were working
+                    continue
+
+        return cls(entries, hasher)
+
+    @staticmethod
+    def _describe(root, ent, hasher, previous, cache):
+        """
+        A helper method to compute the ``ManifestEntry`` for a single
+        directory entry.
+
+        :param root: The system path of the root of the tree.
+        :param ent: The ``dirscan.ScanEntry`` to describe.
+        :param hasher: The name of a hash algorithm, or ``None``.
+        :param previous: An earlier ``Snapshot`` or ``None``.
+        :param cache: A ``digestcache.DigestCache`` or ``None``.
+
+        :returns: A ``ManifestEntry`` instance.
+        """
+
+        st = ent.lstat()
+        name = utils.deroot(ent.path, root)
+
+        if stat.S_ISLNK(st.st_mode):
+            return ManifestEntry.from_stat(name, st, os.readlink(ent.path))
+
+        result = ManifestEntry.from_stat(name, st)
+        if hasher and result.type == FILE:
+            # See if the digest is already known
+            old = previous.entries.get(name) if previous else None
+            if old is not None and old.digest and old.same_stat(result):
+                digest = old.digest
+            elif cache is not None:
+                digest = cache.digest(ent.path, hasher)
+            else:
+                digest = utils.digest_file(
+                    ent.path, (utils.get_hasher(hasher)(),))
+
+            result = result._replace(digest=digest)
+
+        return result
+
+    def dump(self, fo):
+        """
+        Write the snapshot to a file as JSON.
+
+        :param fo: A file object open for writing text.
+        """
+
+        json.dump({
+            'hasher': self.hasher,
+            'entries': [list(ent) for ent in self],
+        }, fo)
+
+    @classmethod
+    def load(cls, fo):
+        """
+        Read a snapshot written by ``dump()``.
+
+        :param fo: A file object open for reading text.
+
+        :returns: A ``Snapshot`` instance.
+        """
+
+        data = json.load(fo)
+        return cls((ManifestEntry(*ent) for ent in data['entries']),
+                   data['hasher'])
+
+
+class SnapshotDiff(collections.namedtuple('SnapshotDiff', [
+        'added', 'removed', 'modified', 'renamed'])):
+    """
+    Describe the differences between two snapshots.  The ``added``,
+    ``removed``, and ``modified`` attributes are sorted lists of entry
+    names, and ``renamed`` is a sorted list of tuples of the old and
+    new names.  An entry that was renamed and had its mode changed
+    appears in ``renamed`` and, under its new name, in ``modified``.
+    """
+
+    __slots__ = ()
+
+    def __bool__(self):
+        """
+        Determine whether there are any differences.
+        """
+
+        return any(self)
+
+    __nonzero__ = __bool__
+
+
+def _modified(old, new, digests):
+    """
+    Determine whether an entry has been modified.  An entry whose
+    inode has changed has been replaced, and so is modified.  If both
+    entries have comparable digests, they decide; otherwise, the
+    modification times must match.
+
+    :param old: The old ``ManifestEntry``.
+    :param new: The new ``ManifestEntry``.
+    :param digests: A ``True`` value if the digests of the two entries
+                    are comparable.
+
+    :returns: A ``True`` value if the entry has been modified,
+              ``False`` otherwise.
+    """
+
+    if old.type != new.type or old.mode != new.mode:
+        return True
+    elif new.type == DIRECTORY:
+        # A directory changes when its contents do; those changes are
+        # reported separately
+        return False
+    elif (old.size != new.size or old.target != new.target or
+          old.identity != new.identity):
+        return True
+    elif digests and old.digest and new.digest:
+        # The digests show whether the contents changed
+        return old.digest != new.digest
+
+    return old.mtime_ns != new.mtime_ns
+
+
+def _renamed(old, new, digests):
+    """
+    Determine whether an entry added under one name is a removed entry
+    with the same device and inode numbers under a new name.  Since
+    inode numbers are reused, the contents must also be unchanged, as
+    shown by the modification time and size or by the digests.
+
+    :param old: The removed ``ManifestEntry``.
+    :param new: The added ``ManifestEntry``.
+    :param digests: A ``True`` value if the digests of the two entries
+                    are comparable.
+
+    :returns: A ``True`` value if the entry was renamed, ``False``
+              otherwise.
+    """
+
+    if old.identity != new.identity or old.type != new.type:
+        return False
+    elif old.size == new.size and old.mtime_ns == new.mtime_ns:
+        return old.target == new.target
+    elif digests and old.digest and new.digest:
+        return old.digest == new.digest
+
+    return False
+
+
+def diff(old, new):
+    """
+    Compute the differences between two snapshots of a tree.  Entries
+    removed from one name and added under another with the same
+    device and inode numbers and the same contents are reported as
+    renamed.
+
+    :param old: The earlier ``Snapshot``.
+    :param new: The later ``Snapshot``.
+
+    :returns: A ``SnapshotDiff`` instance.
+    """
+
+    digests = old.hasher is not None and old.hasher == new.hasher
+
+    removed = set(old.entries) - set(new.entries)
+    added = set(new.entries) - set(old.entries)
+    modified = [name for name in set(old.entries) & set(new.entries)
+                if _modified(old.entries[name], new.entries[name], digests)]
+
+    # Match up renames by identity
+    by_identity = {}
+    for name in sorted(removed):
+        by_identity.setdefault(old.entries[name].identity, []).append(name)
+
+    renamed = []
+    for name in sorted(added):
+        ent = new.entries[name]
+        candidates = by_identity.get(ent.identity, [])
+        for i, old_name in enumerate(candidates):
+            if _renamed(old.entries[old_name], ent, digests):
+                del candidates[i]
+                break
+        else:
+            continue
+
+        removed.discard(old_name)
+        added.discard(name)
+        renamed.append((old_name, name))
+        if _modified(old.entries[old_name], ent, digests):
+            modified.append(name)
+
+    return SnapshotDiff(sorted(added), sorted(removed), sorted(modified),
+                        sorted(renamed))
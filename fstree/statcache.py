@@ -0,0 +1,256 @@
+# Copyright 2014 Kevin L. Mitchell
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import time
+
+from fstree import lru
+from fstree import utils
+
+
+# The default maximum number of results held by a ``StatCache``
+MAX_ENTRIES = 65536
+
+
+class StatPolicy(object):
+    """
+    Decide whether a cached stat result may be used.  Each result
+    stored in a ``StatCache`` is stamped by calling ``stamp()``, and
+    the result is used only if ``valid()`` returns ``True`` for that
+    stamp.  Results are always discarded when the generation of the
+    cache is bumped, regardless of the policy.
+    """
+
+    # Whether results should be stored at all
+    cacheable = True
+
+    def stamp(self):
+        """
+        Compute the stamp for a result being stored in the cache.
+
+        :returns: An opaque value that will be passed to ``valid()``.
+        """
+
+        return None
+
+    def valid(self, stamp):
+        """
+        Determine whether a cached result may be used.
+
+        :param stamp: The value returned by ``stamp()`` when the
+                      result was stored.
+
+        :returns: A ``True`` value if the cached result may be used,
+                  ``False`` otherwise.
+        """
+
+        raise NotImplementedError()  # pragma: no cover
+
+
+class FreshPolicy(StatPolicy):
+    """
+    A stat policy that never uses cached results.  Every stat access
+    results in a system call, as if no cache were in use, and no
+    results are stored.
+    """
+
+    cacheable = False
+
+    def valid(self, stamp):
+        """
+        Determine whether a cached result may be used.
+
+        :param stamp: The value returned by ``stamp()`` when the
+                      result was stored.
+
+        :returns: Always ``False``.
+        """
+
+        return False
+
+
+class TTLPolicy(StatPolicy):
+    """
+    A stat policy that uses cached results for a fixed time after
+    they were fetched.
+    """
+
+    def __init__(self, ttl, clock=time.time):
+        """
+        Initialize a ``TTLPolicy`` object.
+
+        :param ttl: The time, in seconds, for which a result may be
+                    used.
+        :param clock: A callable returning the current time in
+                      seconds.  Defaults to ``time.time()``.
+        """
+
+        self.ttl = ttl
+        self.clock = clock
+
+    def stamp(self):
+        """
+        Compute the stamp for a result being stored in the cache.
+
+        :returns: The current time.
+        """
+
+        return self.clock()
+
+    def valid(self, stamp):
+        """
+        Determine whether a cached result may be used.
+
+        :param stamp: The time at which the result was stored.
+
+        :returns: A ``True`` value if the result is younger than the
+                  configured TTL, ``False`` otherwise.
+        """
+
+        return self.clock() - stamp < self.ttl
+
+
+class GenerationPolicy(StatPolicy):
+    """
+    A stat policy that uses cached results until the generation of
+    the cache is bumped.  ``FSTree`` bumps the generation whenever
+    one of its own methods modifies the tree; modifications made by
+    other means must be signalled by calling ``FSTree.invalidate()``.
+    """
+
+    def valid(self, stamp):
+        """
+        Determine whether a cached result may be used.
+
+        :param stamp: The value returned by ``stamp()`` when the
+                      result was stored.
+
+        :returns: Always ``True``.
+        """
+
+        return True
+
+
+class StatCache(object):
+    """
+    A cache of ``os.stat()`` and ``os.lstat()`` results, keyed by
+    system path.  A ``StatPolicy`` decides how long results may be
+    used, and all results may be discarded at once by bumping the
+    generation of the cache.  The number of results held is bounded;
+    the least recently used are discarded first.
+    """
+
+    def __init__(self, policy, max_entries=MAX_ENTRIES):
+        """
+        Initialize a ``StatCache`` object.
+
+        :param policy: The ``StatPolicy`` to apply to cached results.
+        :param max_entries: The maximum number of results to hold.
+                            If ``None``, the number is unbounded.
+        """
+
+        self.policy = policy
+        self.generation = 0
+
+        # Maps (path, follow_symlinks) to (result, generation, stamp)
+        self._cache = lru.LRUCache(max_entries)
+
+    def _lookup(self, path, follow_symlinks):
+        """
+        A helper method to retrieve a stat result, either from the
+        cache or from the file system.
+
+        :param path: The system path to stat.
+        :param follow_symlinks: If ``True``, ``os.stat()`` is used;
+                                otherwise, ``os.lstat()`` is used.
+
+        :returns: The stat result.
+        """
+
+        if not self.policy.cacheable:
+            return (os.stat if follow_symlinks else os.lstat)(path)
+
+        key = (path, follow_symlinks)
+        cached = self._cache.get(key)
+        if cached is not None:
+            result, generation, stamp = cached
+            if generation == self.generation and self.policy.valid(stamp):
+                return result
+
+        # Fetch a new result; note the generation first, so that a
+        # concurrent bump results in our result being discarded
+        generation = self.generation
+        result = (os.stat if follow_symlinks else os.lstat)(path)
+        self._cache.put(key, (result, generation, self.policy.stamp()))
+
+        return result
+
+    def stat(self, path):
+        """
+        Retrieve the result of ``os.stat()`` for a path.
+
+        :param path: The system path to stat.
+
+        :returns: The stat result.
+        """
+
+        return self._lookup(path, True)
+
+    def lstat(self, path):
+        """
+        Retrieve the result of ``os.lstat()`` for a path.
+
+        :param path: The system path to stat.
+
+        :returns: The stat result.
+        """
+
+        return self._lookup(path, False)
+
+    def seed(self, path, lstat=utils.unset, stat=utils.unset):
+        """
+        Store stat results fetched by other means, such as while
+        scanning a directory.
+
+        :param path: The system path the results describe.
+        :param lstat: The result of ``os.lstat()``, if known.
+        :param stat: The result of ``os.stat()``, if known.
+        """
+
+        if not self.policy.cacheable:
+            return
+
+        stamp = self.policy.stamp()
+        if lstat is not utils.unset:
+            self._cache.put((path, False), (lstat, self.generation, stamp))
+        if stat is not utils.unset:
+            self._cache.put((path, True), (stat, self.generation, stamp))
+
+    def invalidate(self, path=None):
+        """
+        Discard cached results.
+
+        :param path: If given, only the results for this system path
+                     are discarded.  Otherwise, the generation of the
+                     cache is bumped and all results are discarded.
+        """
+
+        if path is not None:
+            self._cache.pop((path, False), None)
+            self._cache.pop((path, True), None)
+            return
+
+        self.generation += 1
+        self._cache.clear()
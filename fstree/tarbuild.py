@@ -0,0 +1,489 @@
+# Copyright 2014 Kevin L. Mitchell
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import io
+import os
+import stat
+import struct
+import sys
+import tarfile
+
+try:
+    import fcntl
+    import grp
+    import pwd
+except ImportError:  # pragma: no cover
+    fcntl = grp = pwd = None
+
+from fstree import dirscan
+from fstree import snapshot
+
+
+# The orders in which the files of an archive may be written
+ORDER_NAME = 'name'
+ORDER_INODE = 'inode'
+ORDER_PHYSICAL = 'physical'
+ORDERS = (ORDER_NAME, ORDER_INODE, ORDER_PHYSICAL)
+
+# The member type of a GNU incremental directory listing, or
+# "dumpdir"; its data names the entries of the directory
+GNUTYPE_DUMPDIR = b'D'
+
+# The flags of the entries in a dumpdir: a file included in the
+# archive, a file unchanged since the previous archive, and a
+# directory
+DUMPDIR_INCLUDED = b'Y'
+DUMPDIR_UNCHANGED = b'N'
+DUMPDIR_DIRECTORY = b'D'
+
+# The FS_IOC_FIEMAP ioctl, from <linux/fs.h>
+FS_IOC_FIEMAP = 0xc020660b
+
+# The layouts of struct fiemap and struct fiemap_extent, from
+# <linux/fiemap.h>
+_FIEMAP = struct.Struct('=QQLLLL')
+_FIEMAP_EXTENT = struct.Struct('=QQQQQLLLL')
+
+# The tar member types for the file types
+_TYPES = {
+    stat.S_IFREG: tarfile.REGTYPE,
+    stat.S_IFDIR: tarfile.DIRTYPE,
+    stat.S_IFLNK: tarfile.SYMTYPE,
+    stat.S_IFIFO: tarfile.FIFOTYPE,
+    stat.S_IFCHR: tarfile.CHRTYPE,
+    stat.S_IFBLK: tarfile.BLKTYPE,
+}
+
+
+def physical_offset(path):
+    """
+    Determine the physical location of the first block of a file,
+    using the ``FIEMAP`` ioctl.
+
+    :param path: The system path of the file.
+
+    :returns: The physical offset of the start of the file on its
+              device, in bytes, or ``None`` if it cannot be
+              determined.
+    """
+
+    if fcntl is None or not sys.platform.startswith('linux'):
+        return None  # pragma: no cover
+
+    # Ask for the first extent of the file
+    buf = bytearray(_FIEMAP.pack(0, 0xffffffffffffffff, 0, 0, 1, 0) +
+                    b'\0' * _FIEMAP_EXTENT.size)
+    try:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            fcntl.ioctl(fd, FS_IOC_FIEMAP, buf, True)
+        finally:
+            os.close(fd)
+    except (IOError, OSError):
+        return None
+
+    # Did we get an extent?
+    if not _FIEMAP.unpack_from(buf)[3]:
+        return None
+    return _FIEMAP_EXTENT.unpack_from(buf, _FIEMAP.size)[1]
+
+
+def format_dumpdir(entries):
+    """
+    Format the data of a dumpdir member, in the form used by GNU tar
+    for listed-incremental archives: each entry is a flag followed by
+    the entry name and a NUL, and the list ends with another NUL.
+
+    :param entries: An iterable of tuples of the flag and the name of
+                    each entry in the directory.
+
+    :returns: The data, as bytes.
+    """
+
+    return b''.join(flag + os.fsencode(name) + b'\0'
+                    for flag, name in sorted(entries,
+                                             key=lambda e: e[1])) + b'\0'
+
+
+def parse_dumpdir(data):
+    """
+    Parse the data of a dumpdir member.
+
+    :param data: The data, as bytes.
+
+    :returns: A list of tuples of the flag and the name of each entry
+              in the directory.
+    """
+
+    return [(item[:1], os.fsdecode(item[1:]))
+            for item in data.split(b'\0') if item]
+
+
+class TarBuilder(object):
+    """
+    Add directory trees to a ``tarfile.TarFile``.  Unlike
+    ``TarFile.add()``, which calls ``os.lstat()`` on every member and
+    reads the files in directory order, the tree is walked with
+    ``dirscan.walk()`` and the ``TarInfo`` objects are built from the
+    stat data it has already fetched.  All the directories are written
+    first, followed by the other members in the selected order, so
+    that the files of a large tree may be read in the order they are
+    laid out on disk.  An incremental archive, containing only the
+    files changed since an earlier snapshot or time, may also be
+    built; its directories are written as GNU dumpdir members, which
+    list the entries the directory should contain, so that entries
+    removed since may be removed on extraction.
+    """
+
+    def __init__(self, tar, order=None, reproducible=False, mtime=0,
+                 workers=None, record=False, since=None):
+        """
+        Initialize a ``TarBuilder`` object.
+
+        :param tar: The ``tarfile.TarFile`` to add members to.
+        :param order: The order in which to write the members other
+                      than directories.  May be ``ORDER_NAME``,
+                      ``ORDER_INODE``, ``ORDER_PHYSICAL`` (the
+                      physical location of the file data, falling
+                      back to the inode number), or ``None`` (the
+                      default) for directory order.
+        :param reproducible: If ``True``, the archive is made
+                             independent of when and by whom it was
+                             built: members are written in name
+                             order, owners are recorded as uid and gid
+                             0 with no names, and modification times
+                             are clamped to ``mtime``.
+        :param mtime: The latest modification time recorded when
+                      ``reproducible`` is ``True``.
+        :param workers: If given and greater than 1, the number of
+                        threads to use for listing directories.  See
+                        ``dirscan.walk()``.
+        :param record: If ``True``, the ``TarInfo`` of each member
+                       added is appended to the ``members`` attribute,
+                       with its ``offset`` and ``offset_data``
+                       attributes set, for indexing the archive.
+        :param since: If given, only the files changed since then are
+                      added, and the directories are written as
+                      dumpdir members.  May be a
+                      ``snapshot.Snapshot`` of the tree, whose names
+                      are compared with the names of the members
+                      with a leading "/", or a time, in seconds since
+                      the epoch, which is compared with the
+                      modification and change times of the files.
+        """
+
+        if order is not None and order not in ORDERS:
+            raise ValueError("unknown member order '%s'" % order)
+
+        self.tar = tar
+        self.order = ORDER_NAME if reproducible else order
+        self.reproducible = reproducible
+        self.mtime = mtime
+        self.workers = workers
+        self.members = [] if record else None
+        self.since = since
+
+        # For recognizing hard links and looking up owner names
+        self._links = {}
+        self._users = {}
+        self._groups = {}
+
+    def _owner_name(self, cache, lookup, ident):
+        """
+        Look up the name of a user or group, caching the result.
+
+        :param cache: The dictionary to cache the result in.
+        :param lookup: The function to look the name up with, or
+                       ``None`` if names are not available.
+        :param ident: The uid or gid.
+
+        :returns: The name, or an empty string if there is none.
+        """
+
+        if ident not in cache:
+            try:
+                cache[ident] = lookup(ident)[0] if lookup else ''
+            except KeyError:
+                cache[ident] = ''
+        return cache[ident]
+
+    def tarinfo(self, path, arcname, st):
+        """
+        Build a ``TarInfo`` for a file, without making any system
+        calls other than those needed to read a symbolic link.
+
+        :param path: The system path of the file.
+        :param arcname: The name of the member in the archive.
+        :param st: The result of ``os.lstat()`` for the file.
+
+        :returns: A ``tarfile.TarInfo`` object, or ``None`` if the
+                  file is a socket, which cannot be archived.
+        """
+
+        fmt = stat.S_IFMT(st.st_mode)
+        if fmt not in _TYPES:
+            return None
+
+        info = self.tar.tarinfo(arcname)
+        info.type = _TYPES[fmt]
+        info.mode = stat.S_IMODE(st.st_mode)
+        info.size = st.st_size if fmt == stat.S_IFREG else 0
+        info.mtime = st.st_mtime
+
+        if self.reproducible:
+            info.uid = info.gid = 0
+            info.uname = info.gname = ''
+            info.mtime = min(int(info.mtime), self.mtime)
+        else:
+            info.uid = st.st_uid
+            info.gid = st.st_gid
+            info.uname = self._owner_name(
+                self._users, getattr(pwd, 'getpwuid', None), st.st_uid)
+            info.gname = self._owner_name(
+                self._groups, getattr(grp, 'getgrgid', None), st.st_gid)
+
+        if fmt == stat.S_IFLNK:
+            info.linkname = os.readlink(path)
+        elif fmt in (stat.S_IFCHR, stat.S_IFBLK):
+            info.devmajor = os.major(st.st_rdev)
+            info.devminor = os.minor(st.st_rdev)
+        elif fmt == stat.S_IFREG and st.st_nlink > 1:
+            # Later links to the same file refer to the first
+            key = (st.st_dev, st.st_ino)
+            if key in self._links:
+                info.type = tarfile.LNKTYPE
+                info.linkname = self._links[key]
+                info.size = 0
+            else:
+                self._links[key] = arcname
+
+        return info
+
+    def _sort_key(self, member):
+        """
+        Compute the sort key for a member.
+
+        :param member: A tuple of the system path, the name in the
+                       archive, and the ``os.lstat()`` result.
+
+        :returns: The sort key.
+        """
+
+        path, arcname, st = member
+        if self.order == ORDER_NAME:
+            return (arcname,)
+        elif self.order == ORDER_PHYSICAL and stat.S_ISREG(st.st_mode):
+            offset = physical_offset(path)
+            if offset is not None:
+                return (st.st_dev, 0, offset)
+
+        # Fall back to the inode number
+        return (st.st_dev, 1, st.st_ino)
+
+    def changed(self, arcname, st):
+        """
+        Determine whether a file has changed since the time given by
+        ``since``.
+
+        :param arcname: The name of the member in the archive.
+        :param st: The result of ``os.lstat()`` for the file.
+
+        :returns: A ``True`` value if the file has changed or if
+                  ``since`` was not given, ``False`` otherwise.
+        """
+
+        if self.since is None:
+            return True
+        elif isinstance(self.since, snapshot.Snapshot):
+            old = self.since.entries.get('/' + arcname)
+            if old is None:
+                return True
+            new = snapshot.ManifestEntry.from_stat(old.name, st)
+            return old.mode != new.mode or not old.same_stat(new)
+
+        return max(st.st_mtime, st.st_ctime) > self.since
+
+    def collect(self, path, arcname, dirs, files):
+        """
+        Walk a file or directory tree, collecting the members to add.
+        Each member is a tuple of the system path, the name in the
+        archive, and the ``os.lstat()`` result.  Entries which vanish
+        during the walk are skipped.
+
+        :param path: The system path of the file or directory.
+        :param arcname: The name of the member for ``path`` in the
+                        archive.
+        :param dirs: A list to which the directory members are
+                     appended.
+        :param files: A list to which the remaining members are
+                      appended.
+        """
+
+        try:
+            st = os.lstat(path)
+        except OSError:
+            return
+        if not stat.S_ISDIR(st.st_mode):
+            files.append((path, arcname, st))
+            return
+
+        dirs.append((path, arcname, st))
+        prefix = len(path.rstrip(os.sep)) + 1
+        for dirpath, subdirs, others in dirscan.walk(path,
+                                                     workers=self.workers):
+            base = os.path.join(arcname, dirpath[prefix:]).rstrip('/')
+            for ent in subdirs + others:
+                try:
+                    member = (ent.path, '%s/%s' % (base, ent.name),
+                              ent.lstat())
+                except OSError:
+                    continue
+                if stat.S_ISDIR(member[2].st_mode):
+                    dirs.append(member)
+                else:
+                    files.append(member)
+
+    def build(self, sources, root=None):
+        """
+        Add several files or directory trees to the archive.  The
+        directories of all the sources are written before any of the
+        other members.
+
+        :param sources: An iterable of tuples of the system path of a
+                        file or directory and the name of its member
+                        in the archive.
+        :param root: The system path of the directory containing the
+                     sources.  If given and the archive is
+                     incremental, a dumpdir member named "./" is
+                     written for it, listing the sources, so that
+                     those removed since may be removed on
+                     extraction.
+        """
+
+        dirs = []
+        files = []
+        for path, arcname in sources:
+            self.collect(path, arcname.replace(os.sep, '/'), dirs, files)
+
+        listings = None
+        if self.since is not None:
+            # List the entries of each directory, then drop the
+            # unchanged files
+            listings = dict((member[1], []) for member in dirs)
+            changed = []
+            for member in dirs + files:
+                if stat.S_ISDIR(member[2].st_mode):
+                    flag = DUMPDIR_DIRECTORY
+                elif self.changed(member[1], member[2]):
+                    flag = DUMPDIR_INCLUDED
+                    changed.append(member)
+                else:
+                    flag = DUMPDIR_UNCHANGED
+                parent, _sep, base = member[1].rpartition('/')
+                listings.setdefault(parent, []).append((flag, base))
+            files = changed
+
+            if root is not None:
+                try:
+                    dirs.insert(0, (root, '', os.lstat(root)))
+                except OSError:
+                    pass
+
+        self.write(dirs, files, listings)
+
+    def write(self, dirs, files, listings=None):
+        """
+        Add members collected by ``collect()`` to the archive.  The
+        directories are written before any of the other members.
+
+        :param dirs: A list of the directory members.
+        :param files: A list of the remaining members.
+        :param listings: For an incremental archive, a dictionary
+                         mapping the name of each directory to a list
+                         of tuples of the flag and the name of each of
+                         its entries, to be written as dumpdir
+                         members.
+        """
+
+        if self.order is not None:
+            dirs = sorted(dirs, key=lambda member: member[1])
+            files = sorted(files, key=self._sort_key)
+
+        # Directories first, so they exist for their contents
+        for member in dirs:
+            self._add_member(*member, listing=(
+                None if listings is None else listings.get(member[1], [])))
+        for member in files:
+            self._add_member(*member)
+
+    def add(self, path, arcname=None):
+        """
+        Add a file or directory tree to the archive.
+
+        :param path: The system path of the file or directory.
+        :param arcname: The name of the member for ``path`` in the
+                        archive.  Defaults to ``path`` without any
+                        leading "/".
+        """
+
+        self.build([(path, path.lstrip(os.sep) if arcname is None
+                     else arcname)])
+
+    def _add_member(self, path, arcname, st, listing=None):
+        """
+        Add a single member to the archive.  Files which vanish or
+        cannot be read are skipped.
+
+        :param path: The system path of the file.
+        :param arcname: The name of the member in the archive.
+        :param st: The result of ``os.lstat()`` for the file.
+        :param listing: For a directory of an incremental archive, a
+                        list of tuples of the flag and the name of
+                        each of its entries, to be written as a
+                        dumpdir member.
+        """
+
+        f = None
+        try:
+            if stat.S_ISREG(st.st_mode):
+                f = open(path, 'rb')
+            info = self.tarinfo(path, arcname or os.curdir, st)
+        except (IOError, OSError):
+            if f is not None:
+                f.close()
+            return
+
+        try:
+            if info is None:
+                return
+            elif listing is not None:
+                data = format_dumpdir(listing)
+                info.type = GNUTYPE_DUMPDIR
+                info.name = info.name.rstrip('/') + '/'
+                info.size = len(data)
+                f = io.BytesIO(data)
+            offset = self.tar.offset
+            self.tar.addfile(info, f if info.isreg() or listing is not None
+                             else None)
+        finally:
+            if f is not None:
+                f.close()
+
+        # The data is padded to a whole number of blocks
+        if self.members is not None:
+            blocks = -(-info.size // tarfile.BLOCKSIZE)
+            info.offset = offset
+            info.offset_data = self.tar.offset - blocks * tarfile.BLOCKSIZE
+            self.members.append(info)
@@ -0,0 +1,274 @@
+# Copyright 2014 Kevin L. Mitchell
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import bisect
+import io
+import json
+import os
+import tarfile
+
+from fstree import compress
+from fstree import tarname
+
+
+# The version of the index format
+VERSION = 2
+
+# The extension of index files
+EXTENSION = '.idx'
+
+# The TarInfo attributes recorded for each member
+_FIELDS = ('name', 'type', 'mode', 'uid', 'gid', 'uname', 'gname', 'size',
+           'mtime', 'linkname', 'devmajor', 'devminor', 'offset',
+           'offset_data')
+
+
+def index_path(filename):
+    """
+    Compute the name of the index file for a tar file.
+
+    :param filename: The name of the tar file.
+
+    :returns: The name of the index file.
+    """
+
+    return str(filename) + EXTENSION
+
+
+class _CheckpointReader(io.RawIOBase):
+    """
+    A read-only, seekable file object for the uncompressed data of a
+    compressed tar file.  Decompression starts from the nearest
+    checkpoint before the data being read, so only the block
+    containing it need be decompressed.
+    """
+
+    def __init__(self, path, compression, checkpoints):
+        """
+        Initialize a ``_CheckpointReader`` object.
+
+        :param path: The system path of the tar file.
+        :param compression: The compression of the tar file.
+        :param checkpoints: A sorted list of tuples of the
+                            uncompressed and compressed offsets at
+                            which decompression may begin.
+        """
+
+        super(_CheckpointReader, self).__init__()
+
+        self._file = open(path, 'rb')
+        self._compression = compression
+        self._checkpoints = checkpoints or [(0, 0)]
+        self._starts = [point[0] for point in self._checkpoints]
+
+        self._pos = 0
+        self._reader = None
+        self._reader_pos = None
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def _position(self):
+        """
+        Position the decompressor at the current offset, restarting it
+        from a checkpoint if it is not already between the checkpoint
+        and the offset.
+        """
+
+        i = bisect.bisect_right(self._starts, self._pos) - 1
+        start, offset = self._checkpoints[max(i, 0)]
+        if (self._reader is None or
+                not start <= self._reader_pos <= self._pos):
+            self._file.seek(offset)
+            self._reader = compress.reader(self._file, self._compression)
+            self._reader_pos = start
+
+        # Skip forward to the data
+        while self._reader_pos < self._pos:
+            skipped = len(self._reader.read(
+                min(self._pos - self._reader_pos, 1024 * 1024)))
+            if not skipped:
+                break
+            self._reader_pos += skipped
+
+    def readinto(self, b):
+        self._position()
+
+        data = self._reader.read(len(b))
+        b[:len(data)] = data
+        self._pos += len(data)
+        self._reader_pos = self._pos
+
+        return len(data)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence != io.SEEK_SET:
+            raise io.UnsupportedOperation("can't seek from the end")
+        if offset < 0:
+            raise ValueError("negative seek position %d" % offset)
+
+        self._pos = offset
+        return offset
+
+    def tell(self):
+        return self._pos
+
+    def close(self):
+        if not self.closed:
+            self._file.close()
+        super(_CheckpointReader, self).close()
+
+
+class TarIndex(object):
+    """
+    Describe a sidecar index for a tar file.  The index records each
+    member of the tar file, with the offsets of its header and data
+    in the uncompressed archive, and, for compressed tar files built
+    in independent blocks, the uncompressed and compressed offsets of
+    each block.  A reader can then find any member without scanning
+    the archive, and decompress only the block containing its data.
+    The size and modification time of the tar file are recorded as
+    well, so that an index left behind by an earlier archive of the
+    same name can be recognized.  Indexes are stored as JSON.
+    """
+
+    def __init__(self, compression, members, checkpoints=(), size=None,
+                 mtime=None):
+        """
+        Initialize a ``TarIndex`` object.
+
+        :param compression: The compression of the tar file, or
+                            ``None``.
+        :param members: A list of ``tarfile.TarInfo`` objects for
+                        the members, with their ``offset`` and
+                        ``offset_data`` attributes set.
+        :param checkpoints: A list of tuples of the uncompressed and
+                            compressed offsets at which decompression
+                            may begin.
+        :param size: The size of the tar file, in bytes, or ``None``
+                     if not known.
+        :param mtime: The modification time of the tar file, in
+                      nanoseconds since the epoch, or ``None`` if not
+                      known.
+        """
+
+        self.compression = tarname.Compression.lookup_supported(compression)
+        self.members = members
+        self.checkpoints = [tuple(point) for point in checkpoints]
+        self.size = size
+        self.mtime = mtime
+
+    @classmethod
+    def load(cls, fileobj):
+        """
+        Read an index.
+
+        :param fileobj: The file name of the index, or a file object
+                        to read it from.
+
+        :returns: A ``TarIndex`` object.  A ``ValueError`` is raised
+                  if the index is not in a supported format.
+        """
+
+        if not hasattr(fileobj, 'read'):
+            with open(fileobj) as f:
+                return cls.load(f)
+
+        data = json.load(fileobj)
+        if data.get('version') != VERSION:
+            raise ValueError("unsupported tar index version %r" %
+                             data.get('version'))
+
+        members = []
+        for record in data['members']:
+            info = tarfile.TarInfo()
+            for field, value in zip(_FIELDS, record):
+                setattr(info, field, value)
+            info.type = info.type.encode('ascii')
+            members.append(info)
+
+        return cls(data['compression'], members, data['checkpoints'],
+                   data['size'], data['mtime'])
+
+    def save(self, fileobj):
+        """
+        Write the index.
+
+        :param fileobj: The file name of the index, or a file object
+                        to write it to.
+        """
+
+        if not hasattr(fileobj, 'write'):
+            with open(fileobj, 'w') as f:
+                return self.save(f)
+
+        members = []
+        for info in self.members:
+            record = [getattr(info, field) for field in _FIELDS]
+            record[1] = record[1].decode('ascii')
+            members.append(record)
+
+        json.dump({
+            'version': VERSION,
+            'compression': (None if self.compression is None else
+                            str(self.compression)),
+            'checkpoints': self.checkpoints,
+            'size': self.size,
+            'mtime': self.mtime,
+            'members': members,
+        }, fileobj, separators=(',', ':'))
+
+    def matches(self, path):
+        """
+        Determine whether the index describes a tar file as it is now.
+        Only the size and modification time which were recorded are
+        compared.
+
+        :param path: The system path of the tar file.
+
+        :returns: A ``True`` value if the tar file exists and has the
+                  recorded size and modification time, ``False``
+                  otherwise.
+        """
+
+        try:
+            st = os.stat(path)
+        except OSError:
+            return False
+
+        return ((self.size is None or st.st_size == self.size) and
+                (self.mtime is None or st.st_mtime_ns == self.mtime))
+
+    def open(self, path):
+        """
+        Open a tar file as a seekable stream of uncompressed data,
+        using the checkpoints to avoid decompressing more than
+        necessary.
+
+        :param path: The system path of the tar file.
+
+        :returns: A file object.
+        """
+
+        if self.compression is None:
+            return open(path, 'rb')
+
+        return io.BufferedReader(_CheckpointReader(
+            path, self.compression, self.checkpoints))
@@ -17,6 +17,7 @@ import os
 
 import six
 
+from fstree import compress
 from fstree import utils
 
 
@@ -67,6 +68,36 @@ class Compression(object):
 
         return cls._extensions.get(ext[1:])
 
+    @classmethod
+    def lookup_supported(cls, compression):
+        """
+        Retrieve a supported compression format descriptor.
+
+        :param compression: The name of the compression, a
+                            ``Compression`` instance, or a false value
+                            for no compression.
+
+        :returns: The ``Compression`` instance, or ``None`` if
+                  ``compression`` is a false value.  A ``ValueError``
+                  is raised if the compression is unknown or
+                  unsupported.
+        """
+
+        if not compression:
+            return None
+
+        if not isinstance(compression, Compression):
+            descriptor = cls.lookup_compression(compression)
+            if not descriptor:
+                raise ValueError("unknown compression scheme '%s'" %
+                                 compression)
+            compression = descriptor
+        if not compression.supported:
+            raise ValueError("compression scheme '%s' is unsupported" %
+                             compression)
+
+        return compression
+
     def __new__(cls, name, supported, *extensions):
         """
         Retrieve the description of a tar-compatible compression
@@ -139,6 +170,7 @@ Compression('lz', False, 'lz')
 Compression('lzma', False, 'lzma', 'tlz')
 Compression('lzo', False, 'lzo')
 Compression('xz', six.PY3, 'xz', 'txz')
+Compression('zst', compress.zstd is not None, 'zst', 'tzst')
 
 
 class TarFileName(object):
@@ -244,15 +276,7 @@ class TarFileName(object):
 
         # Make sure the compression is supported
         if compression:
-            if not isinstance(compression, Compression):
-                descriptor = Compression.lookup_compression(compression)
-                if not descriptor:
-                    raise ValueError("unknown compression scheme '%s'" %
-                                     compression)
-                compression = descriptor
-            if not compression.supported:
-                raise ValueError("compression scheme '%s' is unsupported" %
-                                 compression)
+            compression = Compression.lookup_supported(compression)
 
             # Set the extension
             self.extensions.append(compression.extension)
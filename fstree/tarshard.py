@@ -0,0 +1,217 @@
+# Copyright 2014 Kevin L. Mitchell
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import heapq
+import stat
+import tarfile
+
+from fstree import compress
+from fstree import tarbuild
+from fstree import utils
+
+
+def weight(st):
+    """
+    Compute the number of bytes a member occupies in a tar file: one
+    header block, plus the data padded to a whole number of blocks.
+
+    :param st: The result of ``os.lstat()`` for the file.
+
+    :returns: The number of bytes.
+    """
+
+    size = st.st_size if stat.S_ISREG(st.st_mode) else 0
+    return tarfile.BLOCKSIZE * (1 + -(-size // tarfile.BLOCKSIZE))
+
+
+def _units(files):
+    """
+    Group the members which must be placed in the same shard.  All
+    the links to a file must be in the same shard, since the tar file
+    records the later ones as links to the first.
+
+    :param files: A list of tuples of the system path, the name in
+                  the archive, and the ``os.lstat()`` result of the
+                  members other than directories.
+
+    :returns: A list of tuples of the weight and a list of the
+              members, heaviest first.
+    """
+
+    units = []
+    links = {}
+    for member in files:
+        st = member[2]
+        if stat.S_ISREG(st.st_mode) and st.st_nlink > 1:
+            key = (st.st_dev, st.st_ino)
+            if key in links:
+                # The data is only stored once
+                unit = links[key]
+                unit[0] += tarfile.BLOCKSIZE
+                unit[1].append(member)
+                continue
+            links[key] = [weight(st), [member]]
+            units.append(links[key])
+        else:
+            units.append([weight(st), [member]])
+
+    # Heaviest first, breaking ties by name to keep it repeatable
+    units.sort(key=lambda unit: (-unit[0], unit[1][0][1]))
+    return [tuple(unit) for unit in units]
+
+
+def _balance(units, count):
+    """
+    Distribute units among a number of shards, always adding the next
+    unit to the lightest shard.  Since the units are heaviest first,
+    the shards end up close to equal in size.
+
+    :param units: A list of tuples of the weight and a list of the
+                  members, heaviest first.
+    :param count: The number of shards.
+
+    :returns: A list of lists of the total weight, the members, and
+              the number of units of each shard.
+    """
+
+    shards = [[0, [], 0] for i in range(count)]
+    heap = [(0, i) for i in range(count)]
+    for size, members in units:
+        load, i = heapq.heappop(heap)
+        shard = shards[i]
+        shard[0] += size
+        shard[1].extend(members)
+        shard[2] += 1
+        heapq.heappush(heap, (shard[0], i))
+
+    return shards
+
+
+def partition(dirs, files, shards=None, max_size=None):
+    """
+    Split the members of a tar file into groups of roughly equal size,
+    each of which may be archived independently.  Each group contains
+    the directories containing its files, so that any group may be
+    extracted alone; directories with no files beneath them are
+    placed in the first group.
+
+    :param dirs: A list of tuples of the system path, the name in the
+                 archive, and the ``os.lstat()`` result of the
+                 directory members, as collected by
+                 ``tarbuild.TarBuilder.collect()``.
+    :param files: A list of such tuples for the remaining members.
+    :param shards: The number of groups.  Fewer are returned if there
+                   are not enough files to go around.
+    :param max_size: The maximum size of a group, in bytes of
+                     uncompressed tar file.  The fewest groups
+                     which keep the members balanced within it are
+                     used; a file larger than the maximum is placed
+                     in a group by itself.  Exactly one of ``shards``
+                     and ``max_size`` must be given.
+
+    :returns: A list of tuples of the list of directory members and
+              the list of other members of each group.
+    """
+
+    if (shards is None) == (max_size is None):
+        raise ValueError("exactly one of shards and max_size must be given")
+    elif shards is not None and shards < 1:
+        raise ValueError("at least one shard is required")
+    elif max_size is not None and max_size <= 0:
+        raise ValueError("max_size must be positive")
+
+    units = _units(files)
+    if max_size is None:
+        groups = _balance(units, max(min(shards, len(units)), 1))
+    else:
+        # Start from the least number of groups that could hold them,
+        # with a group for each unit too large for any group
+        large = sum(1 for unit in units if unit[0] > max_size)
+        rest = sum(unit[0] for unit in units if unit[0] <= max_size)
+        count = max(large + -(-rest // max_size), 1)
+        while True:
+            groups = _balance(units, count)
+            if count >= len(units) or all(
+                    load <= max_size or number == 1
+                    for load, _members, number in groups):
+                break
+            count += 1
+
+    # Give each group the directories containing its files
+    by_name = dict((member[1], member) for member in dirs)
+    used = set()
+    result = []
+    for _load, members, _count in groups:
+        names = set()
+        for member in members:
+            parent = member[1].rpartition('/')[0]
+            while parent and parent not in names:
+                names.add(parent)
+                parent = parent.rpartition('/')[0]
+        used |= names
+        result.append(([by_name[name] for name in sorted(names)
+                        if name in by_name], members))
+
+    # Put the empty directories somewhere
+    result[0][0].extend(member for member in dirs if member[1] not in used)
+    result[0][0].sort(key=lambda member: member[1])
+
+    return result
+
+
+def build(filename, dirs, files, compression=None, level=None,
+          hasher=utils.DEFAULT_HASHER, order=None, reproducible=False,
+          mtime=0):
+    """
+    Build one shard of a sharded tar file.  This is run in a worker
+    process, so all its arguments must be picklable.
+
+    :param filename: The file name of the tar file to create.
+    :param dirs: A list of tuples of the system path, the name in the
+                 archive, and the ``os.lstat()`` result of the
+                 directory members.
+    :param files: A list of such tuples for the remaining members.
+    :param compression: The name of the compression to use, or
+                        ``None``.
+    :param level: The compression level, or ``None`` for the default.
+    :param hasher: The name of the hash algorithm to compute the
+                   digest of the tar file with.
+    :param order: The order in which to write the members other than
+                  directories.  See ``tarbuild.TarBuilder``.
+    :param reproducible: If ``True``, the archive is made independent
+                         of when and by whom it was built.  See
+                         ``tarbuild.TarBuilder``.
+    :param mtime: The latest modification time recorded when
+                  ``reproducible`` is ``True``.
+
+    :returns: The hex digest of the tar file.
+    """
+
+    with open(filename, 'wb') as out:
+        fileobj = utils.TeeWriter(out, (utils.get_hasher(hasher)(),))
+        comp = (compress.writer(fileobj, compression, level)
+                if compression else None)
+        tar = tarfile.open(fileobj=fileobj if comp is None else comp,
+                           mode='w|')
+        try:
+            tarbuild.TarBuilder(tar, order, reproducible,
+                                mtime).write(dirs, files)
+        finally:
+            tar.close()
+            if comp is not None:
+                comp.close()
+            fileobj.close()
+
+    return fileobj.hexdigest()
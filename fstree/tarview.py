@@ -0,0 +1,659 @@
+# Copyright 2014 Kevin L. Mitchell
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import errno
+import io
+import os
+import posixpath
+import stat
+import tarfile
+
+import six
+
+from fstree import compress
+from fstree import merkle
+from fstree import tarbuild
+from fstree import tarindex
+from fstree import tarname
+from fstree import utils
+
+
+# The file types for the tar member types
+_MODES = {
+    tarfile.REGTYPE: stat.S_IFREG,
+    tarfile.AREGTYPE: stat.S_IFREG,
+    tarfile.CONTTYPE: stat.S_IFREG,
+    tarfile.LNKTYPE: stat.S_IFREG,
+    tarfile.DIRTYPE: stat.S_IFDIR,
+    tarbuild.GNUTYPE_DUMPDIR: stat.S_IFDIR,
+    tarfile.SYMTYPE: stat.S_IFLNK,
+    tarfile.FIFOTYPE: stat.S_IFIFO,
+    tarfile.CHRTYPE: stat.S_IFCHR,
+    tarfile.BLKTYPE: stat.S_IFBLK,
+}
+
+# The maximum number of symbolic links followed when resolving a name
+_MAX_LINKS = 40
+
+
+class _Window(io.RawIOBase):
+    """
+    A read-only, seekable file object exposing a range of bytes of
+    another file object: the data of a single tar member.
+    """
+
+    def __init__(self, fileobj, offset, size):
+        """
+        Initialize a ``_Window`` object.
+
+        :param fileobj: The seekable file object containing the data.
+                        It is closed when the ``_Window`` is.
+        :param offset: The offset of the data within ``fileobj``.
+        :param size: The size of the data.
+        """
+
+        super(_Window, self).__init__()
+
+        self._fileobj = fileobj
+        self._offset = offset
+        self._size = size
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, b):
+        count = min(len(b), self._size - self._pos)
+        if count <= 0:
+            return 0
+
+        self._fileobj.seek(self._offset + self._pos)
+        data = self._fileobj.read(count)
+        b[:len(data)] = data
+        self._pos += len(data)
+
+        return len(data)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += self._size
+        if offset < 0:
+            raise ValueError("negative seek position %d" % offset)
+
+        self._pos = offset
+        return offset
+
+    def tell(self):
+        return self._pos
+
+    def close(self):
+        if not self.closed:
+            self._fileobj.close()
+        super(_Window, self).close()
+
+
+class TarEntry(object):
+    """
+    Represent a single entry in a tar file, viewed as a read-only file
+    system tree.  The interface follows that of ``entry.FSEntry``:
+    ``st_`` and ``lst_`` attributes give the stat data recorded in the
+    tar file, and the contents of files may be read without
+    extracting the archive.
+    """
+
+    __slots__ = ('tree', 'name', 'info')
+
+    def __init__(self, tree, name, info):
+        """
+        Initialize a ``TarEntry`` instance.
+
+        :param tree: The ``TarTree`` instance that is the root of the
+                     tree.
+        :param name: The absolute name for this entry.
+        :param info: The ``tarfile.TarInfo`` describing this entry,
+                     or ``None`` for a directory which has no member
+                     of its own.
+        """
+
+        self.tree = tree
+        self.name = name
+        self.info = info
+
+    def __repr__(self):
+        """
+        Return a representation of the entry.
+        """
+
+        return '<%s.%s object for "%s" at %#x>' % (
+            self.__class__.__module__, self.__class__.__name__,
+            self.name, id(self))
+
+    def __getattr__(self, name):
+        """
+        Retrieve a dynamic attribute for the ``TarEntry`` instance.
+        These are attributes with a leading prefix of ``st_`` or
+        ``lst_``, which access the stat data recorded for the member,
+        following symbolic links or not, respectively.
+
+        :param name: The name of the attribute.
+
+        :returns: The value of the requested attribute.
+        """
+
+        if name.startswith('lst_'):
+            return getattr(self.lstat, name[1:])
+        elif name.startswith('st_'):
+            return getattr(self.stat, name)
+
+        # Unrecognized attribute
+        raise AttributeError("'%s' object has no attribute '%s'" %
+                             (self.__class__.__name__, name))
+
+    def __contains__(self, path):
+        """
+        Determine if a given file exists in the tree.
+
+        :param path: The path to check the existence of.
+
+        :returns: Returns a ``True`` value if the file exists,
+                  ``False`` otherwise.
+        """
+
+        try:
+            self.tree._lookup(self._rel(path), False)
+        except KeyError:
+            return False
+        return True
+
+    def __getitem__(self, path):
+        """
+        Retrieve the ``TarEntry`` instance describing the given
+        ``path``.  A ``KeyError`` will be raised if the file doesn't
+        exist.
+
+        :param path: The path to find a ``TarEntry`` instance for.
+                     Symbolic links in the directories of the path are
+                     followed, so the name of the entry may differ
+                     from the path.
+
+        :returns: An instance of ``TarEntry``.
+        """
+
+        return self.tree._get(self.tree._lookup(self._rel(path), False))
+
+    def _rel(self, path):
+        """
+        A helper method to resolve a provided path relative to this
+        entry.  Returns an absolute path against the tree root.
+
+        :param path: The path to resolve.
+
+        :returns: The desired tree-relative path.
+        """
+
+        if isinstance(path, TarEntry):
+            return path.name
+
+        return utils.abspath(path, cwd=self.name)
+
+    def _resolve(self, path=os.curdir):
+        """
+        A helper method to resolve a path to the entry it designates,
+        following symbolic links.
+
+        :param path: An optional path to a subelement of this
+                     directory.
+
+        :returns: A ``TarEntry`` for a non-symbolic link.  A
+                  ``KeyError`` is raised if the path cannot be
+                  resolved.
+        """
+
+        return self.tree._get(self.tree._lookup(self._rel(path), True))
+
+    def digest(self, path=os.curdir, hasher=utils.DEFAULT_HASHER):
+        """
+        Compute the digest of the file.  The digest of a directory is
+        a Merkle digest of its contents, equal to that computed by
+        ``merkle.digest()`` for the directory the tar file was built
+        from, provided the archive recorded the modes of the files;
+        ``hasher`` must then be a string.
+
+        :param path: An optional path to a subelement of this
+                     directory.
+        :param hasher: The string name of the desired hash algorithm,
+                       or a digester object as returned by one of the
+                       hashers present in ``hashlib``, or a tuple of
+                       such objects.  If not given, defaults to
+                       ``utils.DEFAULT_HASHER``.
+
+        :returns: The digest of the file, in hex.  If a tuple of
+                  hashers was passed for ``hasher``, then the first
+                  hasher will be returned.
+        """
+
+        ent = self._resolve(path)
+
+        if ent.isdir:
+            if not isinstance(hasher, six.string_types):
+                raise ValueError("directory digests require the name of "
+                                 "a hash algorithm")
+            return ent._merkle(hasher)
+
+        # Select the digesters
+        if isinstance(hasher, six.string_types):
+            digesters = (utils.get_hasher(hasher)(),)
+        elif not isinstance(hasher, tuple):
+            digesters = (hasher,)
+        else:
+            digesters = hasher
+
+        with ent.open(mode='rb') as f:
+            return utils.digest(f, digesters)
+
+    def _merkle(self, algorithm):
+        """
+        Compute the Merkle digest of a directory.
+
+        :param algorithm: The name of the hash algorithm.
+
+        :returns: The hex digest.
+        """
+
+        entries = []
+        for name in self.tree._children[self.name]:
+            ent = self.tree._get(posixpath.join(self.name, name))
+            mode = ent.lst_mode
+            if stat.S_ISDIR(mode):
+                digest = ent._merkle(algorithm)
+            elif stat.S_ISREG(mode):
+                digest = ent.digest(hasher=algorithm)
+            else:
+                data = ent.info.linkname if ent.info.issym() else ''
+                digester = utils.get_hasher(algorithm)()
+                digester.update(os.fsencode(data))
+                digest = digester.hexdigest()
+            entries.append((name, mode, digest))
+
+        return merkle.combine(entries, algorithm)
+
+    def get(self, path, default=None):
+        """
+        Retrieve the ``TarEntry`` instance describing the given
+        ``path``.  If it doesn't exist, returns ``default``.
+
+        :param path: The path to find a ``TarEntry`` instance for.
+        :param default: The value to return if the file doesn't
+                        exist.  Defaults to ``None``.
+
+        :returns: An instance of ``TarEntry``, or ``default``.
+        """
+
+        try:
+            return self[path]
+        except KeyError:
+            return default
+
+    def open(self, path=os.curdir, mode='r'):
+        """
+        Open the file for reading.  The data is read directly from
+        the tar file.
+
+        :param path: An optional path to a subelement of this
+                     directory.
+        :param mode: The access mode: "r" (the default) or "rb".
+
+        :returns: An open file object.
+        """
+
+        if mode not in ('r', 'rb'):
+            raise ValueError("tar files may only be opened for reading")
+
+        ent = self._resolve(path)
+        if not ent.isfile:
+            raise IOError(errno.EISDIR if ent.isdir else errno.EINVAL,
+                          "not a regular file", ent.name)
+
+        # Hard links refer to an earlier member
+        info = ent.info
+        if info.islnk():
+            info = self.tree._get(utils.abspath(info.linkname,
+                                                cwd='/')).info
+
+        fileobj = io.BufferedReader(_Window(self.tree._open_data(info),
+                                            info.offset_data, info.size))
+        return fileobj if mode == 'rb' else io.TextIOWrapper(fileobj)
+
+    def walk(self, path=os.curdir, topdown=True):
+        """
+        Walk the directory tree.  Similar to the ``os.walk()``
+        generator.  Symbolic links are listed as files.
+
+        :param path: An optional path to a subelement of this
+                     directory.
+        :param topdown: If ``True`` (the default), the yielded tuple
+                        for a directory is generated before that for
+                        any of the subdirectories.  When ``True``, the
+                        caller may remove elements from the directory
+                        names list in-place to prune the walk.
+
+        :returns: A generator yielding 3-tuples consisting of the name
+                  of the directory, a list of subdirectories, and a
+                  list of filenames.
+        """
+
+        top = self.tree._lookup(self._rel(path), True)
+        dirnames = []
+        filenames = []
+        for name in self.tree._children.get(top, ()):
+            ent = self.tree._get(posixpath.join(top, name))
+            (dirnames if stat.S_ISDIR(ent.lst_mode) else
+             filenames).append(name)
+
+        if topdown:
+            yield top, dirnames, filenames
+
+        for name in dirnames:
+            for result in self.walk(posixpath.join(top, name), topdown):
+                yield result
+
+        if not topdown:
+            yield top, dirnames, filenames
+
+    @property
+    def basename(self):
+        """
+        Retrieve the basename of the entry.
+        """
+
+        return posixpath.basename(self.name)
+
+    @property
+    def contents(self):
+        """
+        Retrieve the contents of the entry.  For directories, this
+        will be a sorted list of the directory entries; for files,
+        this will be the contents of the file.
+        """
+
+        ent = self._resolve()
+        if ent.isdir:
+            return list(self.tree._children[ent.name])
+
+        with ent.open() as f:
+            return f.read()
+
+    @property
+    def dirname(self):
+        """
+        Retrieve the dirname of the entry.
+        """
+
+        return posixpath.dirname(self.name)
+
+    @property
+    def isdir(self):
+        """
+        Determine if the entry is a directory, returning ``True`` if
+        it is.  This will follow symbolic links.
+        """
+
+        return stat.S_ISDIR(self.st_mode)
+
+    @property
+    def isfile(self):
+        """
+        Determine if the entry is a regular file, returning ``True``
+        if it is.  This will follow symbolic links.
+        """
+
+        return stat.S_ISREG(self.st_mode)
+
+    @property
+    def islink(self):
+        """
+        Determine if the entry is a symbolic link, returning ``True``
+        if it is.
+        """
+
+        return stat.S_ISLNK(self.lst_mode)
+
+    @property
+    def lstat(self):
+        """
+        Retrieve the stat data recorded for the member, in the form
+        returned by ``os.lstat()``.
+        """
+
+        info = self.info
+        if info is None:
+            # An implied directory
+            return os.stat_result((stat.S_IFDIR | 0o755, 0, 0, 1, 0, 0, 0,
+                                   0, 0, 0))
+
+        size = info.size
+        if info.islnk():
+            size = self.tree._get(utils.abspath(info.linkname,
+                                                cwd='/')).info.size
+        elif info.issym():
+            size = len(info.linkname)
+
+        return os.stat_result((
+            _MODES.get(info.type, stat.S_IFREG) | info.mode, 0, 0, 1,
+            info.uid, info.gid, size, info.mtime, info.mtime, info.mtime,
+        ))
+
+    @property
+    def stat(self):
+        """
+        Retrieve the stat data recorded for the member, in the form
+        returned by ``os.stat()``.  Symbolic links within the tar file
+        are followed.
+        """
+
+        return self._resolve().lstat
+
+
+class TarTree(TarEntry):
+    """
+    Represent a tar file as a read-only file system tree.  The
+    members of the tar file are indexed once, when the tree is
+    created; thereafter, the data of each file is read directly from
+    the archive.  Uncompressed tar files are read at random; for
+    compressed tar files, the archive is decompressed up to the data
+    being read.  If the tar file has a sidecar index (see
+    ``tarindex.TarIndex``), the archive is not scanned at all, and
+    only the block containing the data being read is decompressed.
+    """
+
+    __slots__ = ('path', 'compression', '_members', '_children',
+                 '_tarindex')
+
+    def __init__(self, path, compression=utils.unset, index=None):
+        """
+        Initialize a ``TarTree`` instance.
+
+        :param path: The system path of the tar file.
+        :param compression: If given, specifies the compression of
+                            the tar file, or ``None`` if it is not
+                            compressed.  Otherwise, the compression is
+                            inferred from the index, or from the file
+                            name, if possible, or from the magic
+                            number at the start of the tar file.
+        :param index: The file name of the sidecar index, or a
+                      ``tarindex.TarIndex``.  If ``None`` (the
+                      default), the index named by
+                      ``tarindex.index_path()`` is used if it exists
+                      and matches the tar file.  If ``False``, no
+                      index is used.  A ``ValueError`` is raised if
+                      an index given explicitly does not match the
+                      tar file.
+        """
+
+        super(TarTree, self).__init__(self, '/', None)
+
+        self.path = os.path.abspath(path)
+
+        # Load the index
+        if index is None:
+            index = tarindex.index_path(self.path)
+            if os.path.exists(index):
+                # Ignore an index left behind by an earlier archive
+                index = tarindex.TarIndex.load(index)
+                if not index.matches(self.path):
+                    index = False
+            else:
+                index = False
+        elif index is not False:
+            if not isinstance(index, tarindex.TarIndex):
+                index = tarindex.TarIndex.load(index)
+            if not index.matches(self.path):
+                raise ValueError("tar index does not match '%s'" %
+                                 self.path)
+        self._tarindex = index or None
+
+        # Determine the compression
+        if compression is utils.unset and self._tarindex is not None:
+            compression = self._tarindex.compression
+        elif compression is utils.unset:
+            compression = tarname.TarFileName(self.path).compression
+            if compression is None:
+                with open(self.path, 'rb') as f:
+                    compression = compress.detect(
+                        f.read(compress.MAGIC_SIZE))
+        self.compression = tarname.Compression.lookup_supported(compression)
+
+        self._members = {'/': None}
+        self._children = {'/': []}
+        self._index()
+
+    def _index(self):
+        """
+        Record each member and the directory structure, reading the
+        tar file once if there is no sidecar index.
+        """
+
+        if self._tarindex is not None:
+            for info in self._tarindex.members:
+                self._add(utils.abspath(info.name, cwd='/'), info)
+        else:
+            with self._open_stream() as f:
+                with tarfile.open(fileobj=f, mode='r:') as tar:
+                    for info in tar:
+                        self._add(utils.abspath(info.name, cwd='/'), info)
+
+        for children in self._children.values():
+            children.sort()
+
+    def _add(self, name, info):
+        """
+        Record a member, implying any missing parent directories.
+
+        :param name: The absolute name of the member.
+        :param info: The ``tarfile.TarInfo`` describing the member.
+        """
+
+        if name != '/':
+            parent, base = posixpath.split(name)
+            if parent not in self._members:
+                self._add(parent, None)
+            if name not in self._members:
+                self._children[parent].append(base)
+
+        # A later member with the same name replaces an earlier one
+        if info is not None or name not in self._members:
+            self._members[name] = info
+        if ((info is None or info.isdir() or
+             info.type == tarbuild.GNUTYPE_DUMPDIR) and
+                name not in self._children):
+            self._children[name] = []
+
+    def _get(self, name):
+        """
+        Retrieve the entry with the given name.
+
+        :param name: The absolute name of the entry.
+
+        :returns: A ``TarEntry``.  A ``KeyError`` is raised if there
+                  is no such entry.
+        """
+
+        if name == '/':
+            return self
+        return TarEntry(self, name, self._members[name])
+
+    def _lookup(self, name, follow):
+        """
+        Resolve the symbolic links in a name.
+
+        :param name: The absolute name to resolve.
+        :param follow: If ``True``, a symbolic link at the end of the
+                       name is followed as well.
+
+        :returns: The absolute name of the designated member.  A
+                  ``KeyError`` is raised if there is no such member
+                  or a symbolic link cannot be resolved.
+        """
+
+        links = 0
+        parts = [part for part in name.split('/') if part]
+        current = '/'
+        while parts:
+            current = posixpath.join(current, parts.pop(0))
+            info = self._members[current]
+            if info is None or not info.issym() or (not parts and
+                                                    not follow):
+                continue
+
+            # Substitute the target of the link
+            links += 1
+            if links > _MAX_LINKS or posixpath.isabs(info.linkname):
+                raise KeyError(name)
+            target = posixpath.normpath(posixpath.join(
+                posixpath.dirname(current), info.linkname))
+            parts[:0] = [part for part in target.split('/') if part]
+            current = '/'
+
+        return current
+
+    def _open_stream(self):
+        """
+        Open the tar file as a seekable stream of uncompressed data.
+
+        :returns: A file object.
+        """
+
+        if self._tarindex is not None:
+            return self._tarindex.open(self.path)
+        elif self.compression is None:
+            return open(self.path, 'rb')
+        return compress.reader(self.path, self.compression)
+
+    def _open_data(self, info):
+        """
+        Open the tar file for reading the data of a member.
+
+        :param info: The ``tarfile.TarInfo`` describing the member.
+
+        :returns: A seekable file object for the uncompressed data of
+                  the tar file.
+        """
+
+        return self._open_stream()
@@ -0,0 +1,227 @@
+# Copyright 2014 Kevin L. Mitchell
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import collections
+import errno
+import os
+import threading
+import uuid
+
+from fstree import removal
+
+
+# The number of times to retry moving a target into the trash when
+# the trash directory is removed out from under us
+RETRIES = 5
+
+
+def trash_path(path):
+    """
+    Compute the path of the trash directory for a tree: a hidden
+    sibling of the root of the tree, so that it is on the same file
+    system but outside the tree.  Keeping it outside means the trash
+    never shows up in walks, snapshots, digests or tar files of the
+    tree, and lets ``FSTree.cleanup()`` move the root of the tree
+    itself into the trash, which it could not do were the trash
+    inside the tree.
+
+    :param path: The absolute system path of the root of the tree.
+
+    :returns: The system path of the trash directory.  A
+              ``ValueError`` is raised if the path is not absolute,
+              or if it is the root of the file system, which has no
+              sibling to hold the trash.
+    """
+
+    dirname, basename = os.path.split(path.rstrip(os.sep))
+    if not os.path.isabs(path) or not basename:
+        raise ValueError("no trash directory for tree at '%s'" % path)
+
+    return os.path.join(dirname, '.%s.trash' % basename)
+
+
+def _abandoned(name):
+    """
+    Determine whether an item in the trash directory was left behind
+    by a process which has since exited.  Items are named for the
+    process which discarded them; items which are not named that way
+    are left alone.
+
+    :param name: The name of the item in the trash directory.
+
+    :returns: A ``True`` value if the process which discarded the
+              item no longer exists.
+    """
+
+    pid, sep, _rest = name.partition('-')
+    if not sep or not pid.isdigit():
+        return False
+
+    pid = int(pid)
+    if pid == os.getpid():
+        # Ours; another tree in this process is still removing it
+        return False
+
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return True
+    except OSError:
+        # Exists, but belongs to someone else
+        pass
+
+    return False
+
+
+class Trash(object):
+    """
+    Remove files and directory trees in the background.  Each target
+    is atomically renamed into a trash directory, then removed by a
+    background thread.  Anything found in the trash directory when
+    the ``Trash`` is created which was left behind by a process that
+    exited before removing it is removed as well; items belonging to
+    other live processes are left for them to remove.  The trash
+    directory itself is removed when the background thread runs out
+    of work.
+    """
+
+    def __init__(self, path, workers=None):
+        """
+        Initialize a ``Trash`` object.
+
+        :param path: The system path of the trash directory.  It must
+                     be on the same file system as the targets.
+        :param workers: If given, the number of threads used to remove
+                        each directory tree.  See
+                        ``removal.rmtree()``.
+        """
+
+        self.path = path
+        self.workers = workers
+
+        self._queue = collections.deque()
+        self._cond = threading.Condition()
+        self._thread = None
+
+        # Purge anything left behind by a crash
+        try:
+            stale = [name for name in os.listdir(path) if _abandoned(name)]
+        except OSError:
+            stale = []
+        if stale:
+            with self._cond:
+                self._schedule(os.path.join(path, name) for name in stale)
+
+    def _schedule(self, paths):
+        """
+        Queue paths in the trash directory for removal, starting the
+        background thread if necessary.  The condition must be held.
+
+        :param paths: An iterable of the system paths to remove.
+        """
+
+        self._queue.extend(paths)
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def _run(self):
+        """
+        The body of the background thread.  Removes the queued paths
+        until there are none left.
+        """
+
+        while True:
+            with self._cond:
+                if not self._queue:
+                    # Out of work; tidy up the trash directory and exit
+                    try:
+                        os.rmdir(self.path)
+                    except OSError:
+                        pass
+                    self._thread = None
+                    self._cond.notify_all()
+                    return
+
+                path = self._queue.popleft()
+
+            if os.path.isdir(path) and not os.path.islink(path):
+                removal.rmtree(path, ignore_errors=True,
+                               workers=self.workers)
+            else:
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+
+    def discard(self, path):
+        """
+        Move a file or directory tree into the trash, to be removed in
+        the background.  An ``OSError`` is raised if the target cannot
+        be renamed into the trash directory, e.g., because it is on a
+        different file system.
+
+        :param path: The system path to remove.
+        """
+
+        dest = os.path.join(self.path, '%d-%s' % (os.getpid(),
+                                                  uuid.uuid4().hex))
+        with self._cond:
+            for i in range(RETRIES):
+                # The trash directory is removed when it's empty, so
+                # it may need to be created
+                try:
+                    os.mkdir(self.path, 0o700)
+                except OSError as err:
+                    if err.errno != errno.EEXIST:
+                        raise
+
+                try:
+                    os.rename(path, dest)
+                    break
+                except OSError as err:
+                    # Another process may have removed the trash
+                    # directory between the mkdir and the rename; if
+                    # the target is still there, try again
+                    if (err.errno != errno.ENOENT or i == RETRIES - 1 or
+                            not os.path.lexists(path)):
+                        raise
+
+            self._schedule([dest])
+
+    @property
+    def pending(self):
+        """
+        Determine whether there are removals which have not yet
+        completed.
+        """
+
+        return self._thread is not None
+
+    def wait(self, timeout=None):
+        """
+        Wait for the pending removals to complete.
+
+        :param timeout: The maximum time to wait, in seconds.  If
+                        ``None`` (the default), waits indefinitely.
+
+        :returns: A ``True`` value if the removals completed, or
+                  ``False`` if the timeout expired first.
+        """
+
+        with self._cond:
+            return self._cond.wait_for(lambda: self._thread is None,
+                                       timeout)
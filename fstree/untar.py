@@ -0,0 +1,620 @@
+# Copyright 2014 Kevin L. Mitchell
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from concurrent import futures
+import collections
+import errno
+import os
+import posixpath
+import shutil
+import stat
+
+from fstree import compress
+from fstree import tarbuild
+from fstree import tarname
+from fstree import utils
+
+
+# Regular files no larger than this are read into memory and written
+# by the worker threads; larger files are written as they are read
+BUFFER_LIMIT = 1024 * 1024
+
+# The flags for creating a regular file without following a symbolic
+# link in its place
+_CREATE_FLAGS = (os.O_WRONLY | os.O_CREAT | os.O_TRUNC |
+                 getattr(os, 'O_NOFOLLOW', 0) | getattr(os, 'O_CLOEXEC', 0))
+
+# The flags for opening a directory without following a symbolic link
+# in its place
+_DIR_FLAGS = (os.O_RDONLY | getattr(os, 'O_DIRECTORY', 0) |
+              getattr(os, 'O_NOFOLLOW', 0) | getattr(os, 'O_CLOEXEC', 0))
+
+
+class _Prefixed(object):
+    """
+    A readable file object which returns some bytes already read from
+    another file object, followed by the rest of that file object.
+    This allows the magic number of a pipe to be examined.
+    """
+
+    def __init__(self, head, fileobj):
+        """
+        Initialize a ``_Prefixed`` object.
+
+        :param head: The bytes already read.
+        :param fileobj: The file object they were read from.
+        """
+
+        self._head = head
+        self._fileobj = fileobj
+
+    def read(self, size=-1):
+        """
+        Read data.
+
+        :param size: The maximum number of bytes to read.  If
+                     negative, reads to the end of the file.
+
+        :returns: The bytes read.
+        """
+
+        if not self._head:
+            return self._fileobj.read(size)
+
+        if size is None or size < 0:
+            data = self._head + self._fileobj.read()
+            self._head = b''
+        else:
+            data = self._head[:size]
+            self._head = self._head[size:]
+
+        return data
+
+    def close(self):
+        """
+        Close the file object.  The underlying file object is not
+        closed.
+        """
+
+        self._head = b''
+
+
+def _read_full(fileobj, size):
+    """
+    Read exactly ``size`` bytes from a file object, unless the end of
+    the file is reached first.  Pipes may return fewer bytes than
+    requested from a single read.
+
+    :param fileobj: The file object to read from.
+    :param size: The number of bytes to read.
+
+    :returns: The bytes read.
+    """
+
+    data = b''
+    while len(data) < size:
+        chunk = fileobj.read(size - len(data))
+        if not chunk:
+            break
+        data += chunk
+
+    return data
+
+
+def open_source(fileobj, compression=utils.unset):
+    """
+    Prepare a tar file for reading, decompressing it if necessary.
+
+    :param fileobj: A readable file object for the tar file.
+    :param compression: The compression of the tar file, or ``None``
+                        if it is not compressed.  If not given, the
+                        compression is determined from the magic
+                        number at the start of the file.
+
+    :returns: A readable file object for the uncompressed tar file.
+              A ``ValueError`` is raised if the compression is not
+              supported.
+    """
+
+    if compression is utils.unset:
+        head = _read_full(fileobj, compress.MAGIC_SIZE)
+        compression = compress.detect(head)
+        fileobj = _Prefixed(head, fileobj)
+
+    compression = tarname.Compression.lookup_supported(compression)
+    if compression is None:
+        return fileobj
+
+    return compress.reader(fileobj, compression)
+
+
+class Extractor(object):
+    """
+    Extract a tar file into a directory.  The archive is read
+    sequentially, but the regular files are written on a thread pool,
+    so that the cost of creating many small files is spread across
+    several threads.  The metadata of each file is applied once its
+    data has been written, and that of the directories is applied
+    last, deepest first, so that writing their contents does not
+    disturb it.  Members which would be created outside the
+    directory, or redirected outside the root by a symbolic link, and
+    symbolic links which would point outside the root, are rejected
+    with a ``ValueError``.  Every member is created relative to an
+    open descriptor of its parent directory, which is reached one
+    component at a time without following symbolic links that
+    resolve outside the root, so that members earlier in the archive
+    cannot redirect later ones.  The GNU dumpdir members of
+    incremental archives are replayed: the entries of the directory
+    which the dumpdir does not list are removed.
+    """
+
+    def __init__(self, path, root=None, workers=None):
+        """
+        Initialize an ``Extractor`` object.
+
+        :param path: The system path of the directory to extract the
+                     tar file into.
+        :param root: The system path of the directory which symbolic
+                     links must point within.  Defaults to ``path``.
+        :param workers: If given and greater than 1, the number of
+                        threads used to write regular files.
+        """
+
+        self.path = os.path.abspath(path)
+        self.root = os.path.realpath(root or self.path)
+        self.workers = workers if workers and workers > 1 else 1
+
+        # Only root may set the owners of the files
+        self.owner = hasattr(os, 'geteuid') and os.geteuid() == 0
+
+        self._dirs = []
+        self._written = {}
+        self._pending = collections.deque()
+        self._executor = None
+
+    def _within(self, path, top):
+        """
+        Determine whether a path is within a directory.
+
+        :param path: The normalized system path to test.
+        :param top: The system path of the directory.
+
+        :returns: A ``True`` value if ``path`` is ``top`` or is inside
+                  it, ``False`` otherwise.
+        """
+
+        return path == top or path.startswith(top.rstrip(os.sep) + os.sep)
+
+    def _split(self, name):
+        """
+        Split the name of a member into its components, making sure
+        that it is within the directory.
+
+        :param name: The name of the member.
+
+        :returns: A tuple of the components of the name, which is
+                  empty for the directory itself.
+        """
+
+        norm = posixpath.normpath(name)
+        if (posixpath.isabs(name) or norm == posixpath.pardir or
+                norm.startswith(posixpath.pardir + '/')):
+            raise ValueError("tar member '%s' is outside the tree" % name)
+        elif norm == posixpath.curdir:
+            return ()
+
+        return tuple(norm.split('/'))
+
+    def _open_real(self, path):
+        """
+        Open a directory within the root given its real path, without
+        following any symbolic links.
+
+        :param path: The real system path of the directory.
+
+        :returns: A file descriptor for the directory.
+        """
+
+        fd = os.open(self.root, _DIR_FLAGS)
+        try:
+            rel = os.path.relpath(path, self.root)
+            for part in ([] if rel == os.curdir else rel.split(os.sep)):
+                child = os.open(part, _DIR_FLAGS, dir_fd=fd)
+                os.close(fd)
+                fd = child
+        except Exception:
+            os.close(fd)
+            raise
+
+        return fd
+
+    def _step(self, fd, real, part, create=False, mode=0o777):
+        """
+        Open a subdirectory of an open directory.  A symbolic link in
+        its place is only followed if it resolves within the root.
+
+        :param fd: A file descriptor for the directory.
+        :param real: The real system path of the directory.
+        :param part: The name of the subdirectory.
+        :param create: If ``True``, the subdirectory is created if it
+                       does not exist.
+        :param mode: The mode to create the subdirectory with.
+
+        :returns: A tuple of a file descriptor for the subdirectory
+                  and its real system path.
+        """
+
+        try:
+            return (os.open(part, _DIR_FLAGS, dir_fd=fd),
+                    os.path.join(real, part))
+        except OSError as err:
+            if err.errno == errno.ENOENT and create:
+                os.mkdir(part, mode, dir_fd=fd)
+                return (os.open(part, _DIR_FLAGS, dir_fd=fd),
+                        os.path.join(real, part))
+            elif not stat.S_ISLNK(os.lstat(part, dir_fd=fd).st_mode):
+                raise
+
+        # A symbolic link; resolve it and make sure it stays within
+        # the root
+        path = os.path.realpath(os.path.join(real, part))
+        if not self._within(path, self.root):
+            raise ValueError("'%s' links outside the tree" %
+                             os.path.join(real, part))
+
+        return self._open_real(path), path
+
+    def _open_dir(self, parts, create=False):
+        """
+        Open a directory within the directory.
+
+        :param parts: A sequence of the components of the name of the
+                      directory.
+        :param create: If ``True``, missing directories are created.
+
+        :returns: A tuple of a file descriptor for the directory and
+                  its real system path.
+        """
+
+        fd = os.open(self.path, _DIR_FLAGS & ~getattr(os, 'O_NOFOLLOW', 0))
+        real = os.path.realpath(self.path)
+        try:
+            for part in parts:
+                child, real = self._step(fd, real, part, create)
+                os.close(fd)
+                fd = child
+        except Exception:
+            os.close(fd)
+            raise
+
+        return fd, real
+
+    def _apply_fd(self, fd, info):
+        """
+        Apply the metadata of a member to an open file or directory.
+
+        :param fd: The file descriptor of the file.
+        :param info: The ``tarfile.TarInfo`` describing the member.
+        """
+
+        if self.owner:
+            os.fchown(fd, info.uid, info.gid)
+        os.fchmod(fd, info.mode)
+        os.utime(fd, (info.mtime, info.mtime))
+
+    def _apply(self, dir_fd, base, info):
+        """
+        Apply the metadata of a member to the file created for it.
+
+        :param dir_fd: A file descriptor for the parent directory.
+        :param base: The name of the file within the directory.
+        :param info: The ``tarfile.TarInfo`` describing the member.
+        """
+
+        if self.owner:
+            os.chown(base, info.uid, info.gid, dir_fd=dir_fd,
+                     follow_symlinks=False)
+        if info.issym():
+            if os.utime in os.supports_follow_symlinks:
+                os.utime(base, (info.mtime, info.mtime), dir_fd=dir_fd,
+                         follow_symlinks=False)
+            return
+
+        os.chmod(base, info.mode, dir_fd=dir_fd)
+        os.utime(base, (info.mtime, info.mtime), dir_fd=dir_fd,
+                 follow_symlinks=False)
+
+    def _write(self, dir_fd, base, info, data):
+        """
+        Write a regular file and apply its metadata.  The file
+        descriptor of the parent directory is closed.
+
+        :param dir_fd: A file descriptor for the parent directory.
+        :param base: The name of the file within the directory.
+        :param info: The ``tarfile.TarInfo`` describing the member.
+        :param data: The contents of the file, as bytes or a readable
+                     file object.
+        """
+
+        try:
+            try:
+                fd = os.open(base, _CREATE_FLAGS, 0o600, dir_fd=dir_fd)
+            except OSError as err:
+                # Replace a symbolic link rather than writing through
+                # it
+                if err.errno != errno.ELOOP:
+                    raise
+                os.unlink(base, dir_fd=dir_fd)
+                fd = os.open(base, _CREATE_FLAGS, 0o600, dir_fd=dir_fd)
+        finally:
+            os.close(dir_fd)
+
+        with os.fdopen(fd, 'wb') as f:
+            if isinstance(data, bytes):
+                f.write(data)
+            else:
+                shutil.copyfileobj(data, f, utils.MAX_BLOCKSIZE)
+            f.flush()
+
+            self._apply_fd(f.fileno(), info)
+
+    def _submit(self, name, func, *args):
+        """
+        Run a function on the thread pool, bounding the number of
+        functions in flight.
+
+        :param name: The name of the member the function creates.
+        :param func: The function to run.
+        :param args: The arguments for the function.
+        """
+
+        while len(self._pending) >= 2 * self.workers:
+            self._pending.popleft().result()
+
+        future = self._executor.submit(func, *args)
+        self._pending.append(future)
+        self._written[name] = future
+
+    def _replace(self, dir_fd, base):
+        """
+        Remove any non-directory in the way of a new member.
+
+        :param dir_fd: A file descriptor for the parent directory.
+        :param base: The name of the new member within the directory.
+        """
+
+        try:
+            os.unlink(base, dir_fd=dir_fd)
+        except OSError as err:
+            if err.errno != errno.ENOENT:
+                raise
+
+    def _remove_tree(self, dir_fd, base):
+        """
+        Remove a directory tree without following symbolic links.
+
+        :param dir_fd: A file descriptor for the parent directory.
+        :param base: The name of the directory within the parent.
+        """
+
+        fd = os.open(base, _DIR_FLAGS, dir_fd=dir_fd)
+        try:
+            self._purge(fd, set())
+        finally:
+            os.close(fd)
+        os.rmdir(base, dir_fd=dir_fd)
+
+    def _purge(self, dir_fd, names):
+        """
+        Remove the entries of a directory which are not listed.
+
+        :param dir_fd: A file descriptor for the directory.
+        :param names: A set of the names of the entries to keep.
+        """
+
+        for name in os.listdir(dir_fd):
+            if name in names:
+                continue
+
+            if stat.S_ISDIR(os.lstat(name, dir_fd=dir_fd).st_mode):
+                self._remove_tree(dir_fd, name)
+            else:
+                os.unlink(name, dir_fd=dir_fd)
+
+    def _check_link(self, info, real):
+        """
+        Make sure a symbolic link points within the root.  Any
+        ``..`` components must lead the target, so that no symbolic
+        link it passes through can carry it back out of the root, and
+        the target must resolve within the root.
+
+        :param info: The ``tarfile.TarInfo`` describing the member.
+        :param real: The real system path of the directory the link
+                     is created in.
+        """
+
+        seen = False
+        for part in info.linkname.split('/'):
+            if part == posixpath.pardir:
+                if seen:
+                    break
+            elif part not in ('', posixpath.curdir):
+                seen = True
+        else:
+            if not os.path.isabs(info.linkname) and self._within(
+                    os.path.realpath(os.path.join(real, info.linkname)),
+                    self.root):
+                return
+
+        raise ValueError("tar member '%s' links outside the tree" %
+                         info.name)
+
+    def member(self, tar, info):
+        """
+        Extract a single member.  This must be called for the members
+        in the order they appear in the archive.
+
+        :param tar: The ``tarfile.TarFile`` being read.
+        :param info: The ``tarfile.TarInfo`` describing the member.
+
+        :returns: The system path of the member, or ``None`` if the
+                  member was skipped.
+        """
+
+        parts = self._split(info.name)
+        name = '/'.join(parts) or posixpath.curdir
+        full = os.path.join(self.path, *parts)
+
+        if info.isdir() or info.type == tarbuild.GNUTYPE_DUMPDIR:
+            dumpdir = info.type == tarbuild.GNUTYPE_DUMPDIR
+            if not parts:
+                fd, real = self._open_dir(parts)
+            else:
+                pfd, real = self._open_dir(parts[:-1], True)
+                try:
+                    if dumpdir:
+                        # Never remove entries through a symbolic link
+                        try:
+                            st = os.lstat(parts[-1], dir_fd=pfd)
+                        except OSError as err:
+                            if err.errno != errno.ENOENT:
+                                raise
+                        else:
+                            if not stat.S_ISDIR(st.st_mode):
+                                self._replace(pfd, parts[-1])
+
+                    # Keep the directory writable until its metadata
+                    # is set
+                    fd, real = self._step(pfd, real, parts[-1], True,
+                                          0o700)
+                finally:
+                    os.close(pfd)
+
+            try:
+                self._dirs.append((parts, info))
+
+                if dumpdir:
+                    # Remove the entries deleted since the last archive
+                    data = tar.extractfile(info).read()
+                    self._purge(fd, set(
+                        entry for _flag, entry in
+                        tarbuild.parse_dumpdir(data)))
+            finally:
+                os.close(fd)
+            return full
+
+        # Make sure the parent directory exists
+        dir_fd, real = self._open_dir(parts[:-1], True)
+        base = parts[-1]
+
+        if info.isreg():
+            # The parent directory is closed by _write()
+            if self._executor is not None and info.size <= BUFFER_LIMIT:
+                # Read it now, write it later
+                try:
+                    self._submit(name, self._write, dir_fd, base, info,
+                                 tar.extractfile(info).read())
+                except Exception:
+                    os.close(dir_fd)
+                    raise
+            else:
+                self._write(dir_fd, base, info, tar.extractfile(info))
+            return full
+
+        try:
+            if info.issym():
+                # The link must stay within the root
+                self._check_link(info, real)
+                self._replace(dir_fd, base)
+                os.symlink(info.linkname, base, dir_fd=dir_fd)
+                self._apply(dir_fd, base, info)
+            elif info.islnk():
+                # Wait for the file being linked to be written
+                source = self._split(info.linkname)
+                if not source:
+                    raise ValueError("tar member '%s' links to the tree" %
+                                     info.name)
+                pending = self._written.get('/'.join(source))
+                if pending is not None:
+                    pending.result()
+                src_fd, _real = self._open_dir(source[:-1])
+                try:
+                    self._replace(dir_fd, base)
+                    os.link(source[-1], base, src_dir_fd=src_fd,
+                            dst_dir_fd=dir_fd, follow_symlinks=False)
+                finally:
+                    os.close(src_fd)
+            elif info.isfifo():
+                self._replace(dir_fd, base)
+                os.mkfifo(base, dir_fd=dir_fd)
+                self._apply(dir_fd, base, info)
+            elif info.isdev() and self.owner:
+                self._replace(dir_fd, base)
+                os.mknod(base, info.mode | (stat.S_IFCHR if info.ischr() else
+                                            stat.S_IFBLK),
+                         os.makedev(info.devmajor, info.devminor),
+                         dir_fd=dir_fd)
+                self._apply(dir_fd, base, info)
+            else:
+                # Not something we can create
+                return None
+        finally:
+            os.close(dir_fd)
+
+        return full
+
+    def extract(self, tar):
+        """
+        Extract all the members of a tar file.
+
+        :param tar: The ``tarfile.TarFile`` to read, which may be
+                    opened in stream mode.
+        """
+
+        if self.workers > 1:
+            self._executor = futures.ThreadPoolExecutor(self.workers)
+
+        try:
+            for info in tar:
+                self.member(tar, info)
+
+            # Wait for the files to be written
+            while self._pending:
+                self._pending.popleft().result()
+        finally:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+            self._written.clear()
+
+        # Set the directory metadata, deepest first, skipping any
+        # which have since been replaced
+        for parts, info in sorted(self._dirs, key=lambda d: d[0],
+                                  reverse=True):
+            try:
+                fd, _real = self._open_dir(parts[:-1])
+                if parts:
+                    try:
+                        child = os.open(parts[-1], _DIR_FLAGS, dir_fd=fd)
+                    finally:
+                        os.close(fd)
+                    fd = child
+            except (OSError, ValueError):
+                continue
+            try:
+                self._apply_fd(fd, info)
+            finally:
+                os.close(fd)
+        self._dirs = []
@@ -14,8 +14,11 @@
 #    under the License.
 
 import contextlib
+import errno
 import hashlib
+import mmap
 import os
+import select
 
 import six
 
@@ -24,6 +27,13 @@ import six
 # that file.
 BLOCKSIZE = 64 * 1024
 
+# The largest block size used by digest_file()
+MAX_BLOCKSIZE = 1024 * 1024
+
+# Files at least this large are mapped into memory by digest_file(),
+# rather than read
+MMAP_THRESHOLD = 8 * 1024 * 1024
+
 # The default hash algorithm to use.
 DEFAULT_HASHER = 'md5'
 
@@ -224,6 +234,222 @@ def digest(fo, digesters):
     return digesters[0].hexdigest()
 
 
+def blocksize(size):
+    """
+    Select the block size for reading a file of a given size: the
+    smallest power of two which holds the whole file, but no less
+    than ``BLOCKSIZE`` and no more than ``MAX_BLOCKSIZE``.
+
+    :param size: The size of the file, in bytes.
+
+    :returns: The block size.
+    """
+
+    result = BLOCKSIZE
+    while result < size and result < MAX_BLOCKSIZE:
+        result *= 2
+    return result
+
+
+def _digest_mmap(fo, size, digesters):
+    """
+    A helper for ``digest_file()`` which digests a file by mapping it
+    into memory.
+
+    :param fo: The file object, open for reading in binary mode.
+    :param size: The size of the file.
+    :param digesters: A sequence of digesters.
+
+    :returns: A ``True`` value if the file was digested, ``False`` if
+              it could not be mapped.
+    """
+
+    try:
+        mapped = mmap.mmap(fo.fileno(), 0, access=mmap.ACCESS_READ)
+    except (EnvironmentError, ValueError):
+        return False
+
+    try:
+        with memoryview(mapped) as view:
+            # Feed the digesters a block at a time, so that each block
+            # is still in the CPU cache for the next digester
+            for offset in range(0, size, MAX_BLOCKSIZE):
+                with view[offset:offset + MAX_BLOCKSIZE] as block:
+                    for digester in digesters:
+                        digester.update(block)
+    finally:
+        mapped.close()
+
+    return True
+
+
+def digest_file(path, digesters):
+    """
+    Digest the contents of a file without copying the data more than
+    necessary.  Small files are read into a single reused buffer in
+    blocks sized to suit the file; large files are mapped into
+    memory.
+
+    :param path: The system path of the file.
+    :param digesters: A sequence of digesters.  Each digester is the
+                      result of calling the callable returned by
+                      ``get_hasher()``.
+
+    :returns: For convenience, returns the hex digest of the first
+              digester in ``digesters``.
+    """
+
+    with open(path, 'rb', 0) as fo:
+        size = os.fstat(fo.fileno()).st_size
+        if size < MMAP_THRESHOLD or not _digest_mmap(fo, size, digesters):
+            buf = bytearray(blocksize(size))
+            view = memoryview(buf)
+            while True:
+                count = fo.readinto(buf)
+                if not count:
+                    # Hit end of file
+                    break
+
+                # Update each digester
+                block = view[:count]
+                for digester in digesters:
+                    digester.update(block)
+
+    # A convenience return
+    return digesters[0].hexdigest()
+
+
+class TeeWriter(object):
+    """
+    A write-only file object which passes the data written to it on
+    to another file object or socket, feeding it to a set of
+    digesters on the way.  This allows the digest of a stream to be
+    computed as it is written, without reading it back.
+    """
+
+    def __init__(self, fileobj, digesters=()):
+        """
+        Initialize a ``TeeWriter`` object.
+
+        :param fileobj: The file object to write to.  May also be a
+                        socket, in which case its ``sendall()`` method
+                        is used.  It is not closed when the
+                        ``TeeWriter`` is.
+        :param digesters: A sequence of digesters to feed the data
+                          to.
+        """
+
+        self.fileobj = fileobj
+        self.digesters = tuple(digesters)
+        self.count = 0
+        self.closed = False
+
+        # A socket's sendall() returns None once everything is sent
+        self._write = getattr(fileobj, 'write', None)
+        self._sendall = self._write is None
+        if self._sendall:
+            self._write = fileobj.sendall
+
+    def write(self, data):
+        """
+        Write data.
+
+        :param data: The bytes to write.
+
+        :returns: The number of bytes written.
+        """
+
+        view = memoryview(data)
+        length = len(view)
+        for digester in self.digesters:
+            digester.update(view)
+
+        # Raw files may write less than we asked for
+        offset = 0
+        while offset < length:
+            written = self._write(view[offset:])
+            if written is None:
+                if self._sendall:
+                    break
+
+                # A non-blocking file wrote nothing; wait until it can
+                # take more
+                self._wait(offset)
+                continue
+            offset += written
+
+        self.count += length
+        return length
+
+    def _wait(self, offset):
+        """
+        Wait for a non-blocking file object to become writable.  A
+        ``BlockingIOError`` is raised if it has no file descriptor to
+        wait on.
+
+        :param offset: The number of bytes of the current write which
+                       have been written.
+        """
+
+        try:
+            fd = self.fileobj.fileno()
+        except (AttributeError, OSError, ValueError):
+            raise BlockingIOError(errno.EAGAIN, "write would block",
+                                  offset)
+
+        select.select([], [fd], [])
+
+    def tell(self):
+        """
+        Retrieve the number of bytes written.
+        """
+
+        return self.count
+
+    def flush(self):
+        """
+        Flush the underlying file object.
+        """
+
+        if hasattr(self.fileobj, 'flush'):
+            self.fileobj.flush()
+
+    def close(self):
+        """
+        Close the ``TeeWriter``.  The underlying file object is
+        flushed, but not closed.
+        """
+
+        if not self.closed:
+            self.flush()
+            self.closed = True
+
+    def hexdigest(self):
+        """
+        Retrieve the hex digest of the data written so far, from the
+        first digester.
+        """
+
+        return self.digesters[0].hexdigest()
+
+
+def mtime_ns(st):
+    """
+    Retrieve the modification time from a stat result, in integer
+    nanoseconds.
+
+    :param st: The result of ``os.stat()`` or ``os.lstat()``.
+
+    :returns: The modification time in nanoseconds.
+    """
+
+    try:
+        return st.st_mtime_ns
+    except AttributeError:  # pragma: no cover
+        # Older Pythons only have the float
+        return int(st.st_mtime * 1000000000)
+
+
 def apply_ignore(ignore, dirpath, dirnames, filenames):
     """
     A utility function to apply a file ignore filter to a tuple
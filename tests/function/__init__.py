@@ -12,3 +12,52 @@
 #    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
 #    License for the specific language governing permissions and limitations
 #    under the License.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from fstree import entry
+
+
+def make_tree(root):
+    for dirname in ('a', 'a/b', 'c'):
+        os.mkdir(os.path.join(root, dirname))
+    for filename in ('f1', 'a/f2', 'a/b/f3', 'c/f4'):
+        with open(os.path.join(root, filename), 'w') as f:
+            f.write(filename)
+    os.symlink('a', os.path.join(root, 'link'))
+
+
+def backdate(path):
+    # Push modification times back, so that digests of the files are
+    # not too recent to cache
+    old = os.stat(path).st_mtime - 3600
+    if not os.path.isdir(path):
+        os.utime(path, (old, old))
+    for dirpath, dirnames, filenames in os.walk(path):
+        for name in filenames:
+            os.utime(os.path.join(dirpath, name), (old, old))
+
+
+class TreeTestCase(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        make_tree(self.root)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+
+class ArchiveTestCase(TreeTestCase):
+    def setUp(self):
+        super(ArchiveTestCase, self).setUp()
+
+        self.outdir = tempfile.mkdtemp()
+        self.tree = entry.FSTree(self.root)
+
+    def tearDown(self):
+        shutil.rmtree(self.outdir)
+
+        super(ArchiveTestCase, self).tearDown()
@@ -0,0 +1,237 @@
+# Copyright 2014 Kevin L. Mitchell
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import errno
+import os
+import shutil
+
+import mock
+
+from fstree import copyengine
+from fstree import entry
+
+import tests.function
+
+
+class CopyEngineTest(tests.function.TreeTestCase):
+    def setUp(self):
+        super(CopyEngineTest, self).setUp()
+
+        self.data = os.urandom(200 * 1024 + 3)
+        self.src = os.path.join(self.root, 'src')
+        with open(self.src, 'wb') as f:
+            f.write(self.data)
+        os.utime(self.src, (1000, 2000))
+
+    def read(self, path):
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def test_methods(self):
+        for method in copyengine.available():
+            callback = mock.Mock()
+            engine = copyengine.CopyEngine([method], callback)
+            dst = os.path.join(self.root, 'dst-%s' % method)
+
+            result = engine.copyfile(self.src, dst)
+
+            # Reflinks may not be supported by the file system
+            self.assertTrue(result in (method, copyengine.BUFFERED))
+            callback.assert_called_once_with(self.src, dst, result)
+            self.assertEqual(self.read(dst), self.data)
+
+    def test_empty(self):
+        src = os.path.join(self.root, 'empty')
+        open(src, 'wb').close()
+        engine = copyengine.CopyEngine()
+
+        engine.copyfile(src, os.path.join(self.root, 'dst'))
+
+        self.assertEqual(self.read(os.path.join(self.root, 'dst')), b'')
+
+    def test_unsupported(self):
+        def partial(src_fd, dst_fd, size):
+            os.write(dst_fd, b'garbage')
+            raise OSError(errno.EXDEV, 'cross-device')
+
+        engine = copyengine.CopyEngine()
+        dst = os.path.join(self.root, 'dst')
+        impls = dict((m, partial) for m in copyengine.METHODS
+                     if m != copyengine.BUFFERED)
+
+        with mock.patch.dict(copyengine._IMPLEMENTATIONS, impls):
+            self.assertEqual(engine.copyfile(self.src, dst),
+                             copyengine.BUFFERED)
+            self.assertEqual(self.read(dst), self.data)
+
+            # The failed methods are not tried again
+            impls[copyengine.COPY_FILE_RANGE] = mock.Mock()
+            with mock.patch.dict(copyengine._IMPLEMENTATIONS, impls):
+                engine.copyfile(self.src, dst)
+            self.assertFalse(impls[copyengine.COPY_FILE_RANGE].called)
+
+        self.assertEqual(engine.stats[copyengine.BUFFERED], 2)
+
+    def test_error(self):
+        engine = copyengine.CopyEngine([copyengine.COPY_FILE_RANGE])
+        impl = mock.Mock(side_effect=OSError(errno.ENOSPC, 'full'))
+
+        with mock.patch.dict(copyengine._IMPLEMENTATIONS,
+                             {copyengine.COPY_FILE_RANGE: impl}):
+            if copyengine.COPY_FILE_RANGE in engine.methods:
+                self.assertRaises(OSError, engine.copyfile, self.src,
+                                  os.path.join(self.root, 'dst'))
+
+    def test_same_file(self):
+        engine = copyengine.CopyEngine()
+
+        self.assertRaises(shutil.Error, engine.copyfile, self.src, self.src)
+
+    def test_copy2(self):
+        engine = copyengine.CopyEngine()
+
+        result = engine.copy2(self.src, os.path.join(self.root, 'a'))
+
+        self.assertEqual(result, os.path.join(self.root, 'a', 'src'))
+        self.assertEqual(os.stat(result).st_mtime, 2000)
+        self.assertEqual(self.read(result), self.data)
+
+    def test_copy2_symlink(self):
+        engine = copyengine.CopyEngine()
+        dst = os.path.join(self.root, 'dst')
+
+        engine.copy2(os.path.join(self.root, 'link'), dst,
+                     follow_symlinks=False)
+
+        self.assertEqual(os.readlink(dst), 'a')
+        self.assertEqual(engine.stats[copyengine.SYMLINK], 1)
+
+    def test_copytree(self):
+        callback = mock.Mock()
+        engine = copyengine.CopyEngine(callback=callback)
+        dst = os.path.join(self.root, 'copy')
+
+        engine.copytree(os.path.join(self.root, 'a'), dst)
+
+        self.assertEqual(self.read(os.path.join(dst, 'b', 'f3')), b'a/b/f3')
+        self.assertEqual(callback.call_count, 2)
+
+
+class FSEntryCopyEngineTest(tests.function.TreeTestCase):
+    def test_copy_reports(self):
+        callback = mock.Mock()
+        tree = entry.FSTree(self.root,
+                            copy_engine=copyengine.CopyEngine(
+                                callback=callback))
+
+        tree.copy(tree['/c'], '/d')
+
+        callback.assert_called_once_with(
+            os.path.join(self.root, 'c', 'f4'),
+            os.path.join(self.root, 'd', 'f4'), mock.ANY)
+        self.assertTrue(os.path.isfile(os.path.join(self.root, 'd', 'f4')))
+
+    def test_set(self):
+        tree = entry.FSTree(self.root)
+
+        tree['/f5'] = os.path.join(self.root, 'f1')
+
+        with open(os.path.join(self.root, 'f5')) as f:
+            self.assertEqual(f.read(), 'f1')
+
+    def test_link_fallback(self):
+        tree = entry.FSTree(self.root)
+        real_link = os.link
+
+        def link(src, dst):
+            if src.endswith('f3'):
+                raise OSError(errno.EXDEV, 'cross-device')
+            real_link(src, dst)
+
+        with mock.patch('os.link', side_effect=link):
+            tree.link(tree['/a'], '/d', fallback=True)
+
+        self.assertEqual(os.stat(os.path.join(self.root, 'a', 'f2')).st_ino,
+                         os.stat(os.path.join(self.root, 'd', 'f2')).st_ino)
+        self.assertNotEqual(
+            os.stat(os.path.join(self.root, 'a', 'b', 'f3')).st_ino,
+            os.stat(os.path.join(self.root, 'd', 'b', 'f3')).st_ino)
+        self.assertEqual(sum(tree._copy_engine.stats.values()), 1)
+
+    def test_link_no_fallback(self):
+        tree = entry.FSTree(self.root)
+
+        with mock.patch('os.link',
+                        side_effect=OSError(errno.EXDEV, 'cross-device')):
+            self.assertRaises(OSError, tree.link, tree['/f1'], '/f5')
+
+
+class ParallelCopyTreeTest(tests.function.TreeTestCase):
+    def listing(self, top):
+        result = []
+        for dirpath, dirs, files in os.walk(top):
+            for name in dirs + files:
+                path = os.path.join(dirpath, name)
+                result.append((path[len(top):], os.path.islink(path),
+                               os.path.isdir(path)))
+        return sorted(result)
+
+    def test_matches_serial(self):
+        engine = copyengine.CopyEngine()
+        serial = os.path.join(self.root, 'serial')
+        parallel = os.path.join(self.root, 'parallel')
+        for name in ('a', 'c'):
+            os.utime(os.path.join(self.root, name), (1000, 2000))
+
+        for symlinks in (False, True):
+            src = self.root
+            engine.copytree(src, serial, symlinks=symlinks,
+                            ignore=lambda d, n: ['serial', 'parallel'])
+            engine.copytree(src, parallel, symlinks=symlinks,
+                            ignore=lambda d, n: ['serial', 'parallel'],
+                            workers=4)
+
+            self.assertEqual(self.listing(parallel), self.listing(serial))
+            self.assertEqual(os.path.islink(os.path.join(parallel, 'link')),
+                             symlinks)
+            with open(os.path.join(parallel, 'a', 'b', 'f3')) as f:
+                self.assertEqual(f.read(), 'a/b/f3')
+
+            # Directory times survive the files being written
+            self.assertEqual(os.stat(os.path.join(parallel, 'a')).st_mtime,
+                             2000)
+            self.assertEqual(os.stat(os.path.join(parallel, 'c')).st_mtime,
+                             2000)
+
+            shutil.rmtree(serial)
+            shutil.rmtree(parallel)
+
+    def test_errors(self):
+        engine = copyengine.CopyEngine()
+        os.symlink('missing', os.path.join(self.root, 'a', 'broken'))
+        dst = os.path.join(self.root, 'copy')
+
+        self.assertRaises(shutil.Error, engine.copytree,
+                          os.path.join(self.root, 'a'), dst, workers=2)
+        self.assertTrue(os.path.isfile(os.path.join(dst, 'b', 'f3')))
+
+    def test_fsentry_copy(self):
+        tree = entry.FSTree(self.root)
+
+        result = tree.copy(tree['/a'], '/d', workers=3)
+
+        self.assertEqual(result.name, '/d')
+        self.assertEqual(self.listing(os.path.join(self.root, 'd')),
+                         self.listing(os.path.join(self.root, 'a')))
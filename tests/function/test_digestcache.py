@@ -0,0 +1,162 @@
+# Copyright 2014 Kevin L. Mitchell
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import hashlib
+import os
+import unittest
+
+import mock
+
+from fstree import digestcache
+from fstree import entry
+
+import tests.function
+
+
+def _xattrs_supported(path):
+    if not hasattr(os, 'setxattr'):
+        return False
+
+    try:
+        os.setxattr(path, 'user.fstree.test', b'x')
+    except OSError:
+        return False
+
+    os.removexattr(path, 'user.fstree.test')
+    return True
+
+
+class DigestCacheTest(tests.function.TreeTestCase):
+    def setUp(self):
+        super(DigestCacheTest, self).setUp()
+
+        tests.function.backdate(self.root)
+
+    def check_cache(self, store):
+        cache = digestcache.DigestCache(store)
+        path = os.path.join(self.root, 'f1')
+        expected = hashlib.sha256(b'f1').hexdigest()
+
+        self.assertEqual(cache.digest(path, 'sha256'), expected)
+        with mock.patch.object(digestcache, 'open', create=True) as mock_open:
+            self.assertEqual(cache.digest(path, 'sha256'), expected)
+            self.assertFalse(mock_open.called)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+        # Change the file; the new size must be noticed
+        with open(path, 'wb') as f:
+            f.write(b'changed')
+        tests.function.backdate(path)
+        self.assertEqual(cache.digest(path, 'sha256'),
+                         hashlib.sha256(b'changed').hexdigest())
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+        # A different algorithm is cached separately
+        self.assertEqual(cache.digest(path, 'md5'),
+                         hashlib.md5(b'changed').hexdigest())
+        self.assertEqual((cache.hits, cache.misses), (1, 3))
+
+    def test_memory(self):
+        self.check_cache(digestcache.MemoryStore())
+
+    def test_default_store(self):
+        cache = digestcache.DigestCache()
+
+        self.assertTrue(isinstance(cache.store, digestcache.MemoryStore))
+
+    def test_sqlite(self):
+        dbname = os.path.join(self.root, 'digests.db')
+        store = digestcache.SQLiteStore(dbname)
+        self.check_cache(store)
+        store.close()
+
+        # The digests persist
+        store = digestcache.SQLiteStore(dbname)
+        cache = digestcache.DigestCache(store)
+        cache.digest(os.path.join(self.root, 'f1'), 'sha256')
+        store.close()
+
+        self.assertEqual((cache.hits, cache.misses), (1, 0))
+
+    def test_xattr(self):
+        if not _xattrs_supported(os.path.join(self.root, 'f1')):
+            raise unittest.SkipTest('extended attributes not supported')
+
+        self.check_cache(digestcache.XattrStore())
+
+    def test_changed_while_reading(self):
+        cache = digestcache.DigestCache()
+        path = os.path.join(self.root, 'f1')
+        stats = [os.stat(path)]
+        with open(path, 'ab') as f:
+            f.write(b'x')
+        stats.append(os.stat(path))
+
+        with mock.patch('os.stat', side_effect=stats):
+            cache.digest(path, 'sha256')
+
+        self.assertEqual(len(cache.store._cache), 0)
+
+    def test_racy(self):
+        cache = digestcache.DigestCache()
+        path = os.path.join(self.root, 'f1')
+        os.utime(path, None)
+        st = os.stat(path)
+
+        self.assertEqual(cache.digest(path, 'sha256'),
+                         hashlib.sha256(b'f1').hexdigest())
+        cache.seed(path, 'md5', hashlib.md5(b'f1').hexdigest())
+
+        # Rewritten within the same tick, with the same size
+        with open(path, 'wb') as f:
+            f.write(b'F1')
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns))
+
+        self.assertEqual(cache.digest(path, 'sha256'),
+                         hashlib.sha256(b'F1').hexdigest())
+        self.assertEqual(cache.digest(path, 'md5'),
+                         hashlib.md5(b'F1').hexdigest())
+        self.assertEqual((cache.hits, cache.misses), (0, 3))
+
+
+class TreeDigestCacheTest(tests.function.TreeTestCase):
+    def setUp(self):
+        super(TreeDigestCacheTest, self).setUp()
+
+        tests.function.backdate(self.root)
+
+    def test_digest(self):
+        cache = digestcache.DigestCache()
+        tree = entry.FSTree(self.root, digest_cache=cache)
+
+        self.assertEqual(tree.digest('f1', 'sha256'),
+                         hashlib.sha256(b'f1').hexdigest())
+        self.assertEqual(tree['a/f2'].digest(hasher='sha256'),
+                         hashlib.sha256(b'a/f2').hexdigest())
+        self.assertEqual(tree.digest('f1', 'sha256'),
+                         hashlib.sha256(b'f1').hexdigest())
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+    def test_snapshot(self):
+        cache = digestcache.DigestCache()
+        tree = entry.FSTree(self.root, digest_cache=cache)
+
+        first = tree.snapshot(hasher='sha256')
+        second = tree.snapshot(hasher='sha256')
+
+        self.assertEqual(first['/c/f4'].digest,
+                         hashlib.sha256(b'c/f4').hexdigest())
+        self.assertEqual(second['/c/f4'].digest, first['/c/f4'].digest)
+        self.assertEqual((cache.hits, cache.misses), (4, 4))
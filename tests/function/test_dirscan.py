@@ -0,0 +1,191 @@
+# Copyright 2014 Kevin L. Mitchell
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import stat
+import unittest
+
+import mock
+
+from fstree import dirscan
+from fstree import utils
+
+import tests.function
+
+
+def collect(walker):
+    return [(dirpath, sorted(e.name for e in dirs),
+             sorted(e.name for e in files))
+            for dirpath, dirs, files in walker]
+
+
+class ScanEntryTest(tests.function.TreeTestCase):
+    def test_types(self):
+        entries = dict((e.name, e) for e in dirscan.scandir(self.root))
+
+        self.assertEqual(entries['a'].dtype, stat.S_IFDIR)
+        self.assertEqual(entries['f1'].dtype, stat.S_IFREG)
+        self.assertEqual(entries['link'].dtype, stat.S_IFLNK)
+        self.assertTrue(entries['link'].is_dir())
+        self.assertFalse(entries['link'].is_dir(follow_symlinks=False))
+        self.assertTrue(entries['link'].is_symlink())
+        self.assertTrue(entries['f1'].is_file())
+
+    def test_seed_unfetched(self):
+        ent = dirscan.ScanEntry(self.root, 'f1')
+        target = mock.Mock(_stat=utils.unset, _lstat=utils.unset)
+
+        ent.seed(target)
+
+        self.assertEqual(target._stat, utils.unset)
+        self.assertEqual(target._lstat, utils.unset)
+
+    def test_seed_file(self):
+        ent = dirscan.ScanEntry(self.root, 'f1')
+        st = ent.lstat()
+        target = mock.Mock(_stat=utils.unset, _lstat=utils.unset)
+
+        ent.seed(target)
+
+        self.assertEqual(target._stat, st)
+        self.assertEqual(target._lstat, st)
+
+    def test_seed_symlink(self):
+        ent = dirscan.ScanEntry(self.root, 'link')
+        lst = ent.lstat()
+        target = mock.Mock(_stat=utils.unset, _lstat=utils.unset)
+
+        ent.seed(target)
+
+        self.assertEqual(target._stat, utils.unset)
+        self.assertEqual(target._lstat, lst)
+
+        st = ent.stat()
+        ent.seed(target)
+
+        self.assertTrue(stat.S_ISDIR(st.st_mode))
+        self.assertEqual(target._stat, st)
+
+
+class WalkTest(tests.function.TreeTestCase):
+    def test_topdown(self):
+        result = collect(dirscan.walk(self.root))
+
+        self.assertEqual(sorted(result), sorted([
+            (self.root, ['a', 'c', 'link'], ['f1']),
+            (os.path.join(self.root, 'a'), ['b'], ['f2']),
+            (os.path.join(self.root, 'a', 'b'), [], ['f3']),
+            (os.path.join(self.root, 'c'), [], ['f4']),
+        ]))
+        self.assertEqual(result[0][0], self.root)
+
+    def test_bottomup(self):
+        result = collect(dirscan.walk(self.root, topdown=False))
+
+        self.assertEqual(result[-1][0], self.root)
+        self.assertEqual(len(result), 4)
+
+    def test_followlinks(self):
+        result = collect(dirscan.walk(self.root, followlinks=True))
+
+        self.assertEqual(len(result), 6)
+
+    def test_prune(self):
+        result = []
+        for dirpath, dirs, files in dirscan.walk(self.root):
+            result.append(dirpath)
+            dirs[:] = [d for d in dirs if d.name != 'a']
+
+        self.assertEqual(sorted(result), [self.root,
+                                          os.path.join(self.root, 'c')])
+
+    def test_ignore(self):
+        ignore = mock.Mock(side_effect=lambda d, n: ['c', 'f2'])
+
+        result = collect(dirscan.walk(self.root, ignore=ignore))
+
+        self.assertEqual(sorted(result), sorted([
+            (self.root, ['a', 'link'], ['f1']),
+            (os.path.join(self.root, 'a'), ['b'], []),
+            (os.path.join(self.root, 'a', 'b'), [], ['f3']),
+        ]))
+
+    def test_onerror(self):
+        onerror = mock.Mock()
+
+        result = list(dirscan.walk(os.path.join(self.root, 'missing'),
+                                   onerror=onerror))
+
+        self.assertEqual(result, [])
+        self.assertEqual(onerror.call_count, 1)
+        self.assertTrue(isinstance(onerror.call_args[0][0], OSError))
+
+
+class ParallelWalkTest(tests.function.TreeTestCase):
+    def setUp(self):
+        super(ParallelWalkTest, self).setUp()
+        for i in range(5):
+            path = os.path.join(self.root, 'c', 'd%d' % i)
+            os.mkdir(path)
+            os.mkdir(os.path.join(path, 'sub'))
+
+    def test_ordered(self):
+        expected = collect(dirscan.walk(self.root))
+
+        result = collect(dirscan.walk(self.root, workers=4))
+
+        self.assertEqual(result, expected)
+
+    def test_ordered_bottomup(self):
+        expected = collect(dirscan.walk(self.root, topdown=False))
+
+        result = collect(dirscan.walk(self.root, topdown=False, workers=4))
+
+        self.assertEqual(result, expected)
+
+    def test_ordered_prune(self):
+        result = []
+        for dirpath, dirs, files in dirscan.walk(self.root, workers=4):
+            result.append(dirpath)
+            dirs[:] = [d for d in dirs if d.name != 'c']
+
+        self.assertEqual(result, [
+            self.root,
+            os.path.join(self.root, 'a'),
+            os.path.join(self.root, 'a', 'b'),
+        ])
+
+    def test_unordered(self):
+        expected = collect(dirscan.walk(self.root, followlinks=True))
+
+        result = collect(dirscan.walk(self.root, followlinks=True,
+                                      workers=4, ordered=False))
+
+        self.assertEqual(sorted(result), sorted(expected))
+        self.assertEqual(result[0][0], self.root)
+
+    def test_unordered_bottomup(self):
+        self.assertRaises(ValueError, dirscan.walk, self.root, topdown=False,
+                          workers=4, ordered=False)
+
+    def test_onerror(self):
+        onerror = mock.Mock()
+
+        result = list(dirscan.walk(os.path.join(self.root, 'missing'),
+                                   onerror=onerror, workers=4,
+                                   ordered=False))
+
+        self.assertEqual(result, [])
+        self.assertEqual(onerror.call_count, 1)
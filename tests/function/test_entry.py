@@ -0,0 +1,200 @@
+# Copyright 2014 Kevin L. Mitchell
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+
+import mock
+
+from fstree import dirscan
+from fstree import entry
+from fstree import statcache
+
+import tests.function
+
+
+class FSEntryWalkTest(tests.function.TreeTestCase):
+    def test_walk(self):
+        tree = entry.FSTree(self.root)
+
+        result = sorted((d, sorted(dn), sorted(fn))
+                        for d, dn, fn in tree.walk())
+
+        self.assertEqual(result, [
+            ('/', ['a', 'c', 'link'], ['f1']),
+            ('/a', ['b'], ['f2']),
+            ('/a/b', [], ['f3']),
+            ('/c', [], ['f4']),
+        ])
+
+    def test_walk_prune(self):
+        tree = entry.FSTree(self.root)
+
+        result = []
+        for dirpath, dirnames, filenames in tree.walk():
+            result.append(dirpath)
+            if 'a' in dirnames:
+                dirnames.remove('a')
+
+        self.assertEqual(sorted(result), ['/', '/c'])
+
+    def test_walk_replace_reorder(self):
+        os.mkdir(os.path.join(self.root, 'd'))
+        tree = entry.FSTree(self.root)
+
+        def visit(walker, relative):
+            result = []
+            for dirpath, dirnames, filenames in walker:
+                result.append(relative(dirpath))
+                names = sorted(dirnames, reverse=True)
+                if 'c' in names:
+                    names[names.index('c')] = 'zzz'
+                dirnames[:] = names
+            return result
+
+        result = visit(tree.walk(), lambda d: d)
+        expected = visit(os.walk(self.root), lambda d: os.path.normpath(
+            '/' + os.path.relpath(d, self.root)))
+
+        self.assertEqual(result, expected)
+        self.assertEqual(result, ['/', '/d', '/a', '/a/b'])
+        self.assertEqual(visit(tree.walk(workers=4), lambda d: d), result)
+
+    def test_scan_seed(self):
+        tree = entry.FSTree(self.root)
+
+        for dirpath, dirs, files in tree.scan('a'):
+            for ent in files:
+                st = ent.stat()
+                fsent = tree[ent]
+
+                self.assertEqual(fsent.name, '/a/' + ent.name
+                                 if dirpath == '/a' else
+                                 '/a/b/' + ent.name)
+                self.assertTrue(fsent.stat_cached is st)
+                self.assertTrue(fsent.lstat_cached is st)
+
+    def test_scan_other_tree(self):
+        tree = entry.FSTree(os.path.join(self.root, 'c'))
+        ent = dirscan.ScanEntry(self.root, 'f1')
+
+        self.assertRaises(ValueError, tree.__getitem__, ent)
+
+    def test_walk_parallel(self):
+        tree = entry.FSTree(self.root)
+
+        result = list(tree.walk(workers=4, ignore=lambda d, n: ['c']))
+
+        self.assertEqual(result, list(tree.walk(ignore=lambda d, n: ['c'])))
+        self.assertEqual(len(result), 3)
+
+
+class FSEntryLayoutTest(tests.function.TreeTestCase):
+    def test_slots(self):
+        tree = entry.FSTree(self.root)
+        ent = tree['a/f2']
+
+        self.assertFalse(hasattr(ent, '__dict__'))
+        self.assertEqual(ent.basename, 'f2')
+        self.assertEqual(ent.dirname, '/a')
+        self.assertEqual(ent.contents, 'a/f2')
+        self.assertEqual(list(ent.__cache_control__), ['contents'])
+
+    def test_names(self):
+        tree = entry.FSTree(self.root)
+        os.rename(os.path.join(self.root, 'f1'),
+                  os.path.join(self.root, 'f1.tar.gz'))
+        ent = tree['f1.tar.gz']
+
+        self.assertEqual(ent.ext, '.gz')
+        self.assertEqual(ent.root, 'f1.tar')
+        self.assertEqual(ent.realpath, os.path.realpath(ent.path))
+
+
+class EntryCacheTest(tests.function.TreeTestCase):
+    def test_keeps_entries(self):
+        tree = entry.FSTree(self.root, max_entries=2)
+
+        self.assertEqual(tree['f1'].contents, 'f1')
+        ent = tree['f1']
+
+        self.assertEqual(ent._contents, 'f1')
+        self.assertEqual(tree.cache_stats['hits'], 1)
+        self.assertEqual(tree.cache_stats['misses'], 1)
+
+    def test_evicts(self):
+        tree = entry.FSTree(self.root, max_entries=2)
+        for name in ('f1', 'a/f2', 'c/f4'):
+            tree[name]
+
+        self.assertEqual(tree.cache_stats['evictions'], 1)
+        self.assertEqual(tree.cache_stats['entries'], 2)
+
+    def test_sizeof(self):
+        tree = entry.FSTree(self.root, max_bytes=1 << 20)
+        ent = tree['f1']
+        before = tree.cache_stats['bytes']
+
+        ent.contents
+        tree['f1']
+
+        self.assertTrue(tree.cache_stats['bytes'] > before)
+
+    def test_no_cache(self):
+        tree = entry.FSTree(self.root)
+
+        self.assertEqual(tree.cache_stats, None)
+
+
+class StatCacheTreeTest(tests.function.TreeTestCase):
+    def test_generation(self):
+        tree = entry.FSTree(self.root,
+                            stat_policy=statcache.GenerationPolicy())
+        f1 = tree['f1']
+        st = f1.stat
+
+        with mock.patch('os.stat') as mock_stat:
+            self.assertTrue(f1.isfile)
+            self.assertEqual(f1.st_size, st.st_size)
+            self.assertTrue('f1' in tree)
+            self.assertFalse(mock_stat.called)
+
+        tree.makedirs('newdir')
+
+        self.assertTrue(tree['newdir'].isdir)
+        self.assertFalse('f1' in tree['newdir'])
+
+    def test_open_write(self):
+        tree = entry.FSTree(self.root,
+                            stat_policy=statcache.GenerationPolicy())
+        f1 = tree['f1']
+        self.assertEqual(f1.contents, 'f1')
+
+        with tree.open('f1', 'w') as f:
+            f.write('rewritten')
+            self.assertEqual(f1.st_size, 0)
+
+        self.assertEqual(f1.st_size, 9)
+        self.assertEqual(f1.contents, 'rewritten')
+
+    def test_scan_seeds_cache(self):
+        tree = entry.FSTree(self.root,
+                            stat_policy=statcache.GenerationPolicy())
+
+        for dirpath, dirs, files in tree.scan():
+            for ent in files:
+                ent.lstat()
+                with mock.patch('os.stat') as mock_stat:
+                    self.assertTrue(tree[ent].isfile)
+                    self.assertFalse(mock_stat.called)
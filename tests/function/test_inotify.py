@@ -0,0 +1,141 @@
+# Copyright 2014 Kevin L. Mitchell
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import unittest
+
+import mock
+
+from fstree import entry
+from fstree import inotify
+
+import tests.function
+
+
+def wait_for(watcher, path, mask):
+    while True:
+        event = watcher.get(timeout=5)
+        if event is None:
+            raise AssertionError("no event for %s" % path)
+        if event.path == path and event.mask & mask:
+            return event
+
+
+@unittest.skipUnless(inotify.available(), "inotify is not available")
+class WatcherTest(tests.function.TreeTestCase):
+    def test_events(self):
+        with inotify.Watcher(self.root) as watcher:
+            path = os.path.join(self.root, 'a', 'b', 'new')
+            with open(path, 'w') as f:
+                f.write('new')
+
+            event = wait_for(watcher, path, inotify.IN_CREATE)
+
+            self.assertFalse(event.isdir)
+
+        self.assertFalse(watcher.active)
+        for event in watcher:
+            self.assertEqual(event.path, path)
+
+    def test_new_directory(self):
+        with inotify.Watcher(self.root) as watcher:
+            path = os.path.join(self.root, 'newdir')
+            os.mkdir(path)
+
+            event = wait_for(watcher, path, inotify.IN_CREATE)
+            self.assertTrue(event.isdir)
+
+            os.rmdir(os.path.join(self.root, 'newdir'))
+            wait_for(watcher, path, inotify.IN_DELETE_SELF)
+
+    def test_callback(self):
+        callback = mock.Mock()
+
+        with inotify.Watcher(self.root, callback, events=False) as watcher:
+            self.assertRaises(ValueError, watcher.get)
+            os.utime(os.path.join(self.root, 'f1'), None)
+
+        self.assertTrue(callback.called)
+
+    def test_callback_fails(self):
+        callback = mock.Mock(side_effect=[RuntimeError('oops'), None, None])
+        path = os.path.join(self.root, 'f1')
+
+        with inotify.Watcher(self.root, callback) as watcher:
+            os.utime(path, None)
+            wait_for(watcher, path, inotify.IN_ATTRIB)
+
+            self.assertTrue(watcher.active)
+            self.assertFalse(watcher.complete)
+            self.assertEqual(callback.call_args_list[1],
+                             mock.call(inotify.Event(
+                                 None, inotify.IN_Q_OVERFLOW, 0)))
+
+            os.utime(path, None)
+            wait_for(watcher, path, inotify.IN_ATTRIB)
+
+        self.assertEqual(callback.call_count, 3)
+
+
+@unittest.skipUnless(inotify.available(), "inotify is not available")
+class TreeWatchTest(tests.function.TreeTestCase):
+    def test_trusted_contents(self):
+        tree = entry.FSTree(self.root)
+        ent = tree['a/f2']
+
+        with tree.watch() as watcher:
+            self.assertEqual(ent.contents, 'a/f2')
+            with mock.patch('os.stat') as mock_stat:
+                self.assertEqual(ent.contents, 'a/f2')
+                self.assertFalse(mock_stat.called)
+
+            with open(ent.path, 'w') as f:
+                f.write('changed')
+            wait_for(watcher, ent.path, inotify.IN_CLOSE_WRITE)
+
+            self.assertEqual(ent.contents, 'changed')
+
+        self.assertFalse(ent.__cache_trusted__)
+
+    def test_failed_event(self):
+        tree = entry.FSTree(self.root)
+        ent = tree['a/f2']
+
+        with tree.watch() as watcher:
+            self.assertEqual(ent.contents, 'a/f2')
+            self.assertTrue(ent.__cache_trusted__)
+
+            with mock.patch.object(entry.utils, 'deroot',
+                                   side_effect=RuntimeError('oops')):
+                with open(ent.path, 'w') as f:
+                    f.write('changed')
+                wait_for(watcher, ent.path, inotify.IN_CLOSE_WRITE)
+
+            self.assertTrue(watcher.active)
+            self.assertFalse(ent.__cache_trusted__)
+            self.assertEqual(ent.contents, 'changed')
+
+    def test_directory_contents(self):
+        tree = entry.FSTree(self.root)
+        ent = tree['c']
+
+        with tree.watch() as watcher:
+            self.assertEqual(ent.contents, ['f4'])
+
+            path = os.path.join(ent.path, 'f5')
+            open(path, 'w').close()
+            wait_for(watcher, path, inotify.IN_CLOSE_WRITE)
+
+            self.assertEqual(ent.contents, ['f4', 'f5'])
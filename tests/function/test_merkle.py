@@ -0,0 +1,119 @@
+# Copyright 2014 Kevin L. Mitchell
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import hashlib
+import os
+import shutil
+
+from fstree import digestcache
+from fstree import entry
+from fstree import merkle
+
+import tests.function
+
+
+class MerkleDigestTest(tests.function.TreeTestCase):
+    def test_directory(self):
+        def line(mode, name, data):
+            return ('%o %s\0%s\n' % (mode, name, data)).encode('ascii')
+
+        def sha(data):
+            return hashlib.sha256(data).hexdigest()
+
+        def mode(path):
+            return os.lstat(os.path.join(self.root, path)).st_mode
+
+        b = sha(line(mode('a/b/f3'), 'f3', sha(b'a/b/f3')))
+        a = sha(line(mode('a/b'), 'b', b) +
+                line(mode('a/f2'), 'f2', sha(b'a/f2')))
+        c = sha(line(mode('c/f4'), 'f4', sha(b'c/f4')))
+        expected = sha(line(mode('a'), 'a', a) + line(mode('c'), 'c', c) +
+                       line(mode('f1'), 'f1', sha(b'f1')) +
+                       line(mode('link'), 'link', sha(b'a')))
+
+        self.assertEqual(merkle.digest(self.root, 'sha256'), expected)
+
+    def test_file(self):
+        self.assertEqual(merkle.digest(os.path.join(self.root, 'f1'), 'md5'),
+                         hashlib.md5(b'f1').hexdigest())
+
+    def test_stable_across_copies(self):
+        copy = os.path.join(self.root, 'copy')
+        shutil.copytree(os.path.join(self.root, 'a'), copy, symlinks=True)
+
+        self.assertEqual(merkle.digest(copy),
+                         merkle.digest(os.path.join(self.root, 'a')))
+
+    def test_detects_changes(self):
+        before = merkle.digest(self.root)
+        with open(os.path.join(self.root, 'a', 'b', 'f3'), 'w') as f:
+            f.write('changed')
+
+        self.assertNotEqual(merkle.digest(self.root), before)
+
+    def test_ignore(self):
+        ignored = merkle.digest(self.root, ignore=lambda d, n: ['link'])
+        os.remove(os.path.join(self.root, 'link'))
+
+        self.assertEqual(merkle.digest(self.root), ignored)
+
+    def test_workers(self):
+        expected = merkle.digest(self.root, 'sha1')
+
+        self.assertEqual(merkle.digest(self.root, 'sha1', workers=4),
+                         expected)
+        self.assertEqual(merkle.digest(self.root, 'sha1', workers=2,
+                                       processes=True), expected)
+
+    def test_metadata(self):
+        before = merkle.digest(self.root, metadata=True)
+        self.assertNotEqual(before, merkle.digest(self.root))
+        self.assertEqual(merkle.digest(self.root, metadata=True), before)
+
+        os.utime(os.path.join(self.root, 'c', 'f4'), (0, 0))
+
+        self.assertNotEqual(merkle.digest(self.root, metadata=True), before)
+
+    def test_cache(self):
+        tests.function.backdate(self.root)
+        cache = digestcache.DigestCache()
+        expected = merkle.digest(self.root)
+
+        self.assertEqual(merkle.digest(self.root, cache=cache), expected)
+        self.assertEqual(merkle.digest(self.root, cache=cache, workers=2),
+                         expected)
+        self.assertEqual((cache.hits, cache.misses), (4, 4))
+
+
+class FSEntryDigestTest(tests.function.TreeTestCase):
+    def test_directory(self):
+        tree = entry.FSTree(self.root)
+
+        self.assertEqual(tree.digest(hasher='sha256'),
+                         merkle.digest(self.root, 'sha256'))
+        self.assertEqual(tree['a'].digest(workers=2),
+                         merkle.digest(os.path.join(self.root, 'a')))
+
+    def test_directory_digester(self):
+        tree = entry.FSTree(self.root)
+
+        self.assertRaises(ValueError, tree.digest, 'a', hashlib.md5())
+
+    def test_metadata(self):
+        tree = entry.FSTree(self.root)
+
+        self.assertEqual(tree.digest('f1', metadata=True),
+                         merkle.digest(os.path.join(self.root, 'f1'),
+                                       metadata=True))
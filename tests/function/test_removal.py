@@ -0,0 +1,151 @@
+# Copyright 2014 Kevin L. Mitchell
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import resource
+
+import mock
+
+from fstree import entry
+from fstree import removal
+
+import tests.function
+
+
+class RmtreeTest(tests.function.TreeTestCase):
+    def make_wide(self, top, width=5, depth=3):
+        for i in range(width):
+            path = os.path.join(top, 'd%d' % i)
+            os.makedirs(path)
+            for j in range(width):
+                open(os.path.join(path, 'f%d' % j), 'w').close()
+            if depth > 1:
+                self.make_wide(path, width, depth - 1)
+
+    def test_serial(self):
+        self.make_wide(os.path.join(self.root, 'c'))
+
+        removal.rmtree(os.path.join(self.root, 'a'))
+        removal.rmtree(os.path.join(self.root, 'c'))
+
+        self.assertEqual(sorted(os.listdir(self.root)), ['f1', 'link'])
+
+    def test_parallel(self):
+        self.make_wide(os.path.join(self.root, 'c'))
+
+        removal.rmtree(os.path.join(self.root, 'c'), workers=4)
+
+        self.assertFalse(os.path.exists(os.path.join(self.root, 'c')))
+        self.assertTrue(os.path.isdir(os.path.join(self.root, 'a')))
+
+    def assertRemovedWithFewFds(self, **kwargs):
+        if not os.path.isdir('/proc/self/fd'):
+            self.skipTest('cannot count open file descriptors')
+
+        top = os.path.join(self.root, 'c')
+        for i in range(300):
+            os.makedirs(os.path.join(top, 'd%d' % i, 'x', 'y'))
+
+        # Allow far fewer descriptors than there are directories
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        limit = len(os.listdir('/proc/self/fd')) + 64
+        resource.setrlimit(resource.RLIMIT_NOFILE, (limit, hard))
+        try:
+            removal.rmtree(top, **kwargs)
+        finally:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (soft, hard))
+
+        self.assertFalse(os.path.exists(top))
+
+    def test_wide_serial(self):
+        self.assertRemovedWithFewFds()
+
+    def test_wide_parallel(self):
+        self.assertRemovedWithFewFds(workers=4)
+
+    def test_symlinks_not_followed(self):
+        os.symlink(os.path.join(self.root, 'c'),
+                   os.path.join(self.root, 'a', 'b', 'to_c'))
+
+        removal.rmtree(os.path.join(self.root, 'a'), workers=2)
+
+        self.assertTrue(os.path.isfile(os.path.join(self.root, 'c', 'f4')))
+
+    def test_symlink_top(self):
+        onerror = mock.Mock()
+
+        self.assertRaises(OSError, removal.rmtree,
+                          os.path.join(self.root, 'link'))
+        removal.rmtree(os.path.join(self.root, 'link'), onerror=onerror)
+
+        onerror.assert_called_once_with(
+            os.path.islink, os.path.join(self.root, 'link'), mock.ANY)
+        self.assertTrue(os.path.isfile(os.path.join(self.root, 'a', 'f2')))
+
+    def test_errors(self):
+        path = os.path.join(self.root, 'missing')
+        onerror = mock.Mock()
+
+        self.assertRaises(OSError, removal.rmtree, path)
+        removal.rmtree(path, ignore_errors=True)
+        removal.rmtree(path, onerror=onerror, workers=2)
+
+        onerror.assert_called_once_with(os.lstat, path, mock.ANY)
+
+    @mock.patch.object(removal, 'fd_relative', return_value=True)
+    def test_unlink_errors(self, mock_fd_relative):
+        onerror = mock.Mock()
+        with mock.patch('os.unlink',
+                        side_effect=OSError('denied')) as mock_unlink:
+            removal.rmtree(os.path.join(self.root, 'a'), onerror=onerror,
+                           workers=2)
+
+        onerror.assert_any_call(
+            mock_unlink, os.path.join(self.root, 'a', 'f2'), mock.ANY)
+        onerror.assert_any_call(
+            os.rmdir, os.path.join(self.root, 'a'), mock.ANY)
+        self.assertTrue(os.path.isfile(os.path.join(self.root, 'a', 'f2')))
+
+    @mock.patch.object(removal, 'fd_relative', return_value=True)
+    def test_unexpected_error(self, mock_fd_relative):
+        close = os.close
+
+        def failing_close(fd):
+            close(fd)
+            raise RuntimeError('close failed')
+
+        with mock.patch('os.close', side_effect=failing_close):
+            self.assertRaises(RuntimeError, removal.rmtree,
+                              os.path.join(self.root, 'a'), workers=2)
+            self.assertRaises(RuntimeError, removal.rmtree,
+                              os.path.join(self.root, 'c'))
+
+
+class FSEntryRemoveTest(tests.function.TreeTestCase):
+    def test_remove(self):
+        tree = entry.FSTree(self.root)
+
+        tree.remove('a', workers=2)
+        tree.remove('f1')
+
+        self.assertEqual(sorted(os.listdir(self.root)), ['c', 'link'])
+
+    def test_cleanup(self):
+        tree = entry.FSTree(self.root)
+
+        tree.cleanup(workers=2)
+
+        self.assertFalse(os.path.exists(self.root))
+        os.makedirs(self.root)
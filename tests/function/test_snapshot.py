@@ -0,0 +1,175 @@
+# Copyright 2014 Kevin L. Mitchell
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import hashlib
+import os
+
+import mock
+import six
+
+from fstree import entry
+from fstree import snapshot
+
+import tests.function
+
+
+class SnapshotTest(tests.function.TreeTestCase):
+    def test_take(self):
+        tree = entry.FSTree(self.root)
+
+        result = tree.snapshot()
+
+        self.assertEqual([ent.name for ent in result], [
+            '/a', '/a/b', '/a/b/f3', '/a/f2', '/c', '/c/f4', '/f1', '/link',
+        ])
+        self.assertEqual(result['/a'].type, snapshot.DIRECTORY)
+        self.assertEqual(result['/f1'].type, snapshot.FILE)
+        self.assertEqual(result['/f1'].size, 2)
+        self.assertEqual(result['/f1'].digest, None)
+        self.assertEqual(result['/link'].type, snapshot.SYMLINK)
+        self.assertEqual(result['/link'].target, 'a')
+
+    def test_take_subdir(self):
+        tree = entry.FSTree(self.root)
+
+        result = tree.snapshot('a', hasher='md5')
+
+        self.assertEqual([ent.name for ent in result],
+                         ['/b', '/b/f3', '/f2'])
+        self.assertEqual(result['/f2'].digest,
+                         hashlib.md5(six.b('a/f2')).hexdigest())
+
+    def test_take_previous(self):
+        tree = entry.FSTree(self.root)
+        old = tree.snapshot(hasher='md5')
+        with open(os.path.join(self.root, 'f1'), 'w') as f:
+            f.write('changed')
+        os.utime(os.path.join(self.root, 'f1'), (0, 0))
+
+        with mock.patch.object(snapshot.utils, 'digest_file',
+                               return_value='digest') as mock_digest:
+            result = tree.snapshot(hasher='md5', previous=old)
+
+        self.assertEqual(mock_digest.call_count, 1)
+        self.assertEqual(result['/f1'].digest, 'digest')
+        self.assertEqual(result['/c/f4'].digest, old['/c/f4'].digest)
+
+    def test_dump_load(self):
+        tree = entry.FSTree(self.root)
+        snap = tree.snapshot(hasher='md5')
+        fo = six.StringIO()
+
+        snap.dump(fo)
+        fo.seek(0)
+        result = snapshot.Snapshot.load(fo)
+
+        self.assertEqual(result.hasher, 'md5')
+        self.assertEqual(list(result), list(snap))
+
+
+class DiffTest(tests.function.TreeTestCase):
+    def test_unchanged(self):
+        tree = entry.FSTree(self.root)
+        old = tree.snapshot()
+
+        result = snapshot.diff(old, tree.snapshot())
+
+        self.assertFalse(result)
+
+    def test_changes(self):
+        tree = entry.FSTree(self.root)
+        old = tree.snapshot()
+
+        os.rename(os.path.join(self.root, 'a', 'f2'),
+                  os.path.join(self.root, 'c', 'f2'))
+        os.remove(os.path.join(self.root, 'c', 'f4'))
+        with open(os.path.join(self.root, 'new'), 'w') as f:
+            f.write('new')
+        with open(os.path.join(self.root, 'f1'), 'w') as f:
+            f.write('changed')
+        os.chmod(os.path.join(self.root, 'a', 'b'), 0o700)
+
+        result = snapshot.diff(old, tree.snapshot())
+
+        self.assertEqual(result.added, ['/new'])
+        self.assertEqual(result.removed, ['/c/f4'])
+        self.assertEqual(result.modified, ['/a/b', '/f1'])
+        self.assertEqual(result.renamed, [('/a/f2', '/c/f2')])
+
+    def test_touched(self):
+        tree = entry.FSTree(self.root)
+        old = tree.snapshot(hasher='md5')
+        os.utime(os.path.join(self.root, 'f1'), (0, 0))
+
+        self.assertFalse(snapshot.diff(old, tree.snapshot(hasher='md5')))
+        self.assertEqual(snapshot.diff(old, tree.snapshot()).modified,
+                         ['/f1'])
+
+    def test_renamed_chmod(self):
+        tree = entry.FSTree(self.root)
+        old = tree.snapshot()
+        os.rename(os.path.join(self.root, 'f1'),
+                  os.path.join(self.root, 'f5'))
+        os.chmod(os.path.join(self.root, 'f5'), 0o600)
+
+        result = snapshot.diff(old, tree.snapshot())
+
+        self.assertEqual(result.renamed, [('/f1', '/f5')])
+        self.assertEqual(result.modified, ['/f5'])
+        self.assertEqual(result.added, [])
+        self.assertEqual(result.removed, [])
+
+    def test_inode_reused(self):
+        old = snapshot.Snapshot([
+            snapshot.ManifestEntry('/old', snapshot.FILE, 3, 0o644, 1, 5, 1,
+                                   None, None),
+        ])
+        new = snapshot.Snapshot([
+            snapshot.ManifestEntry('/new', snapshot.FILE, 3, 0o644, 2, 5, 1,
+                                   None, None),
+        ])
+
+        result = snapshot.diff(old, new)
+
+        self.assertEqual(result.renamed, [])
+        self.assertEqual(result.added, ['/new'])
+        self.assertEqual(result.removed, ['/old'])
+
+    def test_digest_differs(self):
+        old = snapshot.Snapshot([
+            snapshot.ManifestEntry('/f', snapshot.FILE, 3, 0o644, 1, 5, 1,
+                                   None, 'aaa'),
+        ], 'md5')
+        new = snapshot.Snapshot([
+            snapshot.ManifestEntry('/f', snapshot.FILE, 3, 0o644, 1, 5, 1,
+                                   None, 'bbb'),
+        ], 'md5')
+
+        self.assertEqual(snapshot.diff(old, new).modified, ['/f'])
+
+    def test_replaced(self):
+        with open(os.path.join(self.root, 'f1.new'), 'w') as f:
+            f.write('f2')
+        st = os.stat(os.path.join(self.root, 'f1'))
+        os.utime(os.path.join(self.root, 'f1.new'),
+                 ns=(st.st_atime_ns, st.st_mtime_ns))
+        tree = entry.FSTree(self.root)
+        old = tree.snapshot()
+
+        os.rename(os.path.join(self.root, 'f1.new'),
+                  os.path.join(self.root, 'f1'))
+
+        self.assertEqual(snapshot.diff(old, tree.snapshot()).modified,
+                         ['/f1'])
@@ -0,0 +1,220 @@
+# Copyright 2014 Kevin L. Mitchell
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import hashlib
+import io
+import os
+import tarfile
+import threading
+import unittest
+
+import mock
+
+from fstree import compress
+from fstree import digestcache
+from fstree import entry
+
+import tests.function
+
+
+class TarTestCase(tests.function.ArchiveTestCase):
+    def names(self, fileobj=None, name=None, mode='r:*'):
+        with tarfile.open(name, mode, fileobj=fileobj) as tar:
+            return sorted(tar.getnames())
+
+
+class TarFileTest(TarTestCase):
+    def test_plain(self):
+        result = self.tree.tar(os.path.join(self.outdir, 'out'))
+
+        self.assertEqual(result, os.path.join(self.outdir, 'out.tar'))
+        self.assertEqual(self.names(name=result), [
+            'a', 'a/b', 'a/b/f3', 'a/f2', 'c', 'c/f4', 'f1', 'link',
+        ])
+
+    def test_compressed(self):
+        result = self.tree.tar(os.path.join(self.outdir, 'out.tar.gz'),
+                               hasher='sha256')
+
+        self.assertEqual(result[0], os.path.join(self.outdir, 'out.tar.gz'))
+        with open(result[0], 'rb') as f:
+            self.assertEqual(result[1], hashlib.sha256(f.read()).hexdigest())
+        self.assertEqual(self.names(name=result[0], mode='r:gz'), [
+            'a', 'a/b', 'a/b/f3', 'a/f2', 'c', 'c/f4', 'f1', 'link',
+        ])
+
+    def test_start_parent(self):
+        result = self.tree['/a/b'].tar(os.path.join(self.outdir, 'out'),
+                                       start='..')
+
+        self.assertEqual(self.names(name=result), ['b', 'b/f3'])
+
+    def test_start_child(self):
+        result = self.tree.tar(os.path.join(self.outdir, 'out'), start='a')
+
+        self.assertEqual(self.names(name=result), ['b', 'b/f3', 'f2'])
+
+    def test_reentrant(self):
+        results = []
+
+        def build(i):
+            results.append(self.tree['/a'].tar(
+                os.path.join(self.outdir, 'out%d' % i), compression='gz'))
+
+        with mock.patch.object(os, 'chdir') as mock_chdir:
+            threads = [threading.Thread(target=build, args=(i,))
+                       for i in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertFalse(mock_chdir.called)
+        self.assertEqual(len(results), 4)
+        for result in results:
+            self.assertEqual(self.names(name=result),
+                             ['b', 'b/f3', 'f2'])
+
+    def test_start_bad(self):
+        self.assertRaises(ValueError, self.tree['/a'].tar,
+                          os.path.join(self.outdir, 'out'), start='/c')
+
+
+class TarStreamTest(TarTestCase):
+    def test_file_object(self):
+        fo = io.BytesIO()
+
+        result = self.tree.tar(fo, compression='gz', hasher='md5')
+
+        self.assertEqual(result, (fo, hashlib.md5(fo.getvalue()).hexdigest()))
+        fo.seek(0)
+        self.assertEqual(self.names(fo, mode='r:gz'), [
+            'a', 'a/b', 'a/b/f3', 'a/f2', 'c', 'c/f4', 'f1', 'link',
+        ])
+
+    def test_no_hasher(self):
+        fo = io.BytesIO()
+
+        self.assertTrue(self.tree['/c'].tar(fo) is fo)
+        fo.seek(0)
+        self.assertEqual(self.names(fo, mode='r:'), ['f4'])
+
+    def test_pipe(self):
+        rfd, wfd = os.pipe()
+        received = []
+
+        def reader():
+            with os.fdopen(rfd, 'rb') as f:
+                received.append(f.read())
+
+        thread = threading.Thread(target=reader)
+        thread.start()
+        with os.fdopen(wfd, 'wb') as f:
+            digest = self.tree.tar(f, compression='bz2', hasher=True)[1]
+        thread.join()
+
+        self.assertEqual(digest, hashlib.md5(received[0]).hexdigest())
+        self.assertEqual(
+            self.names(io.BytesIO(received[0]), mode='r:bz2')[:2],
+            ['a', 'a/b'])
+
+    def test_bad_compression(self):
+        self.assertRaises(ValueError, self.tree.tar, io.BytesIO(),
+                          compression='lzo')
+
+
+class TarCompressTest(TarTestCase):
+    def test_workers(self):
+        name, digest = self.tree.tar(os.path.join(self.outdir, 'out'),
+                                     compression='gz', hasher='sha1',
+                                     workers=4)
+
+        self.assertEqual(name, os.path.join(self.outdir, 'out.tar.gz'))
+        with open(name, 'rb') as f:
+            self.assertEqual(digest, hashlib.sha1(f.read()).hexdigest())
+        self.assertEqual(self.names(name=name, mode='r:gz'), [
+            'a', 'a/b', 'a/b/f3', 'a/f2', 'c', 'c/f4', 'f1', 'link',
+        ])
+
+    def test_level(self):
+        name = self.tree.tar(os.path.join(self.outdir, 'out.tbz2'),
+                             level=1)
+
+        self.assertEqual(self.names(name=name, mode='r:bz2'), [
+            'a', 'a/b', 'a/b/f3', 'a/f2', 'c', 'c/f4', 'f1', 'link',
+        ])
+
+    def test_stream(self):
+        out = io.BytesIO()
+
+        self.tree.tar(out, compression='xz', workers=2, level=0)
+
+        out.seek(0)
+        self.assertEqual(self.names(fileobj=out, mode='r:xz'), [
+            'a', 'a/b', 'a/b/f3', 'a/f2', 'c', 'c/f4', 'f1', 'link',
+        ])
+
+    @unittest.skipIf(compress.zstd is None, 'zstd is not available')
+    def test_zstd(self):
+        name = self.tree.tar(os.path.join(self.outdir, 'out.tzst'),
+                             workers=2, level=10)
+
+        self.assertEqual(name, os.path.join(self.outdir, 'out.tzst'))
+        with open(name, 'rb') as f:
+            with compress.reader(f, 'zst') as fileobj:
+                self.assertEqual(self.names(fileobj=fileobj, mode='r|'), [
+                    'a', 'a/b', 'a/b/f3', 'a/f2', 'c', 'c/f4', 'f1', 'link',
+                ])
+
+    @unittest.skipIf(compress.zstd is not None, 'zstd is available')
+    def test_zstd_unsupported(self):
+        self.assertRaises(ValueError, self.tree.tar,
+                          os.path.join(self.outdir, 'out.tar.zst'))
+
+
+class TarHashTest(TarTestCase):
+    def test_single_pass(self):
+        with mock.patch.object(entry.utils, 'digest_file') as mock_digest:
+            name, digest = self.tree.tar(os.path.join(self.outdir, 'out'),
+                                         compression='xz', hasher='sha1')
+
+        self.assertFalse(mock_digest.called)
+        with open(name, 'rb') as f:
+            self.assertEqual(digest, hashlib.sha1(f.read()).hexdigest())
+
+    def test_digesters(self):
+        digesters = (hashlib.md5(), hashlib.sha256())
+
+        name, digest = self.tree.tar(os.path.join(self.outdir, 'out'),
+                                     hasher=digesters)
+
+        with open(name, 'rb') as f:
+            data = f.read()
+        self.assertEqual(digest, hashlib.md5(data).hexdigest())
+        self.assertEqual(digesters[1].hexdigest(),
+                         hashlib.sha256(data).hexdigest())
+
+    def test_seeds_digest_cache(self):
+        cache = digestcache.DigestCache()
+        tree = entry.FSTree(self.root, digest_cache=cache)
+
+        # The archive has only just been written
+        with mock.patch.object(digestcache.DigestCache, '_racy',
+                               return_value=False):
+            name, digest = tree.tar(os.path.join(self.outdir, 'out'),
+                                    hasher='md5')
+
+        self.assertEqual(cache.digest(name, 'md5'), digest)
+        self.assertEqual((cache.hits, cache.misses), (1, 0))
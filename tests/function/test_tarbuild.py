@@ -0,0 +1,220 @@
+# Copyright 2014 Kevin L. Mitchell
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import io
+import os
+import tarfile
+import time
+
+import mock
+
+from fstree import entry
+from fstree import snapshot
+from fstree import tarbuild
+
+import tests.function
+
+
+class TarBuilderTest(tests.function.TreeTestCase):
+    def build(self, *args, **kwargs):
+        out = io.BytesIO()
+        with tarfile.open(fileobj=out, mode='w|') as tar:
+            tarbuild.TarBuilder(tar, *args, **kwargs).add(self.root, 'root')
+        out.seek(0)
+        return out
+
+    def members(self, out):
+        with tarfile.open(fileobj=out, mode='r|') as tar:
+            return [(info.name, info.type, info.linkname,
+                     tar.extractfile(info).read() if info.isreg() else None)
+                    for info in tar]
+
+    def test_contents(self):
+        result = sorted(self.members(self.build()))
+
+        self.assertEqual(result, [
+            ('root', tarfile.DIRTYPE, '', None),
+            ('root/a', tarfile.DIRTYPE, '', None),
+            ('root/a/b', tarfile.DIRTYPE, '', None),
+            ('root/a/b/f3', tarfile.REGTYPE, '', b'a/b/f3'),
+            ('root/a/f2', tarfile.REGTYPE, '', b'a/f2'),
+            ('root/c', tarfile.DIRTYPE, '', None),
+            ('root/c/f4', tarfile.REGTYPE, '', b'c/f4'),
+            ('root/f1', tarfile.REGTYPE, '', b'f1'),
+            ('root/link', tarfile.SYMTYPE, 'a', None),
+        ])
+
+    def test_directories_first(self):
+        result = [m[1] for m in self.members(self.build())]
+
+        self.assertEqual(result[:4], [tarfile.DIRTYPE] * 4)
+        self.assertNotIn(tarfile.DIRTYPE, result[4:])
+
+    def test_no_restat(self):
+        with mock.patch.object(os, 'lstat', wraps=os.lstat) as mock_lstat:
+            self.build(order=tarbuild.ORDER_NAME)
+
+        # Only the top of the tree is stat'ed directly
+        mock_lstat.assert_called_once_with(self.root)
+
+    def test_order_name(self):
+        result = [m[0] for m in self.members(
+            self.build(order=tarbuild.ORDER_NAME))]
+
+        self.assertEqual(result, [
+            'root', 'root/a', 'root/a/b', 'root/c',
+            'root/a/b/f3', 'root/a/f2', 'root/c/f4', 'root/f1', 'root/link',
+        ])
+
+    def test_order_inode(self):
+        out = self.build(order=tarbuild.ORDER_INODE)
+        names = [m[0] for m in self.members(out)][4:]
+        inodes = [os.lstat(os.path.join(self.root, name[5:])).st_ino
+                  for name in names]
+
+        self.assertEqual(inodes, sorted(inodes))
+
+    def test_order_physical(self):
+        result = sorted(m[0] for m in self.members(
+            self.build(order=tarbuild.ORDER_PHYSICAL)))
+
+        self.assertEqual(len(result), 9)
+
+    def test_order_bad(self):
+        self.assertRaises(ValueError, tarbuild.TarBuilder, None, 'random')
+
+    def test_hard_link(self):
+        os.link(os.path.join(self.root, 'f1'),
+                os.path.join(self.root, 'f5'))
+
+        result = self.members(self.build(order=tarbuild.ORDER_NAME))
+
+        self.assertEqual(result[-3:], [
+            ('root/f1', tarfile.REGTYPE, '', b'f1'),
+            ('root/f5', tarfile.LNKTYPE, 'root/f1', None),
+            ('root/link', tarfile.SYMTYPE, 'a', None),
+        ])
+
+    def test_reproducible(self):
+        first = self.build(reproducible=True, mtime=1000000).getvalue()
+        os.utime(os.path.join(self.root, 'f1'), (2000000, 2000000))
+        second = self.build(reproducible=True, mtime=1000000).getvalue()
+
+        self.assertEqual(first, second)
+        with tarfile.open(fileobj=io.BytesIO(first), mode='r|') as tar:
+            for info in tar:
+                self.assertEqual((info.uid, info.gid, info.uname,
+                                  info.gname, info.mtime),
+                                 (0, 0, '', '', 1000000))
+
+    def incremental(self, since):
+        out = io.BytesIO()
+        with tarfile.open(fileobj=out, mode='w|',
+                          format=tarfile.GNU_FORMAT) as tar:
+            tarbuild.TarBuilder(tar, 'name', since=since).build(
+                ((os.path.join(self.root, name), name)
+                 for name in os.listdir(self.root)), self.root)
+        out.seek(0)
+
+        result = {}
+        with tarfile.open(fileobj=out, mode='r|') as tar:
+            for info in tar:
+                data = tar.extractfile(info).read() if info.size else None
+                if info.type == tarbuild.GNUTYPE_DUMPDIR:
+                    data = tarbuild.parse_dumpdir(data)
+                result[info.name] = (info.type, data)
+        return result
+
+    def test_since_time(self):
+        result = self.incremental(time.time() + 10)
+
+        self.assertEqual(result, {
+            './': (tarbuild.GNUTYPE_DUMPDIR, [
+                (b'D', 'a'), (b'D', 'c'), (b'N', 'f1'), (b'N', 'link'),
+            ]),
+            'a/': (tarbuild.GNUTYPE_DUMPDIR, [(b'D', 'b'), (b'N', 'f2')]),
+            'a/b/': (tarbuild.GNUTYPE_DUMPDIR, [(b'N', 'f3')]),
+            'c/': (tarbuild.GNUTYPE_DUMPDIR, [(b'N', 'f4')]),
+        })
+
+    def test_since_snapshot(self):
+        snap = snapshot.Snapshot.take(self.root)
+        with open(os.path.join(self.root, 'c', 'f4'), 'w') as f:
+            f.write('changed')
+        os.chmod(os.path.join(self.root, 'f1'), 0o600)
+        os.remove(os.path.join(self.root, 'a', 'f2'))
+        os.mkdir(os.path.join(self.root, 'd'))
+        with open(os.path.join(self.root, 'd', 'f5'), 'w') as f:
+            f.write('d/f5')
+
+        result = self.incremental(snap)
+
+        self.assertEqual(result, {
+            './': (tarbuild.GNUTYPE_DUMPDIR, [
+                (b'D', 'a'), (b'D', 'c'), (b'D', 'd'), (b'Y', 'f1'),
+                (b'N', 'link'),
+            ]),
+            'a/': (tarbuild.GNUTYPE_DUMPDIR, [(b'D', 'b')]),
+            'a/b/': (tarbuild.GNUTYPE_DUMPDIR, [(b'N', 'f3')]),
+            'c/': (tarbuild.GNUTYPE_DUMPDIR, [(b'Y', 'f4')]),
+            'd/': (tarbuild.GNUTYPE_DUMPDIR, [(b'Y', 'f5')]),
+            'c/f4': (tarfile.REGTYPE, b'changed'),
+            'd/f5': (tarfile.REGTYPE, b'd/f5'),
+            'f1': (tarfile.REGTYPE, b'f1'),
+        })
+
+    def test_dumpdir(self):
+        data = tarbuild.format_dumpdir([(b'Y', 'z'), (b'N', 'y'),
+                                        (b'D', 'x')])
+
+        self.assertEqual(data, b'Dx\0Ny\0Yz\0\0')
+        self.assertEqual(tarbuild.parse_dumpdir(data),
+                         [(b'D', 'x'), (b'N', 'y'), (b'Y', 'z')])
+        self.assertEqual(tarbuild.parse_dumpdir(tarbuild.format_dumpdir([])),
+                         [])
+
+    def test_physical_offset(self):
+        result = tarbuild.physical_offset(os.path.join(self.root, 'f1'))
+
+        self.assertTrue(result is None or result >= 0)
+        self.assertEqual(
+            tarbuild.physical_offset(os.path.join(self.root, 'missing')),
+            None)
+
+
+class FSEntryTarTest(tests.function.TreeTestCase):
+    def test_reproducible(self):
+        tree = entry.FSTree(self.root)
+        first = io.BytesIO()
+        tree.tar(first, compression='gz', reproducible=True)
+        os.utime(os.path.join(self.root, 'c', 'f4'))
+        second = io.BytesIO()
+        with mock.patch.object(time, 'time', return_value=time.time() + 10):
+            tree.tar(second, compression='gz', reproducible=True)
+
+        self.assertEqual(first.getvalue(), second.getvalue())
+
+    def test_since_gnu_format(self):
+        tree = entry.FSTree(self.root)
+        out = io.BytesIO()
+        tree.tar(out, since=0)
+
+        # GNU tar only honors dumpdir members in its own format
+        self.assertEqual(out.getvalue()[257:265], tarfile.GNU_MAGIC)
+        with tarfile.open(fileobj=io.BytesIO(out.getvalue())) as tar:
+            self.assertEqual(sorted(tar.getnames()), [
+                './', 'a/', 'a/b/', 'a/b/f3', 'a/f2', 'c/', 'c/f4', 'f1',
+                'link',
+            ])
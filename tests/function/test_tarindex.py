@@ -0,0 +1,171 @@
+# Copyright 2014 Kevin L. Mitchell
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import io
+import os
+import tarfile
+
+import mock
+
+from fstree import compress
+from fstree import tarindex
+from fstree import tarview
+
+import tests.function
+
+
+DATA = b''.join(b'%08d' % i for i in range(64 * 1024))
+
+
+class TarIndexTest(tests.function.ArchiveTestCase):
+    def test_written(self):
+        name = self.tree.tar(os.path.join(self.outdir, 'out.tgz'),
+                             index=True)
+
+        index = tarindex.TarIndex.load(tarindex.index_path(name))
+
+        self.assertEqual(str(index.compression), 'gz')
+        self.assertEqual(sorted(info.name for info in index.members), [
+            'a', 'a/b', 'a/b/f3', 'a/f2', 'c', 'c/f4', 'f1', 'link',
+        ])
+        self.assertEqual(index.checkpoints, [(0, 0)])
+        with compress.reader(name, 'gz') as f:
+            data = f.read()
+        for info in index.members:
+            # The header may be preceded by a pax header
+            with tarfile.open(fileobj=io.BytesIO(data[info.offset:]),
+                              mode='r:') as tar:
+                self.assertEqual(tar.next().name, info.name)
+            if info.isreg():
+                self.assertEqual(
+                    data[info.offset_data:info.offset_data + info.size],
+                    info.name.encode('ascii'))
+
+    def test_stream(self):
+        self.assertRaises(ValueError, self.tree.tar, io.BytesIO(),
+                          index=True)
+
+        out = io.BytesIO()
+        idx = os.path.join(self.outdir, 'stream.idx')
+        self.tree.tar(out, index=idx)
+
+        index = tarindex.TarIndex.load(idx)
+        self.assertEqual(index.compression, None)
+        self.assertEqual(len(index.members), 8)
+
+    def test_tartree(self):
+        with open(os.path.join(self.root, 'big'), 'wb') as f:
+            f.write(DATA * 8)
+        name = self.tree.tar(os.path.join(self.outdir, 'out'),
+                             compression='bz2', index=True, workers=2,
+                             level=1)
+
+        with mock.patch.object(tarfile, 'open') as mock_open:
+            tree = tarview.TarTree(name)
+            self.assertEqual(tree['a/b/f3'].contents, 'a/b/f3')
+            with tree.open('big', 'rb') as f:
+                self.assertEqual(f.read(), DATA * 8)
+
+        self.assertFalse(mock_open.called)
+        self.assertTrue(len(tree._tarindex.checkpoints) > 1)
+
+    def test_tartree_no_index(self):
+        name = self.tree.tar(os.path.join(self.outdir, 'out'), index=True)
+
+        tree = tarview.TarTree(name, index=False)
+
+        self.assertEqual(tree._tarindex, None)
+        self.assertEqual(tree['f1'].contents, 'f1')
+
+    def test_records_archive(self):
+        name = self.tree.tar(os.path.join(self.outdir, 'out.tgz'),
+                             index=True)
+
+        index = tarindex.TarIndex.load(tarindex.index_path(name))
+
+        st = os.stat(name)
+        self.assertEqual(index.size, st.st_size)
+        self.assertEqual(index.mtime, st.st_mtime_ns)
+        self.assertTrue(index.matches(name))
+
+    def test_stream_records_size(self):
+        out = io.BytesIO()
+        idx = os.path.join(self.outdir, 'stream.idx')
+        self.tree.tar(out, index=idx)
+
+        index = tarindex.TarIndex.load(idx)
+
+        self.assertEqual(index.size, len(out.getvalue()))
+        self.assertEqual(index.mtime, None)
+
+    def test_relative_index(self):
+        self.tree.tar(io.BytesIO(), index='stream.idx')
+
+        self.assertTrue(os.path.exists(os.path.join(self.root,
+                                                    'stream.idx')))
+
+    def test_removes_stale(self):
+        name = self.tree.tar(os.path.join(self.outdir, 'out.tgz'),
+                             index=True)
+
+        self.tree.tar(name)
+
+        self.assertFalse(os.path.exists(tarindex.index_path(name)))
+
+    def test_tartree_stale(self):
+        name = self.tree.tar(os.path.join(self.outdir, 'out.tgz'),
+                             index=True)
+        idx = tarindex.index_path(name)
+        os.rename(idx, os.path.join(self.outdir, 'saved.idx'))
+        with open(os.path.join(self.root, 'f1'), 'w') as f:
+            f.write('changed f1')
+        self.tree.tar(name)
+        os.rename(os.path.join(self.outdir, 'saved.idx'), idx)
+
+        tree = tarview.TarTree(name)
+
+        self.assertEqual(tree._tarindex, None)
+        self.assertEqual(tree['f1'].contents, 'changed f1')
+        self.assertRaises(ValueError, tarview.TarTree, name, index=idx)
+
+    def test_version(self):
+        idx = os.path.join(self.outdir, 'bad.idx')
+        with open(idx, 'w') as f:
+            f.write('{"version": 99}')
+
+        self.assertRaises(ValueError, tarindex.TarIndex.load, idx)
+
+
+class CheckpointReaderTest(tests.function.TreeTestCase):
+    def test_seek(self):
+        path = os.path.join(self.root, 'data.gz')
+        with open(path, 'wb') as f:
+            writer = compress.ParallelWriter(f, 'gz', blocksize=64 * 1024)
+            writer.write(DATA)
+            writer.close()
+        checkpoints = writer.checkpoints
+        self.assertEqual(len(checkpoints), 8)
+
+        # Clobber the first block; it should never be read
+        with open(path, 'r+b') as f:
+            f.write(b'\0' * checkpoints[1][1])
+
+        index = tarindex.TarIndex('gz', [], checkpoints)
+        with index.open(path) as f:
+            f.seek(300000)
+            self.assertEqual(f.read(16), DATA[300000:300016])
+            f.seek(70000)
+            self.assertEqual(f.read(100000), DATA[70000:170000])
+            self.assertEqual(f.tell(), 170000)
@@ -0,0 +1,74 @@
+# Copyright 2014 Kevin L. Mitchell
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import hashlib
+import os
+import tarfile
+
+from fstree import entry
+
+import tests.function
+
+
+class TarShardedTest(tests.function.ArchiveTestCase):
+    def names(self, filename):
+        with tarfile.open(filename) as tar:
+            return tar.getnames()
+
+    def test_shards(self):
+        result = self.tree.tar_sharded(os.path.join(self.outdir, 'out.tgz'),
+                                       shards=2, workers=1)
+
+        self.assertEqual([name for name, digest in result], [
+            os.path.join(self.outdir, 'out-000.tgz'),
+            os.path.join(self.outdir, 'out-001.tgz'),
+        ])
+        for name, digest in result:
+            with open(name, 'rb') as f:
+                self.assertEqual(hashlib.md5(f.read()).hexdigest(), digest)
+        self.assertEqual(sorted(self.names(result[0][0]) +
+                                self.names(result[1][0])), [
+            'a', 'a', 'a/b', 'a/b/f3', 'a/f2', 'c', 'c/f4', 'f1', 'link',
+        ])
+
+    def test_process_pool(self):
+        result = self.tree.tar_sharded(os.path.join(self.outdir, 'out'),
+                                       compression='bz2', max_size=2048,
+                                       hasher='sha1', workers=2)
+
+        self.assertEqual(len(result), 3)
+        for name, digest in result:
+            self.assertTrue(name.endswith('.tar.bz2'))
+            with open(name, 'rb') as f:
+                self.assertEqual(hashlib.sha1(f.read()).hexdigest(), digest)
+
+        # Together, the shards hold the tree
+        dest = entry.FSTree(self.outdir)
+        for name, digest in result:
+            dest.untar(name, 'x')
+        for fname in ('f1', 'a/f2', 'a/b/f3', 'c/f4'):
+            with open(os.path.join(self.outdir, 'x', fname)) as f:
+                self.assertEqual(f.read(), fname)
+        self.assertEqual(os.readlink(os.path.join(self.outdir, 'x', 'link')),
+                         'a')
+
+    def test_reproducible(self):
+        first = self.tree.tar_sharded(os.path.join(self.outdir, 'one.tgz'),
+                                      shards=3, reproducible=True, workers=1)
+        second = self.tree.tar_sharded(os.path.join(self.outdir, 'two.tgz'),
+                                       shards=3, reproducible=True)
+
+        self.assertEqual([digest for name, digest in first],
+                         [digest for name, digest in second])
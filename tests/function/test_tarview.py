@@ -0,0 +1,157 @@
+# Copyright 2014 Kevin L. Mitchell
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import hashlib
+import io
+import os
+import stat
+import tarfile
+
+import mock
+
+from fstree import merkle
+from fstree import tarview
+
+import tests.function
+
+
+class TarTreeTest(tests.function.ArchiveTestCase):
+    def make(self, name='out', **kwargs):
+        return tarview.TarTree(self.tree.tar(
+            os.path.join(self.outdir, name), **kwargs))
+
+    def test_walk(self):
+        tree = self.make()
+
+        self.assertEqual(list(tree.walk()), [
+            ('/', ['a', 'c'], ['f1', 'link']),
+            ('/a', ['b'], ['f2']),
+            ('/a/b', [], ['f3']),
+            ('/c', [], ['f4']),
+        ])
+        self.assertEqual(list(tree['a'].walk('b', topdown=False)), [
+            ('/a/b', [], ['f3']),
+        ])
+
+    def test_contents(self):
+        tree = self.make(compression='gz')
+
+        self.assertEqual(tree['/a/b/f3'].contents, 'a/b/f3')
+        self.assertEqual(tree['a'].contents, ['b', 'f2'])
+        self.assertEqual(tree['link'].contents, ['b', 'f2'])
+        self.assertEqual(tree.contents, ['a', 'c', 'f1', 'link'])
+
+    def test_open(self):
+        tree = self.make()
+
+        with tree.open('/c/f4', 'rb') as f:
+            f.seek(2)
+            self.assertEqual(f.read(), b'f4')
+            f.seek(0)
+            self.assertEqual(f.read(1), b'c')
+        with tree['link'].open('f2') as f:
+            self.assertEqual(f.read(), 'a/f2')
+
+        self.assertRaises(ValueError, tree.open, 'f1', 'w')
+        self.assertRaises(IOError, tree.open, 'a')
+
+    def test_random_access(self):
+        tree = self.make()
+
+        # Reading an uncompressed member seeks straight to it
+        with mock.patch.object(tarfile, 'open') as mock_open:
+            self.assertEqual(tree['f1'].contents, 'f1')
+        self.assertFalse(mock_open.called)
+
+    def test_stat(self):
+        tree = self.make(compression='bz2')
+        st = os.lstat(os.path.join(self.root, 'a', 'f2'))
+
+        ent = tree['a/f2']
+        self.assertEqual((ent.st_mode, ent.st_size, int(ent.st_mtime),
+                          ent.st_uid), (st.st_mode, st.st_size,
+                                        int(st.st_mtime), st.st_uid))
+        self.assertTrue(tree['link'].isdir)
+        self.assertTrue(tree['link'].islink)
+        self.assertTrue(stat.S_ISLNK(tree['link'].lst_mode))
+        self.assertTrue(tree['f1'].isfile)
+        self.assertEqual(tree['a/b'].basename, 'b')
+        self.assertEqual(tree['a/b'].dirname, '/a')
+
+    def test_lookup(self):
+        tree = self.make()
+
+        self.assertIn('a/b/f3', tree)
+        self.assertIn('link/b/f3', tree)
+        self.assertEqual(tree['link/b'].name, '/a/b')
+        self.assertNotIn('missing', tree)
+        self.assertRaises(KeyError, lambda: tree['missing'])
+        self.assertEqual(tree.get('missing', 'default'), 'default')
+
+    def test_digest(self):
+        tree = self.make(compression='xz')
+
+        self.assertEqual(tree['a/f2'].digest(hasher='sha1'),
+                         hashlib.sha1(b'a/f2').hexdigest())
+        self.assertEqual(tree.digest(), merkle.digest(self.root))
+        self.assertEqual(tree['link'].digest(),
+                         merkle.digest(os.path.join(self.root, 'a')))
+        self.assertRaises(ValueError, tree.digest, 'a', hashlib.md5())
+
+    def test_magic(self):
+        name = self.tree.tar(os.path.join(self.outdir, 'out.tgz'))
+        os.rename(name, os.path.join(self.outdir, 'archive'))
+
+        tree = tarview.TarTree(os.path.join(self.outdir, 'archive'))
+
+        self.assertEqual(str(tree.compression), 'gz')
+        self.assertEqual(tree['c/f4'].contents, 'c/f4')
+
+    def test_implied_directories(self):
+        out = os.path.join(self.outdir, 'out.tar')
+        with tarfile.open(out, 'w') as tar:
+            info = tarfile.TarInfo('./x/y/z')
+            info.size = 1
+            tar.addfile(info, io.BytesIO(b'z'))
+
+        tree = tarview.TarTree(out)
+
+        self.assertEqual(list(tree.walk()), [
+            ('/', ['x'], []),
+            ('/x', ['y'], []),
+            ('/x/y', [], ['z']),
+        ])
+        self.assertTrue(tree['x'].isdir)
+
+    def test_hard_link(self):
+        os.link(os.path.join(self.root, 'f1'),
+                os.path.join(self.root, 'f5'))
+
+        tree = self.make(order='name')
+
+        self.assertEqual(tree['f5'].info.type, tarfile.LNKTYPE)
+        self.assertEqual(tree['f5'].contents, 'f1')
+        self.assertEqual(tree['f5'].st_size, 2)
+
+    def test_incremental(self):
+        tree = self.make(since=0)
+
+        self.assertEqual(list(tree.walk()), [
+            ('/', ['a', 'c'], ['f1', 'link']),
+            ('/a', ['b'], ['f2']),
+            ('/a/b', [], ['f3']),
+            ('/c', [], ['f4']),
+        ])
+        self.assertTrue(tree['a'].isdir)
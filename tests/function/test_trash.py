@@ -0,0 +1,217 @@
+# Copyright 2014 Kevin L. Mitchell
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import errno
+import os
+import threading
+
+import mock
+
+from fstree import entry
+from fstree import trash
+
+import tests.function
+
+
+class TrashTest(tests.function.TreeTestCase):
+    def setUp(self):
+        super(TrashTest, self).setUp()
+
+        self.trash_dir = os.path.join(self.root, '.trash')
+
+    def test_trash_path(self):
+        self.assertEqual(trash.trash_path('/x/y/tree'), '/x/y/.tree.trash')
+        self.assertEqual(trash.trash_path('/x/y/tree/'), '/x/y/.tree.trash')
+        self.assertRaises(ValueError, trash.trash_path, '/')
+        self.assertRaises(ValueError, trash.trash_path, '//')
+        self.assertRaises(ValueError, trash.trash_path, 'tree')
+
+    def test_discard(self):
+        can = trash.Trash(self.trash_dir)
+
+        can.discard(os.path.join(self.root, 'a'))
+        can.discard(os.path.join(self.root, 'f1'))
+
+        self.assertFalse(os.path.exists(os.path.join(self.root, 'a')))
+        self.assertFalse(os.path.exists(os.path.join(self.root, 'f1')))
+        self.assertTrue(can.wait(5))
+        self.assertFalse(can.pending)
+        self.assertFalse(os.path.exists(self.trash_dir))
+
+    def test_discard_returns_before_removal(self):
+        can = trash.Trash(self.trash_dir)
+        gate = threading.Event()
+
+        with mock.patch.object(trash.removal, 'rmtree',
+                               side_effect=lambda *a, **k: gate.wait()):
+            can.discard(os.path.join(self.root, 'a'))
+
+            self.assertTrue(can.pending)
+            self.assertFalse(can.wait(0.01))
+            gate.set()
+            self.assertTrue(can.wait(5))
+
+    def test_discard_missing(self):
+        can = trash.Trash(self.trash_dir)
+
+        self.assertRaises(OSError, can.discard,
+                          os.path.join(self.root, 'missing'))
+
+    def test_discard_retries(self):
+        can = trash.Trash(self.trash_dir)
+        rename = os.rename
+        calls = []
+
+        def racing_rename(src, dst):
+            # Another process reaps the trash directory the first time
+            calls.append(src)
+            if len(calls) == 1:
+                os.rmdir(self.trash_dir)
+            return rename(src, dst)
+
+        with mock.patch.object(trash.os, 'rename', side_effect=racing_rename):
+            can.discard(os.path.join(self.root, 'a'))
+
+        self.assertEqual(len(calls), 2)
+        self.assertFalse(os.path.exists(os.path.join(self.root, 'a')))
+        self.assertTrue(can.wait(5))
+
+    def test_purges_stale(self):
+        os.mkdir(self.trash_dir)
+        os.rename(os.path.join(self.root, 'c'),
+                  os.path.join(self.trash_dir, '12345-stale'))
+
+        with mock.patch.object(trash.os, 'kill',
+                               side_effect=ProcessLookupError()):
+            can = trash.Trash(self.trash_dir)
+
+        self.assertTrue(can.wait(5))
+        self.assertFalse(os.path.exists(self.trash_dir))
+
+    def test_keeps_live(self):
+        os.mkdir(self.trash_dir)
+        os.rename(os.path.join(self.root, 'c'),
+                  os.path.join(self.trash_dir, '12345-live'))
+        os.rename(os.path.join(self.root, 'f1'),
+                  os.path.join(self.trash_dir, '%d-mine' % os.getpid()))
+        os.rename(os.path.join(self.root, 'a'),
+                  os.path.join(self.trash_dir, 'other'))
+
+        with mock.patch.object(trash.os, 'kill', return_value=None):
+            can = trash.Trash(self.trash_dir)
+
+        self.assertTrue(can.wait(5))
+        self.assertEqual(sorted(os.listdir(self.trash_dir)),
+                         sorted(['%d-mine' % os.getpid(), '12345-live',
+                                 'other']))
+
+    def test_keeps_other_users(self):
+        os.mkdir(self.trash_dir)
+        os.rename(os.path.join(self.root, 'c'),
+                  os.path.join(self.trash_dir, '1-live'))
+
+        with mock.patch.object(trash.os, 'kill',
+                               side_effect=PermissionError()):
+            can = trash.Trash(self.trash_dir)
+
+        self.assertTrue(can.wait(5))
+        self.assertEqual(os.listdir(self.trash_dir), ['1-live'])
+
+
+class FSTreeTrashTest(tests.function.TreeTestCase):
+    def test_remove_defer(self):
+        tree = entry.FSTree(os.path.join(self.root, 'a'))
+
+        tree.remove('b', defer=True)
+        tree.remove('f2', defer=True)
+
+        self.assertEqual(os.listdir(tree.path), [])
+        self.assertTrue(tree.drain(5))
+        self.assertFalse(os.path.exists(os.path.join(self.root, '.a.trash')))
+
+    def test_remove_defer_errors(self):
+        tree = entry.FSTree(os.path.join(self.root, 'a'))
+        onerror = mock.Mock()
+
+        self.assertRaises(OSError, tree.remove, 'missing', defer=True)
+        tree.remove('missing', defer=True, ignore_errors=True)
+        tree.remove('missing', defer=True, onerror=onerror)
+
+        onerror.assert_called_once_with(
+            os.remove, os.path.join(self.root, 'a', 'missing'), mock.ANY)
+
+    def test_remove_defer_cross_device(self):
+        tree = entry.FSTree(os.path.join(self.root, 'a'))
+
+        with mock.patch('os.rename',
+                        side_effect=OSError(errno.EXDEV, 'cross-device')):
+            tree.remove('b', defer=True)
+
+        self.assertEqual(os.listdir(tree.path), ['f2'])
+
+    def test_remove_defer_unmovable(self):
+        tree = entry.FSTree(os.path.join(self.root, 'a'))
+
+        with mock.patch('os.rename',
+                        side_effect=OSError(errno.EACCES, 'denied')):
+            tree.remove('b', defer=True)
+            tree.remove('f2', defer=True)
+
+        self.assertEqual(os.listdir(tree.path), [])
+
+    def test_cleanup_background(self):
+        tree = entry.FSTree(os.path.join(self.root, 'a'))
+
+        tree.cleanup(background=True)
+
+        self.assertFalse(os.path.exists(os.path.join(self.root, 'a')))
+        self.assertTrue(tree.drain(5))
+        self.assertEqual(sorted(os.listdir(self.root)),
+                         ['c', 'f1', 'link'])
+
+    def test_cleanup_background_unmovable(self):
+        tree = entry.FSTree(os.path.join(self.root, 'a'))
+
+        with mock.patch('os.rename',
+                        side_effect=OSError(errno.EACCES, 'denied')):
+            tree.cleanup(background=True)
+
+        self.assertFalse(os.path.exists(os.path.join(self.root, 'a')))
+        self.assertTrue(tree.drain(5))
+
+    def test_root_not_deferred(self):
+        tree = entry.FSTree('/')
+        cwd = os.getcwd()
+        os.chdir(self.root)
+        try:
+            tree.remove(os.path.join(self.root, 'a'), defer=True)
+        finally:
+            os.chdir(cwd)
+
+        self.assertEqual(sorted(os.listdir(self.root)), ['c', 'f1', 'link'])
+        self.assertTrue(tree.drain(0))
+
+    def test_construct_purges(self):
+        stale = os.path.join(self.root, '.a.trash')
+        os.mkdir(stale)
+        os.rename(os.path.join(self.root, 'c'),
+                  os.path.join(stale, '12345-x'))
+
+        with mock.patch.object(trash.os, 'kill',
+                               side_effect=ProcessLookupError()):
+            tree = entry.FSTree(os.path.join(self.root, 'a'))
+
+        self.assertTrue(tree.drain(5))
+        self.assertFalse(os.path.exists(stale))
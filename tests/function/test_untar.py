@@ -0,0 +1,365 @@
+# Copyright 2014 Kevin L. Mitchell
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import io
+import os
+import shutil
+import tarfile
+import threading
+
+from fstree import entry
+from fstree import tarbuild
+from fstree import untar
+
+import tests.function
+
+
+class UntarTestCase(tests.function.ArchiveTestCase):
+    def setUp(self):
+        super(UntarTestCase, self).setUp()
+
+        self.dest = entry.FSTree(self.outdir)
+
+    def contents(self, root):
+        result = {}
+        for dirpath, dirnames, filenames in os.walk(root):
+            for name in dirnames + filenames:
+                path = os.path.join(dirpath, name)
+                rel = os.path.relpath(path, root)
+                if os.path.islink(path):
+                    result[rel] = ('link', os.readlink(path))
+                elif os.path.isdir(path):
+                    result[rel] = ('dir', os.stat(path).st_mtime)
+                else:
+                    with open(path, 'rb') as f:
+                        result[rel] = ('file', f.read(),
+                                       os.stat(path).st_mode,
+                                       os.stat(path).st_mtime)
+        return result
+
+    def archive(self, *members):
+        out = io.BytesIO()
+        with tarfile.open(fileobj=out, mode='w') as tar:
+            for info, data in members:
+                tar.addfile(info, io.BytesIO(data) if data else None)
+        out.seek(0)
+        return out
+
+
+class UntarTest(UntarTestCase):
+    def test_roundtrip(self):
+        os.chmod(os.path.join(self.root, 'a', 'f2'), 0o600)
+        os.utime(os.path.join(self.root, 'a'), (1000000, 1000000))
+        name = self.tree.tar(os.path.join(self.outdir, 'out.tgz'))
+
+        result = self.dest.untar(name, 'x', workers=4)
+
+        self.assertEqual(result.path, os.path.join(self.outdir, 'x'))
+        self.assertEqual(self.contents(result.path),
+                         self.contents(self.root))
+
+    def test_magic(self):
+        name = self.tree.tar(os.path.join(self.outdir, 'out'),
+                             compression='bz2')
+        os.rename(name, os.path.join(self.outdir, 'archive'))
+
+        result = self.dest.untar('archive', 'x')
+
+        self.assertEqual(self.contents(result.path),
+                         self.contents(self.root))
+
+    def test_pipe(self):
+        rfd, wfd = os.pipe()
+
+        def writer():
+            with os.fdopen(wfd, 'wb') as f:
+                self.tree.tar(f, compression='xz', workers=2)
+
+        thread = threading.Thread(target=writer)
+        thread.start()
+        with os.fdopen(rfd, 'rb', 0) as f:
+            result = self.dest.untar(f, workers=2)
+        thread.join()
+
+        self.assertEqual(result.path, self.outdir)
+        self.assertEqual(self.contents(self.outdir),
+                         self.contents(self.root))
+
+    def test_uncompressed_stream(self):
+        out = io.BytesIO()
+        self.tree['/a'].tar(out)
+        out.seek(0)
+
+        self.dest.untar(out)
+
+        self.assertEqual(sorted(self.contents(self.outdir)),
+                         ['b', 'b/f3', 'f2'])
+
+    def test_unsupported(self):
+        self.assertRaises(ValueError, self.dest.untar,
+                          io.BytesIO(b'\x1f\x9d\x90junk'))
+
+    def test_hard_link(self):
+        os.link(os.path.join(self.root, 'f1'),
+                os.path.join(self.root, 'f5'))
+        out = io.BytesIO()
+        self.tree.tar(out, order='name')
+        out.seek(0)
+
+        self.dest.untar(out, workers=2)
+
+        self.assertTrue(os.path.samefile(os.path.join(self.outdir, 'f1'),
+                                         os.path.join(self.outdir, 'f5')))
+
+    def test_replaces_symlink(self):
+        victim = os.path.join(self.root, 'f1')
+        os.symlink(victim, os.path.join(self.outdir, 'f1'))
+        info = tarfile.TarInfo('f1')
+        info.size = 3
+
+        self.dest.untar(self.archive((info, b'new')), workers=2)
+
+        self.assertFalse(os.path.islink(os.path.join(self.outdir, 'f1')))
+        with open(victim, 'rb') as f:
+            self.assertEqual(f.read(), b'f1')
+
+    def test_incremental(self):
+        full = self.tree.tar(os.path.join(self.outdir, 'full.tgz'))
+        snap = self.tree.snapshot()
+        os.remove(os.path.join(self.root, 'f1'))
+        shutil.rmtree(os.path.join(self.root, 'a', 'b'))
+        with open(os.path.join(self.root, 'c', 'f4'), 'w') as f:
+            f.write('changed')
+        os.mkdir(os.path.join(self.root, 'd'))
+        with open(os.path.join(self.root, 'd', 'f5'), 'w') as f:
+            f.write('d/f5')
+        incr = self.tree.tar(os.path.join(self.outdir, 'incr.tgz'),
+                             since=snap)
+
+        self.dest.untar(full, 'x')
+        result = self.dest.untar(incr, 'x', workers=2)
+
+        # GNU headers record whole seconds, so ignore the times
+        self.assertEqual(
+            dict((name, value[:2]) for name, value in
+                 self.contents(result.path).items() if value[0] != 'dir'),
+            dict((name, value[:2]) for name, value in
+                 self.contents(self.root).items() if value[0] != 'dir'))
+        self.assertEqual(sorted(self.contents(result.path)),
+                         sorted(self.contents(self.root)))
+
+    def test_dumpdir_through_symlink(self):
+        os.symlink(self.root, os.path.join(self.outdir, 'a'))
+        data = tarbuild.format_dumpdir([])
+        info = tarfile.TarInfo('a/')
+        info.type = tarbuild.GNUTYPE_DUMPDIR
+        info.mode = 0o755
+        info.size = len(data)
+
+        self.dest.untar(self.archive((info, data)))
+
+        self.assertEqual(os.listdir(os.path.join(self.outdir, 'a')), [])
+        self.assertFalse(os.path.islink(os.path.join(self.outdir, 'a')))
+        self.assertEqual(sorted(os.listdir(self.root)),
+                         ['a', 'c', 'f1', 'link'])
+
+    def test_dumpdir_keeps_outside(self):
+        os.makedirs(os.path.join(self.outdir, 'a', 'sub'))
+        os.symlink(self.root, os.path.join(self.outdir, 'a', 'out'))
+        os.symlink(os.path.join(self.root, 'a'),
+                   os.path.join(self.outdir, 'a', 'sub', 'deep'))
+        data = tarbuild.format_dumpdir([])
+        info = tarfile.TarInfo('a/')
+        info.type = tarbuild.GNUTYPE_DUMPDIR
+        info.mode = 0o755
+        info.size = len(data)
+
+        self.dest.untar(self.archive((info, data)))
+
+        self.assertEqual(os.listdir(os.path.join(self.outdir, 'a')), [])
+        self.assertEqual(sorted(self.contents(self.root)),
+                         ['a', 'a/b', 'a/b/f3', 'a/f2', 'c', 'c/f4', 'f1',
+                          'link'])
+
+    def test_dumpdir_after_replacement(self):
+        cdir = tarfile.TarInfo('c')
+        cdir.type = tarfile.DIRTYPE
+        cdir.mode = 0o755
+        keep = tarfile.TarInfo('c/keep')
+        keep.size = 1
+        link = tarfile.TarInfo('a')
+        link.type = tarfile.SYMTYPE
+        link.linkname = 'c'
+        data = tarbuild.format_dumpdir([])
+        purge = tarfile.TarInfo('a/')
+        purge.type = tarbuild.GNUTYPE_DUMPDIR
+        purge.mode = 0o755
+        purge.size = len(data)
+
+        self.dest.untar(self.archive((cdir, None), (keep, b'x'),
+                                     (link, None), (purge, data)))
+
+        self.assertFalse(os.path.islink(os.path.join(self.outdir, 'a')))
+        self.assertEqual(os.listdir(os.path.join(self.outdir, 'a')), [])
+        self.assertEqual(os.listdir(os.path.join(self.outdir, 'c')),
+                         ['keep'])
+
+    def test_through_internal_symlink(self):
+        os.mkdir(os.path.join(self.outdir, 'real'))
+        os.symlink('real', os.path.join(self.outdir, 'via'))
+        info = tarfile.TarInfo('via/f')
+        info.size = 1
+
+        self.dest.untar(self.archive((info, b'x')), workers=2)
+
+        with open(os.path.join(self.outdir, 'real', 'f'), 'rb') as f:
+            self.assertEqual(f.read(), b'x')
+        self.assertTrue(os.path.islink(os.path.join(self.outdir, 'via')))
+
+    def test_symlink_leading_parent(self):
+        adir = tarfile.TarInfo('a')
+        adir.type = tarfile.DIRTYPE
+        adir.mode = 0o755
+        link = tarfile.TarInfo('a/up')
+        link.type = tarfile.SYMTYPE
+        link.linkname = '../b/./f'
+
+        self.dest.untar(self.archive((adir, None), (link, None)))
+
+        self.assertEqual(os.readlink(os.path.join(self.outdir, 'a', 'up')),
+                         '../b/./f')
+
+
+class UntarEscapeTest(UntarTestCase):
+    def assertRejected(self, *members):
+        self.assertRaises(ValueError, self.dest.untar,
+                          self.archive(*members))
+        self.assertEqual(sorted(os.listdir(self.root)),
+                         ['a', 'c', 'f1', 'link'])
+
+    def test_parent(self):
+        info = tarfile.TarInfo('../escape')
+        info.size = 1
+
+        self.assertRejected((info, b'x'))
+
+    def test_absolute(self):
+        info = tarfile.TarInfo(os.path.join(self.root, 'escape'))
+        info.size = 1
+
+        self.assertRejected((info, b'x'))
+
+    def test_symlink_target(self):
+        info = tarfile.TarInfo('link')
+        info.type = tarfile.SYMTYPE
+        info.linkname = '../etc'
+
+        self.assertRejected((info, None))
+
+    def test_symlink_parent_through_symlink(self):
+        here = tarfile.TarInfo('q')
+        here.type = tarfile.SYMTYPE
+        here.linkname = '.'
+        up = tarfile.TarInfo('p')
+        up.type = tarfile.SYMTYPE
+        up.linkname = 'q/..'
+        info = tarfile.TarInfo('p/escape')
+        info.size = 1
+
+        self.assertRejected((here, None), (up, None), (info, b'x'))
+        self.assertFalse(os.path.lexists(os.path.join(self.outdir, 'p')))
+        self.assertFalse(os.path.lexists(
+            os.path.join(os.path.dirname(self.outdir), 'escape')))
+
+    def test_replaced_directory(self):
+        adir = tarfile.TarInfo('a')
+        adir.type = tarfile.DIRTYPE
+        adir.mode = 0o755
+        afile = tarfile.TarInfo('a/f')
+        afile.size = 1
+        here = tarfile.TarInfo('q')
+        here.type = tarfile.SYMTYPE
+        here.linkname = '.'
+        data = tarbuild.format_dumpdir([(tarbuild.DUMPDIR_UNCHANGED, 'q')])
+        purge = tarfile.TarInfo('./')
+        purge.type = tarbuild.GNUTYPE_DUMPDIR
+        purge.mode = 0o755
+        purge.size = len(data)
+        up = tarfile.TarInfo('a')
+        up.type = tarfile.SYMTYPE
+        up.linkname = 'q/..'
+        evil = tarfile.TarInfo('a/evil')
+        evil.size = 1
+
+        self.assertRejected((adir, None), (afile, b'x'), (here, None),
+                            (purge, data), (up, None), (evil, b'x'))
+        self.assertFalse(os.path.lexists(
+            os.path.join(os.path.dirname(self.outdir), 'evil')))
+        self.assertFalse(os.path.lexists(os.path.join(self.outdir, 'a')))
+
+    def test_replaced_directory_redirected(self):
+        adir = tarfile.TarInfo('a')
+        adir.type = tarfile.DIRTYPE
+        adir.mode = 0o755
+        afile = tarfile.TarInfo('a/f')
+        afile.size = 1
+        data = tarbuild.format_dumpdir([])
+        purge = tarfile.TarInfo('./')
+        purge.type = tarbuild.GNUTYPE_DUMPDIR
+        purge.mode = 0o755
+        purge.size = len(data)
+        evil = tarfile.TarInfo('a/evil')
+        evil.size = 1
+
+        # Put the symbolic link in place of the directory behind the
+        # extractor's back, then keep extracting into it
+        extractor = untar.Extractor(self.outdir)
+        tar = tarfile.open(fileobj=self.archive(
+            (adir, None), (afile, b'x'), (purge, data), (evil, b'x')))
+        members = tar.getmembers()
+        for info in members[:3]:
+            extractor.member(tar, info)
+        os.symlink(self.root, os.path.join(self.outdir, 'a'))
+
+        self.assertRaises(ValueError, extractor.member, tar, members[3])
+        self.assertEqual(sorted(os.listdir(self.root)),
+                         ['a', 'c', 'f1', 'link'])
+
+    def test_through_symlink(self):
+        os.symlink(self.root, os.path.join(self.outdir, 'link'))
+        info = tarfile.TarInfo('link/escape')
+        info.size = 1
+
+        self.assertRejected((info, b'x'))
+
+
+class OpenSourceTest(UntarTestCase):
+    def test_short_reads(self):
+        class Trickle(object):
+            def __init__(self, data):
+                self.data = data
+
+            def read(self, size=-1):
+                size = 1 if size is None or size < 0 else min(size, 1)
+                data, self.data = self.data[:size], self.data[size:]
+                return data
+
+        out = io.BytesIO()
+        self.tree['/c'].tar(out, compression='gz')
+
+        reader = untar.open_source(Trickle(out.getvalue()))
+
+        with tarfile.open(fileobj=reader, mode='r|') as tar:
+            self.assertEqual(tar.getnames(), ['f4'])
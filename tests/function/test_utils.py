@@ -0,0 +1,71 @@
+# Copyright 2014 Kevin L. Mitchell
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import hashlib
+import os
+
+import mock
+
+from fstree import entry
+from fstree import utils
+
+import tests.function
+
+
+class DigestFileTest(tests.function.TreeTestCase):
+    def setUp(self):
+        super(DigestFileTest, self).setUp()
+
+        self.data = os.urandom(3 * 1024 * 1024 + 17)
+        self.path = os.path.join(self.root, 'big')
+        with open(self.path, 'wb') as f:
+            f.write(self.data)
+
+    def test_read(self):
+        digesters = (hashlib.md5(), hashlib.sha1())
+
+        result = utils.digest_file(self.path, digesters)
+
+        self.assertEqual(result, hashlib.md5(self.data).hexdigest())
+        self.assertEqual(digesters[1].hexdigest(),
+                         hashlib.sha1(self.data).hexdigest())
+
+    @mock.patch.object(utils, 'MMAP_THRESHOLD', 1024)
+    def test_mmap(self):
+        digesters = (hashlib.md5(), hashlib.sha1())
+
+        with mock.patch.object(utils, '_digest_mmap',
+                               wraps=utils._digest_mmap) as mock_mmap:
+            result = utils.digest_file(self.path, digesters)
+
+        self.assertTrue(mock_mmap.called)
+        self.assertEqual(result, hashlib.md5(self.data).hexdigest())
+        self.assertEqual(digesters[1].hexdigest(),
+                         hashlib.sha1(self.data).hexdigest())
+
+    @mock.patch.object(utils, 'MMAP_THRESHOLD', 0)
+    def test_empty(self):
+        path = os.path.join(self.root, 'empty')
+        open(path, 'wb').close()
+
+        result = utils.digest_file(path, (hashlib.md5(),))
+
+        self.assertEqual(result, hashlib.md5(b'').hexdigest())
+
+    def test_entry_binary(self):
+        tree = entry.FSTree(self.root)
+
+        self.assertEqual(tree.digest('big', 'sha256'),
+                         hashlib.sha256(self.data).hexdigest())
@@ -111,6 +111,41 @@ class CachePropertyTest(unittest.TestCase):
                          {'test_prop': {'a': 1, 'b': 2}, 'other': 'test'})
         self.assertEqual(obj._test_prop, 'cached')
 
+    def test_call_trusted(self):
+        def test_prop(obj):
+            return 'prop'
+        base = mock.Mock()
+        obj = mock.Mock(
+            spec=['__cache_control__', '__cache_trusted__', '_test_prop'],
+            __cache_control__={'test_prop': {'a': 1}},
+            __cache_trusted__=True,
+            _test_prop='cached',
+        )
+        cacher = cacheprop.CacheProperty(test_prop, ['a'], base)
+
+        result = cacher(obj)
+
+        self.assertEqual(result, 'cached')
+        self.assertFalse(base.called)
+
+    def test_call_trusted_noctrl(self):
+        def test_prop(obj):
+            return 'prop'
+        obj = mock.Mock(
+            spec=['__cache_control__', '__cache_trusted__', '_test_prop',
+                  'a'],
+            __cache_control__={},
+            __cache_trusted__=True,
+            _test_prop='cached',
+            a=1,
+        )
+        cacher = cacheprop.CacheProperty(test_prop, ['a'], lambda x: x)
+
+        result = cacher(obj)
+
+        self.assertEqual(result, 'prop')
+        self.assertEqual(obj.__cache_control__, {'test_prop': {'a': 1}})
+
     def test_call_set_ctrl_outdated(self):
         def test_prop(obj):
             return 'prop'
@@ -266,3 +301,26 @@ class CachedPropertyDecoratorTest(unittest.TestCase):
             self.assertTrue(attr in 'abc')
             self.assertEqual(getter(mock.Mock(**{attr: 'spam'})), 'spam')
         self.assertEqual(result.base('spam'), 'spam')
+
+
+class InvalidateTest(unittest.TestCase):
+    def test_no_ctrl(self):
+        obj = mock.Mock(spec=[])
+
+        cacheprop.invalidate(obj)
+
+        self.assertFalse(hasattr(obj, '__cache_control__'))
+
+    def test_all(self):
+        obj = mock.Mock(__cache_control__={'a': {}, 'b': {}})
+
+        cacheprop.invalidate(obj)
+
+        self.assertEqual(obj.__cache_control__, {})
+
+    def test_props(self):
+        obj = mock.Mock(__cache_control__={'a': {}, 'b': {}, 'c': {}})
+
+        cacheprop.invalidate(obj, 'a', 'c', 'd')
+
+        self.assertEqual(obj.__cache_control__, {'b': {}})
@@ -0,0 +1,188 @@
+# Copyright 2014 Kevin L. Mitchell
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import bz2
+import gzip
+import io
+import lzma
+import unittest
+import zlib
+
+import mock
+
+from fstree import compress
+
+
+DATA = b''.join(b'line %d of the test data\n' % i for i in range(1000))
+
+
+def members(data):
+    count = 0
+    while data:
+        decomp = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        decomp.decompress(data)
+        data = decomp.unused_data
+        count += 1
+    return count
+
+
+class ParallelWriterTest(unittest.TestCase):
+    def write(self, compression, data=DATA, **kwargs):
+        out = io.BytesIO()
+        writer = compress.ParallelWriter(out, compression, **kwargs)
+        for i in range(0, len(data), 1000):
+            writer.write(data[i:i + 1000])
+        writer.close()
+
+        self.assertEqual(writer.tell(), len(data))
+        self.assertFalse(out.closed)
+        return out.getvalue()
+
+    def test_gzip(self):
+        result = self.write('gz', workers=4, blocksize=4096)
+
+        self.assertEqual(members(result), len(DATA) // 4096 + 1)
+        self.assertEqual(gzip.decompress(result), DATA)
+
+    def test_gzip_reproducible(self):
+        self.assertEqual(self.write('gz', workers=3, blocksize=4096),
+                         self.write('gz', blocksize=4096))
+
+    def test_bz2(self):
+        result = self.write('bz2', workers=2, blocksize=8192, level=1)
+
+        self.assertEqual(bz2.decompress(result), DATA)
+
+    def test_xz(self):
+        result = self.write('xz', workers=2, blocksize=8192, level=0)
+
+        self.assertEqual(lzma.decompress(result), DATA)
+
+    def test_empty(self):
+        result = self.write('gz', data=b'', workers=2)
+
+        self.assertEqual(gzip.decompress(result), b'')
+
+    def test_unsupported(self):
+        self.assertRaises(ValueError, compress.ParallelWriter,
+                          io.BytesIO(), 'zip')
+
+    def test_close_twice(self):
+        out = io.BytesIO()
+        writer = compress.ParallelWriter(out, 'gz', workers=2)
+        writer.write(DATA)
+        writer.close()
+        size = len(out.getvalue())
+        writer.close()
+
+        self.assertEqual(len(out.getvalue()), size)
+
+
+class WriterTest(unittest.TestCase):
+    def test_parallel(self):
+        result = compress.writer(io.BytesIO(), 'gz', workers=2)
+
+        self.assertTrue(isinstance(result, compress.ParallelWriter))
+        result.close()
+
+    def test_serial(self):
+        for compression, cls, module in (('gz', gzip.GzipFile, gzip),
+                                         ('bz2', bz2.BZ2File, bz2),
+                                         ('xz', lzma.LZMAFile, lzma)):
+            out = io.BytesIO()
+            result = compress.writer(out, compression, level=1)
+            result.write(DATA)
+            result.close()
+
+            self.assertTrue(isinstance(result, cls))
+            self.assertFalse(out.closed)
+            self.assertEqual(module.decompress(out.getvalue()), DATA)
+
+    @unittest.skipIf(compress.zstd is None, 'zstd is not available')
+    def test_zstd(self):
+        out = io.BytesIO()
+        result = compress.writer(out, 'zst', level=3, workers=2)
+        result.write(DATA)
+        result.close()
+
+        self.assertFalse(out.closed)
+        self.assertEqual(compress.zstd.decompress(out.getvalue()), DATA)
+
+    @mock.patch.object(compress, 'zstd', None)
+    def test_zstd_unavailable(self):
+        self.assertRaises(ValueError, compress.writer, io.BytesIO(), 'zst')
+
+    def test_unsupported(self):
+        self.assertRaises(ValueError, compress.writer, io.BytesIO(), 'zip')
+
+    def test_unknown_message(self):
+        with self.assertRaises(ValueError) as cm:
+            compress.writer(io.BytesIO(), 'lz4')
+
+        self.assertEqual(str(cm.exception), "unsupported compression 'lz4'")
+
+    def test_no_levels_message(self):
+        with self.assertRaises(ValueError) as cm:
+            compress.writer(io.BytesIO(), 'Z', level=3)
+
+        self.assertEqual(str(cm.exception),
+                         "compression scheme 'Z' does not support levels")
+
+    def test_builtin(self):
+        self.assertTrue(compress.builtin('gz'))
+        self.assertFalse(compress.builtin('zst'))
+
+    def test_parallel_predicate(self):
+        self.assertTrue(compress.parallel('gz'))
+        self.assertTrue(compress.parallel('bz2'))
+        self.assertFalse(compress.parallel('zip'))
+
+
+class ReaderTest(unittest.TestCase):
+    def test_roundtrip(self):
+        for compression in ('gz', 'bz2', 'xz'):
+            out = io.BytesIO()
+            writer = compress.ParallelWriter(out, compression, workers=2,
+                                             blocksize=4096)
+            writer.write(DATA)
+            writer.close()
+            out.seek(0)
+
+            self.assertEqual(compress.reader(out, compression).read(), DATA)
+
+    @unittest.skipIf(compress.zstd is None, 'zstd is not available')
+    def test_zstd(self):
+        out = io.BytesIO(compress.zstd.compress(DATA))
+
+        self.assertEqual(compress.reader(out, 'zst').read(), DATA)
+
+    @mock.patch.object(compress, 'zstd', None)
+    def test_zstd_unavailable(self):
+        self.assertRaises(ValueError, compress.reader, io.BytesIO(), 'zst')
+
+    def test_unsupported(self):
+        self.assertRaises(ValueError, compress.reader, io.BytesIO(), 'zip')
+
+
+class DetectTest(unittest.TestCase):
+    def test_known(self):
+        self.assertEqual(compress.detect(gzip.compress(b'')), 'gz')
+        self.assertEqual(compress.detect(bz2.compress(b'')), 'bz2')
+        self.assertEqual(compress.detect(lzma.compress(b'')), 'xz')
+        self.assertEqual(compress.detect(b'\x28\xb5\x2f\xfd\x00'), 'zst')
+
+    def test_unknown(self):
+        self.assertEqual(compress.detect(b'ustar\x00'), None)
+        self.assertEqual(compress.detect(b''), None)
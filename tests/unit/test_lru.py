@@ -0,0 +1,102 @@
+# Copyright 2014 Kevin L. Mitchell
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import unittest
+
+from fstree import lru
+
+
+class LRUCacheTest(unittest.TestCase):
+    def test_get_miss(self):
+        cache = lru.LRUCache(2)
+
+        self.assertEqual(cache.get('a', 'default'), 'default')
+        self.assertEqual(cache.stats, {
+            'hits': 0,
+            'misses': 1,
+            'evictions': 0,
+            'entries': 0,
+            'bytes': 0,
+        })
+
+    def test_get_hit(self):
+        cache = lru.LRUCache(2)
+        cache.put('a', 'value')
+
+        self.assertEqual(cache.get('a'), 'value')
+        self.assertEqual(cache.hits, 1)
+        self.assertEqual(cache.misses, 0)
+
+    def test_max_entries(self):
+        cache = lru.LRUCache(2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.get('a')
+        cache.put('c', 3)
+
+        self.assertTrue('a' in cache)
+        self.assertFalse('b' in cache)
+        self.assertTrue('c' in cache)
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.evictions, 1)
+
+    def test_max_bytes(self):
+        cache = lru.LRUCache(max_bytes=10, sizer=len)
+        cache.put('a', 'xxxx')
+        cache.put('b', 'xxxx')
+
+        self.assertEqual(cache.bytes, 8)
+
+        cache.put('c', 'xxxx')
+
+        self.assertFalse('a' in cache)
+        self.assertEqual(cache.bytes, 8)
+        self.assertEqual(cache.evictions, 1)
+
+    def test_max_bytes_oversized(self):
+        cache = lru.LRUCache(max_bytes=10, sizer=len)
+        cache.put('a', 'xxxx')
+        cache.put('b', 'x' * 20)
+
+        self.assertEqual(len(cache), 1)
+        self.assertTrue('b' in cache)
+        self.assertEqual(cache.bytes, 20)
+
+    def test_resize_on_get(self):
+        value = ['x']
+        cache = lru.LRUCache(max_bytes=10, sizer=len)
+        cache.put('a', value)
+        value.extend('x' * 4)
+        cache.get('a')
+
+        self.assertEqual(cache.bytes, 5)
+
+    def test_pop(self):
+        cache = lru.LRUCache(max_bytes=10, sizer=len)
+        cache.put('a', 'xxxx')
+
+        self.assertEqual(cache.pop('a'), 'xxxx')
+        self.assertEqual(cache.pop('a', 'default'), 'default')
+        self.assertEqual(cache.bytes, 0)
+        self.assertEqual(cache.evictions, 0)
+
+    def test_clear(self):
+        cache = lru.LRUCache(max_bytes=10, sizer=len)
+        cache.put('a', 'xxxx')
+
+        cache.clear()
+
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.bytes, 0)
@@ -0,0 +1,165 @@
+# Copyright 2014 Kevin L. Mitchell
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import unittest
+
+import mock
+
+from fstree import statcache
+
+
+class FreshPolicyTest(unittest.TestCase):
+    def test_valid(self):
+        policy = statcache.FreshPolicy()
+
+        self.assertEqual(policy.stamp(), None)
+        self.assertFalse(policy.valid(None))
+
+
+class TTLPolicyTest(unittest.TestCase):
+    def test_stamp(self):
+        clock = mock.Mock(return_value=10.0)
+        policy = statcache.TTLPolicy(5, clock)
+
+        self.assertEqual(policy.stamp(), 10.0)
+
+    def test_valid(self):
+        clock = mock.Mock(return_value=14.0)
+        policy = statcache.TTLPolicy(5, clock)
+
+        self.assertTrue(policy.valid(10.0))
+
+    def test_expired(self):
+        clock = mock.Mock(return_value=15.0)
+        policy = statcache.TTLPolicy(5, clock)
+
+        self.assertFalse(policy.valid(10.0))
+
+
+class GenerationPolicyTest(unittest.TestCase):
+    def test_valid(self):
+        policy = statcache.GenerationPolicy()
+
+        self.assertEqual(policy.stamp(), None)
+        self.assertTrue(policy.valid(None))
+
+
+class StatCacheTest(unittest.TestCase):
+    @mock.patch('os.stat', side_effect=lambda p: 'stat:%s' % p)
+    @mock.patch('os.lstat', side_effect=lambda p: 'lstat:%s' % p)
+    def test_fresh(self, mock_lstat, mock_stat):
+        cache = statcache.StatCache(statcache.FreshPolicy())
+
+        self.assertEqual(cache.stat('/a'), 'stat:/a')
+        self.assertEqual(cache.stat('/a'), 'stat:/a')
+        self.assertEqual(cache.lstat('/a'), 'lstat:/a')
+        self.assertEqual(mock_stat.call_count, 2)
+        self.assertEqual(mock_lstat.call_count, 1)
+        self.assertEqual(len(cache._cache), 0)
+
+        cache.seed('/a', lstat='seeded')
+
+        self.assertEqual(len(cache._cache), 0)
+
+    @mock.patch('os.stat', side_effect=lambda p: 'stat:%s' % p)
+    def test_bounded(self, mock_stat):
+        cache = statcache.StatCache(statcache.GenerationPolicy(), 2)
+
+        cache.stat('/a')
+        cache.stat('/b')
+        cache.stat('/c')
+        cache.stat('/c')
+        cache.stat('/a')
+
+        self.assertEqual(len(cache._cache), 2)
+        self.assertEqual(mock_stat.call_count, 4)
+
+    @mock.patch('os.stat', side_effect=lambda p: 'stat:%s' % p)
+    @mock.patch('os.lstat', side_effect=lambda p: 'lstat:%s' % p)
+    def test_generation(self, mock_lstat, mock_stat):
+        cache = statcache.StatCache(statcache.GenerationPolicy())
+
+        self.assertEqual(cache.stat('/a'), 'stat:/a')
+        self.assertEqual(cache.stat('/a'), 'stat:/a')
+        self.assertEqual(cache.lstat('/a'), 'lstat:/a')
+        self.assertEqual(cache.lstat('/a'), 'lstat:/a')
+        self.assertEqual(mock_stat.call_count, 1)
+        self.assertEqual(mock_lstat.call_count, 1)
+
+        cache.invalidate()
+
+        self.assertEqual(cache.generation, 1)
+        self.assertEqual(cache.stat('/a'), 'stat:/a')
+        self.assertEqual(mock_stat.call_count, 2)
+
+    @mock.patch('os.stat', side_effect=lambda p: 'stat:%s' % p)
+    def test_ttl(self, mock_stat):
+        clock = mock.Mock(return_value=10.0)
+        cache = statcache.StatCache(statcache.TTLPolicy(5, clock))
+
+        cache.stat('/a')
+        clock.return_value = 14.0
+        cache.stat('/a')
+
+        self.assertEqual(mock_stat.call_count, 1)
+
+        clock.return_value = 15.0
+        cache.stat('/a')
+
+        self.assertEqual(mock_stat.call_count, 2)
+
+    @mock.patch('os.stat', side_effect=lambda p: 'stat:%s' % p)
+    def test_invalidate_path(self, mock_stat):
+        cache = statcache.StatCache(statcache.GenerationPolicy())
+        cache.stat('/a')
+        cache.stat('/b')
+
+        cache.invalidate('/a')
+        cache.stat('/a')
+        cache.stat('/b')
+
+        self.assertEqual(cache.generation, 0)
+        mock_stat.assert_has_calls([
+            mock.call('/a'),
+            mock.call('/b'),
+            mock.call('/a'),
+        ])
+        self.assertEqual(mock_stat.call_count, 3)
+
+    @mock.patch('os.stat', side_effect=lambda p: 'stat:%s' % p)
+    @mock.patch('os.lstat', side_effect=lambda p: 'lstat:%s' % p)
+    def test_seed(self, mock_lstat, mock_stat):
+        cache = statcache.StatCache(statcache.GenerationPolicy())
+
+        cache.seed('/a', lstat='seeded')
+
+        self.assertEqual(cache.lstat('/a'), 'seeded')
+        self.assertEqual(cache.stat('/a'), 'stat:/a')
+        self.assertFalse(mock_lstat.called)
+
+    @mock.patch('os.stat')
+    def test_concurrent_bump(self, mock_stat):
+        cache = statcache.StatCache(statcache.GenerationPolicy())
+
+        def fake_stat(path):
+            cache.invalidate()
+            return 'stale'
+        mock_stat.side_effect = fake_stat
+
+        cache.stat('/a')
+        mock_stat.side_effect = None
+        mock_stat.return_value = 'fresh'
+
+        self.assertEqual(cache.stat('/a'), 'fresh')
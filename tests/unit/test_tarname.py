@@ -17,6 +17,7 @@ import unittest
 
 import mock
 
+from fstree import compress
 from fstree import tarname
 from fstree import utils
 
@@ -95,6 +96,14 @@ class CompressionTest(unittest.TestCase):
 
         self.assertEqual(str(comp), 'test')
 
+    def test_zstd(self):
+        comp = tarname.Compression.lookup_compression('zst')
+
+        self.assertEqual(comp.supported, compress.zstd is not None)
+        self.assertEqual(comp.extension, '.zst')
+        self.assertEqual(tarname.Compression.lookup_extension('.tzst'),
+                         {'compression': comp, 'has_tar_ext': True})
+
 
 class TarFileNameTest(unittest.TestCase):
     @mock.patch.object(tarname.Compression, 'lookup_extension',
@@ -0,0 +1,111 @@
+# Copyright 2014 Kevin L. Mitchell
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import stat
+import unittest
+
+from fstree import tarshard
+
+
+def member(name, size=0, mode=stat.S_IFREG, ino=None, nlink=1):
+    st = os.stat_result((mode | 0o644, ino or hash(name), 1, nlink, 0, 0,
+                         size, 0, 0, 0))
+    return ('/src/' + name, name, st)
+
+
+class WeightTest(unittest.TestCase):
+    def test_weight(self):
+        self.assertEqual(tarshard.weight(member('f', 0)[2]), 512)
+        self.assertEqual(tarshard.weight(member('f', 1)[2]), 1024)
+        self.assertEqual(tarshard.weight(member('f', 512)[2]), 1024)
+        self.assertEqual(tarshard.weight(
+            member('d', 4096, stat.S_IFDIR)[2]), 512)
+
+
+class PartitionTest(unittest.TestCase):
+    def sizes(self, groups):
+        return [sum(tarshard.weight(m[2]) for m in files)
+                for dirs, files in groups]
+
+    def test_shards(self):
+        files = [member('f%d' % i, 512 * i) for i in range(1, 9)]
+
+        result = tarshard.partition([], files, shards=3)
+
+        self.assertEqual(len(result), 3)
+        self.assertEqual(sorted(m[1] for dirs, files in result
+                                for m in files),
+                         sorted(m[1] for m in files))
+        self.assertEqual(self.sizes(result), [8192, 7680, 6656])
+
+    def test_few_files(self):
+        result = tarshard.partition([], [member('f1')], shards=4)
+
+        self.assertEqual(result, [([], [member('f1')])])
+
+    def test_no_files(self):
+        dirs = [member('d', mode=stat.S_IFDIR)]
+
+        result = tarshard.partition(dirs, [], shards=4)
+
+        self.assertEqual(result, [(dirs, [])])
+
+    def test_max_size(self):
+        files = [member('f%d' % i, 1536) for i in range(10)]
+
+        result = tarshard.partition([], files, max_size=4096)
+
+        self.assertEqual(self.sizes(result), [4096] * 5)
+
+    def test_max_size_large_file(self):
+        files = [member('big', 10000), member('f1', 512),
+                 member('f2', 512)]
+
+        result = tarshard.partition([], files, max_size=2048)
+
+        self.assertEqual([[m[1] for m in files] for dirs, files in result],
+                         [['big'], ['f1', 'f2']])
+
+    def test_hard_links(self):
+        files = [member('a', 4096, ino=1, nlink=2), member('b', 4096),
+                 member('c', 4096, ino=1, nlink=2)]
+
+        result = tarshard.partition([], files, shards=2)
+
+        self.assertEqual(sorted([m[1] for m in files]
+                                for dirs, files in result),
+                         [['a', 'c'], ['b']])
+
+    def test_directories(self):
+        dirs = [member('a', mode=stat.S_IFDIR),
+                member('a/b', mode=stat.S_IFDIR),
+                member('c', mode=stat.S_IFDIR),
+                member('e', mode=stat.S_IFDIR)]
+        files = [member('a/b/f1', 4096), member('c/f2', 4096)]
+
+        result = tarshard.partition(dirs, files, shards=2)
+
+        self.assertEqual([([m[1] for m in dirs], [m[1] for m in files])
+                          for dirs, files in result], [
+            (['a', 'a/b', 'e'], ['a/b/f1']),
+            (['c'], ['c/f2']),
+        ])
+
+    def test_bad_arguments(self):
+        self.assertRaises(ValueError, tarshard.partition, [], [])
+        self.assertRaises(ValueError, tarshard.partition, [], [], 2, 1024)
+        self.assertRaises(ValueError, tarshard.partition, [], [], 0)
+        self.assertRaises(ValueError, tarshard.partition, [], [], None, 0)
@@ -257,6 +257,21 @@ class DigestTest(unittest.TestCase):
                 self.assertFalse(digester.hexdigest.called)
 
 
+class BlocksizeTest(unittest.TestCase):
+    def test_small(self):
+        self.assertEqual(utils.blocksize(0), utils.BLOCKSIZE)
+        self.assertEqual(utils.blocksize(100), utils.BLOCKSIZE)
+
+    def test_medium(self):
+        self.assertEqual(utils.blocksize(utils.BLOCKSIZE + 1),
+                         utils.BLOCKSIZE * 2)
+        self.assertEqual(utils.blocksize(300 * 1024), 512 * 1024)
+
+    def test_large(self):
+        self.assertEqual(utils.blocksize(1024 * 1024 * 1024),
+                         utils.MAX_BLOCKSIZE)
+
+
 class ApplyIgnoreTest(unittest.TestCase):
     def test_no_ignore(self):
         dirs = ['a', 'b', 'c']
@@ -278,3 +293,56 @@ class ApplyIgnoreTest(unittest.TestCase):
                                        ['a', 'b', 'c', 'z', 'y', 'x'])
         self.assertEqual(dirs, ['a', 'c'])
         self.assertEqual(files, ['z', 'x'])
+
+
+class TeeWriterTest(unittest.TestCase):
+    def test_digest(self):
+        out = io.BytesIO()
+        writer = utils.TeeWriter(out, [hashlib.md5()])
+
+        writer.write(b'data')
+
+        self.assertEqual(out.getvalue(), b'data')
+        self.assertEqual(writer.tell(), 4)
+        self.assertEqual(writer.hexdigest(), hashlib.md5(b'data').hexdigest())
+
+    def test_short_writes(self):
+        fileobj = mock.Mock(spec=['write'])
+        fileobj.write.side_effect = [1, 3]
+
+        utils.TeeWriter(fileobj).write(b'data')
+
+        self.assertEqual([bytes(c[0][0]) for c in
+                          fileobj.write.call_args_list], [b'data', b'ata'])
+
+    @mock.patch.object(utils.select, 'select')
+    def test_nonblocking(self, mock_select):
+        fileobj = mock.Mock(spec=['write', 'fileno'])
+        fileobj.write.side_effect = [2, None, 2]
+        fileobj.fileno.return_value = 7
+
+        utils.TeeWriter(fileobj).write(b'data')
+
+        mock_select.assert_called_once_with([], [7], [])
+        self.assertEqual([bytes(c[0][0]) for c in
+                          fileobj.write.call_args_list],
+                         [b'data', b'ta', b'ta'])
+
+    def test_nonblocking_no_fileno(self):
+        fileobj = mock.Mock(spec=['write'])
+        fileobj.write.side_effect = [2, None]
+
+        try:
+            utils.TeeWriter(fileobj).write(b'data')
+        except BlockingIOError as err:
+            self.assertEqual(err.characters_written, 2)
+        else:
+            self.fail("BlockingIOError not raised")
+
+    def test_sendall(self):
+        sock = mock.Mock(spec=['sendall'])
+        sock.sendall.return_value = None
+
+        utils.TeeWriter(sock).write(b'data')
+
+        sock.sendall.assert_called_once_with(mock.ANY)